@@ -7,10 +7,15 @@ Typical usage:
 '''
 import datetime
 from abc import ABCMeta, abstractmethod, abstractproperty
+from concurrent.futures import ThreadPoolExecutor
 import json
 import logging
 import pytz
-from urllib.request import urlopen, quote
+import shutil
+import threading
+from urllib.request import quote
+from .result_cache import create_result_cache
+from .transport import create_transport
 
 logger = logging.getLogger('bact-archiver')
 
@@ -58,7 +63,8 @@ class ArchiverInterface(metaclass=ABCMeta):
             t0 :                         start time a :class:`datetime.datetime` object
             t1 :                         end time a :class:`datetime.datetime` object
 
-            return_type (str, optional) : requested data type (pandas|raw).
+            return_type (str, optional) : requested data type
+                                          (pandas|raw|arrow|polars).
                                           Defaults to pandas
             time_format (str, optional) : requested time format (raw, timestamp, datetime).
                                           Defaults to timestamp
@@ -68,6 +74,9 @@ class ArchiverInterface(metaclass=ABCMeta):
             timezone (:class:`datetime.tzinfo`, optional): for pandas dataframes, use given
                                           tzinfo to translate the dataframe to. If none is given,
                                           translate it to the local timezone
+            downsample (tuple, optional): (method, points) reduce the
+                                          samples for plotting, method
+                                          'lttb' or 'minmax'; see :func:`get_data`
 
         Returns:
             tuple of numpy arrays or pandas.DataFrame see :func:`get_data`
@@ -79,6 +88,11 @@ class ArchiverInterface(metaclass=ABCMeta):
             'raw'
                 tuple (header, values, secs, nanos)
 
+            'arrow', 'polars'
+                a :class:`pyarrow.Table` or :class:`polars.DataFrame`
+                (requires pyarrow, and polars), see
+                :mod:`bact_archiver.columnar`
+
         The following time formats are supported:
             'raw'
                seconds (since beginning of year), nanoseconds
@@ -112,9 +126,66 @@ class ArchiverBasis(ArchiverInterface):
         Work in progress
 
     Used for the python or the carchiver
+
+    Args:
+        config:    archiver configuration
+        transport: transport used for all requests to the appliance.
+                   If None a transport is created as described by the
+                   configuration, see :func:`bact_archiver.transport.create_transport`
+        result_cache: cache of decoded results, see
+                   :class:`bact_archiver.result_cache.ResultCache`. If None
+                   it is created as described by the configuration. Can be
+                   shared between archivers.
     '''
-    def __init__(self, *, config):
+    def __init__(self, *, config, transport=None, result_cache=None):
         self.config = config
+        if transport is None:
+            transport = create_transport(config)
+        self.transport = transport
+        if result_cache is None:
+            result_cache = create_result_cache(config)
+        self.result_cache = result_cache
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        # marks the worker threads of the executor
+        self._local = threading.local()
+
+    @property
+    def max_workers(self):
+        '''Number of requests run in parallel (e.g. by :meth:`getDataMany`)
+        '''
+        return getattr(self.config, 'max_workers', 4)
+
+    @property
+    def executor(self):
+        '''Thread pool shared by all parallel requests of this archiver
+
+        Its size limits the number of parallel requests sent to the
+        appliance. Created on first use.
+        '''
+        with self._executor_lock:
+            if self._executor is None:
+                name = 'bact-archiver-{}'.format(self.name)
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix=name,
+                    initializer=self._init_worker)
+            return self._executor
+
+    def _init_worker(self):
+        self._local.worker = True
+
+    def _map(self, func, items):
+        '''func(item) for each of items, run in parallel on :attr:`executor`
+
+        Called from a worker of the executor itself (e.g. within
+        :meth:`getDataMany`) the items are processed one after another:
+        waiting there for further workers could dead lock the pool.
+        '''
+        items = list(items)
+        if len(items) <= 1 or getattr(self._local, 'worker', False):
+            return [func(item) for item in items]
+        futures = [self.executor.submit(func, item) for item in items]
+        return [future.result() for future in futures]
 
     @property
     def name(self):
@@ -140,21 +211,56 @@ class ArchiverBasis(ArchiverInterface):
         url += '/bpl/{cmd}{opt}'
         return url
 
-    def getData(self, pvname: str, *, t0: datetime.datetime, t1: datetime.datetime, **kws):
+    def _cache_lookup(self, key):
+        '''Value for key (pv, operator, t0, t1, kind) in the result cache or None
+        '''
+        if self.result_cache is None:
+            return None
+        key = (self.name,) + tuple(key)
+        value = self.result_cache.get(key)
+        if value is not None:
+            logger.debug('Result cache hit for %s', key)
+        return value
+
+    def _cache_store(self, key, t1, value):
+        '''Store value for key in the result cache unless t1 is live
+        '''
+        cache = self.result_cache
+        if cache is None or value is None or cache.is_live(t1):
+            return
+        cache.put((self.name,) + tuple(key), value)
 
-        t0 = t0.astimezone(_utc)
-        t1 = t1.astimezone(_utc)
-        t0_str = convert_datetime_to_timestamp(t0)
-        t1_str = convert_datetime_to_timestamp(t1)
-        fmt = 'Trying to get data for pv %s in interval %s..%s = %s..%s',
-        logger.info(fmt, pvname, t0, t1, t0_str, t1_str)
+    def _cached(self, key, t1, compute, use_cache=True):
+        '''Value for key from the result cache or computed by compute()
 
-        return self._getData(pvname, t0=t0_str, t1=t1_str, **kws)
+        Args:
+            key:     tuple (pv, operator, t0, t1, kind); the archiver name
+                     is prepended. kind distinguishes decoded data
+                     from raw bytes.
+            t1:      end of the window: live windows are not cached
+            compute: callable returning the value
+        '''
+        if not use_cache:
+            return compute()
+        value = self._cache_lookup(key)
+        if value is None:
+            value = compute()
+            self._cache_store(key, t1, value)
+        return value
 
-    def askAppliance(self, cmd, **kwargs):
+    def _data_url(self, var, *, t0, t1):
+        '''url requesting raw data for the (quoted) variable expression var
+
+        Args:
+            var:    quoted pv name or operator expression
+            t0, t1: start and end time as strings as expected by the archiver
         '''
+        fmt = self.data_url_fmt
+        return fmt.format(format='raw', var=var, t0=quote(t0), t1=quote(t1))
+
+    def _bpl_url(self, cmd, **kwargs):
+        '''url for the business logic command cmd
         '''
-        # cmds :
         opts = ''
         opt = '?{}={}'
         # Disable server-side limit of 500 entries
@@ -164,17 +270,80 @@ class ArchiverBasis(ArchiverInterface):
             opt = '&{}={}'
 
         fmt = self.bpl_url_fmt
-        url = fmt.format(cmd=cmd, opt=opts)
+        return fmt.format(cmd=cmd, opt=opts)
+
+    def _convert_window(self, pvname, t0, t1):
+        '''Convert the time window to strings as expected by the archiver
+        '''
+        t0 = t0.astimezone(_utc)
+        t1 = t1.astimezone(_utc)
+        t0_str = convert_datetime_to_timestamp(t0)
+        t1_str = convert_datetime_to_timestamp(t1)
+        fmt = 'Trying to get data for pv %s in interval %s..%s = %s..%s'
+        logger.info(fmt, pvname, t0, t1, t0_str, t1_str)
+        return t0_str, t1_str
+
+    def getData(self, pvname: str, *, t0: datetime.datetime, t1: datetime.datetime, **kws):
+        t0_str, t1_str = self._convert_window(pvname, t0, t1)
+        return self._getData(pvname, t0=t0_str, t1=t1_str, **kws)
+
+    def getDataMany(self, pvnames, *, t0: datetime.datetime,
+                    t1: datetime.datetime, **kws):
+        """Get archiver data for many EPICS variables in the same time frame
+
+        Args:
+            pvnames: sequence of variables to obtain
+            t0:      start time a :class:`datetime.datetime` object
+            t1:      end time a :class:`datetime.datetime` object
+            kws:     passed on to :meth:`getData`
+
+        Returns:
+            dict, dict: data by pvname, exception by pvname
+
+        The requests are run in parallel on :attr:`executor`; at most
+        :attr:`max_workers` of them at the same time. Downloading and
+        decoding is done in the worker threads. A failing pv does not
+        abort the batch; its exception is reported in the second
+        dictionary instead.
+
+        Example::
+
+            data, errors = archiver.getDataMany(['TOPUPCC:rdCur', 'MDIZ2T5G:lt10'],
+                                                t0=t0, t1=t1)
+            for pvname, exc in errors.items():
+                print('failed to retrieve', pvname, exc)
+        """
+        futures = {
+            pvname: self.executor.submit(self.getData, pvname, t0=t0, t1=t1,
+                                         **kws)
+            for pvname in pvnames
+        }
+
+        data = {}
+        errors = {}
+        for pvname, future in futures.items():
+            try:
+                data[pvname] = future.result()
+            except Exception as exc:
+                logger.error('Failed to get data for pv %s: reason %s',
+                             pvname, exc)
+                errors[pvname] = exc
+        return data, errors
+
+    def askAppliance(self, cmd, **kwargs):
+        '''
+        '''
+        url = self._bpl_url(cmd, **kwargs)
         fmt = 'Asking archiver %s  using url %s'
 
         logger.info(fmt, self.name, url)
         try:
-            request = urlopen(url)
+            text = self.transport.get(url)
         except Exception as ex:
             logger.error(fmt + ' Reason %s', self.name, url, ex)
             raise ex
 
-        data = json.loads(request.read().decode('UTF-8'))
+        data = json.loads(text.decode('UTF-8'))
         return data
 
     def getAllPVs(self):
@@ -193,13 +362,18 @@ class ArchiverBasis(ArchiverInterface):
         return txt
 
     def saveBPRaw(self, pvname, *,  t0, t1, fname='test.pb'):
-        fmt = self.data_url_fmt
-        url = fmt.format(format='raw', var=quote(pvname),
-                         t0=quote(t0), t1=quote(t1))
-        f = urlopen(url)
+        url = self._data_url(quote(pvname), t0=t0, t1=t1)
+        with self.transport.open(url) as f, open(fname, 'wb') as fout:
+            shutil.copyfileobj(f, fout)
 
-        with open(fname, 'wb') as fout:
-            fout.write(f.read())
+    def close(self):
+        '''Stop the worker threads and close the connections of the transport
+        '''
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        self.transport.close()
 
 
 def save_hdf5(data, *, fname=None):
@@ -0,0 +1,212 @@
+"""Archiver access for asyncio applications
+
+The requests are sent using non blocking HTTP
+(:class:`bact_archiver.transport.AsyncHTTPTransport`). Large responses are
+decoded on the thread pool of the archiver, so the event loop is not blocked
+and many requests can be in flight at the same time.
+
+Example::
+
+    archiver = AsyncArchiver(config=config)
+    df = await archiver.getData('TOPUPCC:rdCur', t0=t0, t1=t1)
+    await archiver.close()
+"""
+import asyncio
+import datetime
+import functools
+import json
+import logging
+import math
+from urllib.request import quote
+
+from .archiver import ArchiverBasis, convert_datetime_to_timestamp
+from .carchiver import (_format_data, auto_bin_points, dquote, get_data,
+                        get_data_from_archiver, operator_name)
+from .transport import AsyncHTTPTransport
+
+logger = logging.getLogger('bact-archiver')
+
+#: options of :meth:`bact_archiver.carchiver.Archiver.getData` the
+#: asynchronous archiver does not support
+_unsupported = ('max_bytes', 'retries')
+
+
+class AsyncArchiver(ArchiverBasis):
+    '''Coroutine versions of the methods of :class:`bact_archiver.carchiver.Archiver`
+
+    Args:
+        config:    archiver configuration
+        transport: an :class:`bact_archiver.transport.AsyncHTTPTransport`;
+                   if None it is created using `pool_size` and `timeout`
+                   of the configuration.
+        result_cache: see :class:`bact_archiver.archiver.ArchiverBasis`
+        decode_threshold: responses larger than this number of bytes
+                   are decoded on :attr:`executor`. Smaller ones are
+                   decoded directly in the event loop.
+    '''
+    def __init__(self, *, config, transport=None, result_cache=None,
+                 decode_threshold=64 * 1024):
+        if transport is None:
+            transport = AsyncHTTPTransport(
+                pool_size=getattr(config, 'pool_size', 4),
+                timeout=getattr(config, 'timeout', None))
+        super().__init__(config=config, transport=transport,
+                         result_cache=result_cache)
+        self.decode_threshold = decode_threshold
+
+    async def _decode(self, data, *, threads=None, with_info=False):
+        if threads is None:
+            threads = getattr(self.config, 'decode_threads', None)
+        decode = functools.partial(get_data_from_archiver, threads=threads,
+                                   with_info=with_info)
+        if len(data) <= self.decode_threshold:
+            return decode(data)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, decode, data)
+
+    async def _autoBinSeconds(self, pvname, *, t0, t1, points):
+        '''Bin size in seconds giving about points bins in t0..t1
+
+        see :meth:`bact_archiver.carchiver.Archiver._autoBinSeconds`
+        '''
+        try:
+            data = await self.requestData(pvname, t0=t0, t1=t1,
+                                          dtype='ncount')
+            header, values, secs, nanos = get_data(data, return_type='raw')
+            ncount = values[0]
+        except Exception as ex:
+            logger.info('Could not count the samples of %s: %s', pvname, ex)
+        else:
+            if ncount <= points:
+                return None
+        seconds = (t1 - t0).total_seconds()
+        return max(1, int(math.ceil(seconds / points)))
+
+    async def getData(self, pvname: str, *, t0: datetime.datetime,
+                      t1: datetime.datetime, use_cache=True,
+                      decode_threads=None, with_info=False, operator=None,
+                      bin_seconds=None, target_points=None, **kws):
+        '''Get archiver data for single EPICS variable in given time frame.
+
+        see :meth:`bact_archiver.carchiver.Archiver.getData`. use_cache
+        refers to the result cache only: the asynchronous archiver has no
+        partition cache. max_bytes and retries are not supported: the
+        window is always requested in one piece.
+        '''
+        for name in _unsupported:
+            if name in kws:
+                raise TypeError('{} is not supported by {}'.format(
+                    name, self.__class__.__name__))
+        if operator is None and bin_seconds is not None:
+            raise ValueError('bin_seconds requires an operator')
+        t0_str, t1_str = self._convert_window(pvname, t0, t1)
+        if bin_seconds == 'auto':
+            if target_points is None:
+                target_points = auto_bin_points
+            bin_seconds = await self._autoBinSeconds(
+                pvname, t0=t0, t1=t1, points=target_points)
+            if bin_seconds is None:
+                operator = None
+        op = 'raw' if operator is None else operator_name(operator, bin_seconds)
+        kind = 'decoded+info' if with_info else 'decoded'
+        key = pvname, op, t0_str, t1_str, kind
+        decoded = self._cache_lookup(key) if use_cache else None
+        if decoded is None:
+            var = pvname if operator is None else '{}({})'.format(op, pvname)
+            url = self._data_url(quote(var), t0=t0_str, t1=t1_str)
+            logger.debug('Using url %s', url)
+            try:
+                data = await self.transport.get(url)
+            except Exception as ex:
+                logger.error('Failed to open url {}: reason {}'.format(url, ex))
+                raise ex
+            decoded = await self._decode(data, threads=decode_threads,
+                                         with_info=with_info)
+            if use_cache:
+                self._cache_store(key, t1, decoded)
+
+        return _format_data(*decoded, t_start=t0_str, t_stop=t1_str, **kws)
+
+    async def getDataMany(self, pvnames, *, t0: datetime.datetime,
+                          t1: datetime.datetime, **kws):
+        '''Get archiver data for many EPICS variables concurrently
+
+        see :meth:`bact_archiver.archiver.ArchiverBasis.getDataMany`
+        '''
+        pvnames = list(pvnames)
+        results = await asyncio.gather(
+            *[self.getData(pvname, t0=t0, t1=t1, **kws) for pvname in pvnames],
+            return_exceptions=True
+        )
+        data = {}
+        errors = {}
+        for pvname, result in zip(pvnames, results):
+            if isinstance(result, Exception):
+                logger.error('Failed to get data for pv %s: reason %s',
+                             pvname, result)
+                errors[pvname] = result
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                data[pvname] = result
+        return data, errors
+
+    async def requestData(self, pvname, *, t0, t1, dtype='raw',
+                          bin_seconds=None):
+        '''Raw PB/HTTP data as returned by the appliance
+
+        see :meth:`bact_archiver.carchiver.Archiver.requestData`
+        '''
+        t0_str = convert_datetime_to_timestamp(t0)
+        t1_str = convert_datetime_to_timestamp(t1)
+        request = self._data_url(dquote(pvname, dtype, bin_seconds),
+                                 t0=t0_str, t1=t1_str)
+        logger.info("request_data({}...)".format(request))
+        try:
+            return await self.transport.get(request)
+        except Exception as e:
+            logger.error('Failed to handle request {} reason {}'.format(request, e))
+            raise e
+
+    async def askAppliance(self, cmd, **kwargs):
+        url = self._bpl_url(cmd, **kwargs)
+        fmt = 'Asking archiver %s  using url %s'
+
+        logger.info(fmt, self.name, url)
+        try:
+            text = await self.transport.get(url)
+        except Exception as ex:
+            logger.error(fmt + ' Reason %s', self.name, url, ex)
+            raise ex
+
+        return json.loads(text.decode('UTF-8'))
+
+    async def getAllPVs(self):
+        return await self.getMatchingPVs()
+
+    async def getMatchingPVs(self, pv="*"):
+        return await self.askAppliance('getMatchingPVs', pv=pv)
+
+    async def getTypeInfo(self, pv):
+        return await self.askAppliance('getMetadata', pv=pv)
+
+    async def saveBPRaw(self, pvname, *, t0, t1, fname='test.pb'):
+        url = self._data_url(quote(pvname), t0=t0, t1=t1)
+        data = await self.transport.get(url)
+        with open(fname, 'wb') as fout:
+            fout.write(data)
+
+    async def close(self):
+        '''Stop the worker threads and close the connections of the transport
+        '''
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+        await self.transport.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
@@ -4,28 +4,40 @@
 """Work horse access to EPICS archiver appliance
 """
 
-from .epics_event import read_chunk, decode
-from . import epics_event_pb2 as proto
-from .protocol_buffer import (Chunk, dtypes as _dtypes, decoder as _decoder,
+from .epics_event import (read_chunk, read_header, StreamDecoder,
+                          line_ends, fill_rows, numeric_dtype, SampleInfo,
+                          FieldValues, empty_sample_info, window_lines,
+                          sample_time, minmax_indices, lttb_indices,
+                          asof_join)
+from .protocol_buffer import (Chunk, dtypes as _dtypes,
                               dbrtypes as _dbrtypes, dsize as _dsize)
 from .archiver import ArchiverBasis, convert_datetime_to_timestamp
+from .columnar import to_arrow, to_polars
+from .follow import Follower
+from .partition_cache import create_partition_cache
+from .stats import StatsAccumulator, _interval_ns
 
-from urllib.request import urlopen, quote, HTTPError
-from functools import lru_cache
+from urllib.request import quote, HTTPError
 
 import numpy as np
 import pandas as pd
 
+import collections
+import concurrent.futures
 import datetime
-import dateutil.parser
+import math
+import os
+import threading
 import dateutil.tz
 import enum
 import types
 import logging
-from .utils import convert_data_time
+from .utils import convert_epoch_ns, pad_samples, to_epoch_ns
 
 logger = logging.getLogger('bact-archiver')
 
+_utc = dateutil.tz.tzutc()
+
 
 class ApplianceOperators(enum.Enum):
     '''
@@ -54,21 +66,31 @@ class ApplianceOperators(enum.Enum):
     skewness=       'skewness'
 
 
-def dquote(pvname, dtype):
-    if dtype == 'raw':
-        return quote(pvname)
-    else:
-        # Is that name listed
-        ApplianceOperators(dtype)
-        return quote('{}({})'.format(dtype, pvname))
+def operator_name(operator, bin_seconds=None):
+    '''Name of an appliance post processor, e.g. `mean_60`
 
-    raise AssertionError('dtype {} unknown'.format(dtype))
+    Args:
+        operator:    an :class:`ApplianceOperators` or its value
+        bin_seconds: size of the bins in seconds. If None the appliance
+                     uses its default bin size.
+    '''
+    # Is that name listed
+    name = ApplianceOperators(operator).value
+    if bin_seconds is None:
+        return name
+    bin_seconds = int(bin_seconds)
+    if bin_seconds < 1:
+        raise ValueError('bin_seconds must be at least 1, got {}'.format(
+            bin_seconds))
+    return '{}_{}'.format(name, bin_seconds)
 
 
-def read_header(line):
-    header = proto.PayloadInfo()
-    header.ParseFromString(decode(line))
-    return header
+def dquote(pvname, dtype, bin_seconds=None):
+    if dtype == 'raw':
+        if bin_seconds is not None:
+            raise ValueError('bin_seconds requires an operator')
+        return quote(pvname)
+    return quote('{}({})'.format(operator_name(dtype, bin_seconds), pvname))
 
 
 def read_sequence(seq):
@@ -78,56 +100,601 @@ def read_sequence(seq):
     # if existing read remaining data (here the main work is done)
     for line in lines:
         chunk.value = read_chunk(bytearray(line), chunk.header)
-        #print('len = ',len(chunk.value))
     return chunk
 
 
-@lru_cache(maxsize=64)
-def get_data_from_archiver(data):
+#: size of the blocks read from a response by :func:`get_data_from_stream`
+stream_block_size = 1 << 20
+
+#: default number of threads used by :func:`get_data_from_archiver`
+decode_threads = min(os.cpu_count() or 1, 8)
+
+#: workers of the thread pool shared by the decode calls. Calls asking
+#: for more threads share these workers.
+decode_pool_size = max(os.cpu_count() or 1, 8)
+
+#: responses smaller than this number of bytes are decoded by the calling
+#: thread
+parallel_decode_min_bytes = 1 << 20
+
+#: chunks are split in ranges of at least this number of samples for
+#: decoding them on several threads
+parallel_decode_min_samples = 1024
+
+#: pieces of samples merged at once by :meth:`Archiver.getStats`
+stats_block_samples = 1 << 16
+
+#: number of points aimed at by `bin_seconds='auto'` of
+#: :meth:`Archiver.getData`
+auto_bin_points = 1000
+
+_decode_executor = None
+_decode_executor_lock = threading.Lock()
+
+
+def _get_decode_executor():
+    '''Thread pool shared by all decode calls
+
+    Separate from the executor of the archivers: its workers wait for
+    the decode jobs. It is created once with :data:`decode_pool_size`
+    workers and never replaced, as other threads may be submitting to
+    it. Each call limits its own concurrency by the number of jobs it
+    submits (see :func:`_fill`).
+    '''
+    global _decode_executor
+    with _decode_executor_lock:
+        if _decode_executor is None:
+            _decode_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=decode_pool_size,
+                thread_name_prefix='bact-archiver-decode')
+        return _decode_executor
+
+
+def _join(arrays):
+    '''Concatenate arrays along the first axis
+
+    No copy is made if the arrays are adjacent parts of one array, as
+    returned by :func:`_decode_chunks`.
+    '''
+    if len(arrays) == 1:
+        return arrays[0]
+    first = arrays[0]
+    base = first.base
+    if (isinstance(base, np.ndarray) and base.flags.c_contiguous
+            and base.dtype == first.dtype and base.ndim == first.ndim
+            and all(a.base is base and a.flags.c_contiguous for a in arrays)):
+        row = base[:1].nbytes
+        start = base.__array_interface__['data'][0]
+        expected = first.__array_interface__['data'][0]
+        for a in arrays:
+            if a.__array_interface__['data'][0] != expected:
+                break
+            expected += a.nbytes
+        else:
+            if row:
+                i0 = (first.__array_interface__['data'][0] - start) // row
+                return base[i0:i0 + sum(len(a) for a in arrays)]
+    return np.concatenate(arrays)
+
+
+def _join_fields(fields, offsets):
+    '''Concatenate :class:`FieldValues`, shifting their indices by offsets
+    '''
+    if len(fields) == 1 and offsets[0] == 0:
+        return fields[0]
+    return FieldValues(
+        np.concatenate([f.index + offset for f, offset in zip(fields, offsets)]),
+        np.concatenate([f.name for f in fields]),
+        np.concatenate([f.value for f in fields]))
+
+
+def _join_info(infos):
+    '''Concatenate the :class:`SampleInfo` of consecutive parts
+
+    The indices of the field values are shifted to count from the start
+    of the first part.
     '''
+    if len(infos) == 1:
+        return infos[0]
+    offsets = np.cumsum([0] + [len(info.severity) for info in infos[:-1]])
+    return SampleInfo(_join([info.severity for info in infos]),
+                      _join([info.status for info in infos]),
+                      _join([info.repeatcount for info in infos]),
+                      _join_fields([info.fields for info in infos], offsets))
+
 
-    Singled out to be cached ..
+def _collect_chunks(chunks, *, with_info=False):
+    '''Gather decoded chunks as returned by :class:`StreamDecoder`
+
+    If with_info is True the chunks carry a :class:`SampleInfo` as last
+    entry; the joined one is returned in addition.
     '''
     res = []
-    years = []
-    # ignore last '\n' and split into chunks
-    for seq in data[:-1].split(b'\n\n'):
-        chunk = read_sequence(seq)
-        # logger.debug('chunk header "{}"'.format(chunk.header))
-
-        if chunk.value is not None:
-            # logger.debug(chunk.value)
-            res.append(chunk.value)
-            header = chunk.header
-            years.extend(chunk.header.year *
-                         np.ones(len(chunk.value[0]), dtype=int))
-            logger.debug(chunk.header)
-            # print('found data:',len(chunk.value[0]))
+    times = []
+    infos = []
+    header = None
+    for chunk in chunks:
+        header, values, secs, nanos, t = chunk[:5]
+        # logger.debug('chunk header "{}"'.format(header))
+        res.append((values, secs, nanos))
+        times.append(t)
+        if with_info:
+            infos.append(chunk[5])
+        logger.debug(header)
+    if times:
+        times = _join(times)
+    if with_info:
+        return res, times, header, _join_info(infos) if infos else None
+    return res, times, header
+
+
+#: kernels of the downsample methods, see :func:`_downsample`
+_downsample_kernels = {'minmax': minmax_indices, 'lttb': lttb_indices}
+
+
+def _downsample(downsample, values, secs, nanos, times, info=None):
+    '''Keep the samples selected by a downsample method
+
+    Args:
+        downsample: tuple (method, points). method 'lttb' keeps `points`
+                    samples; 'minmax' the minimum and maximum of `points`
+                    equally long time intervals.
+
+    Only scalar numeric values are supported. Field values of dropped
+    samples are dropped as well.
+    '''
+    method, points = downsample
+    try:
+        kernel = _downsample_kernels[method]
+    except KeyError:
+        raise ValueError('Unknown downsample method: {}'.format(method))
+    if values.ndim != 1 or values.dtype.kind not in 'iuf':
+        raise ValueError('downsampling requires scalar numeric values')
+    idx = kernel(np.ascontiguousarray(times), np.ascontiguousarray(values),
+                 int(points))
+    if info is not None:
+        fields = info.fields
+        pos = np.searchsorted(idx, fields.index)
+        keep = idx[np.minimum(pos, len(idx) - 1)] == fields.index
+        info = SampleInfo(info.severity[idx], info.status[idx],
+                          info.repeatcount[idx],
+                          FieldValues(pos[keep], fields.name[keep],
+                                      fields.value[keep]))
+    return values[idx], secs[idx], nanos[idx], times[idx], info
+
+
+#: result of :meth:`Archiver.getAligned`: grid times (nano seconds since
+#: the epoch), values and ages (samples x variables), the variables and
+#: the exceptions of failed ones
+AlignedData = collections.namedtuple(
+    'AlignedData', ['times', 'values', 'age', 'pvnames', 'errors'])
+
+
+def _grid_ns(grid, t0, t1):
+    '''Points of a time grid in nano seconds since the epoch
+
+    grid is a step (seconds or :class:`datetime.timedelta`) starting at
+    t0 or a sorted sequence of times (naive times are UTC)
+    '''
+    if isinstance(grid, datetime.timedelta) or np.ndim(grid) == 0:
+        step = _interval_ns(grid)
+        if step <= 0:
+            raise ValueError('grid step has to be positive')
+        return np.arange(to_epoch_ns(t0), to_epoch_ns(t1) + 1, step,
+                         dtype=np.int64)
+    index = pd.DatetimeIndex(grid)
+    if index.tz is None:
+        index = index.tz_localize('UTC')
+    # values are UTC, not necessarily in nano seconds
+    times = index.values.astype('datetime64[ns]').view(np.int64)
+    if np.any(np.diff(times) < 0):
+        raise ValueError('grid has to be sorted')
+    return times
+
+
+def _scalar_samples(res, times, header):
+    '''Joined times and values of decoded scalar numeric data
+    '''
+    if not res:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    values = res[0][0] if len(res) == 1 else _join([r[0] for r in res])
+    if values.ndim != 1 or values.dtype.kind not in 'if':
+        raise ValueError('{} is not a numeric scalar'.format(
+            getattr(header, 'pvname', '')))
+    return np.ascontiguousarray(times), np.ascontiguousarray(values)
+
+
+def _payload_offsets(data):
+    '''Find the chunks of complete PB/HTTP data
+
+    Args:
+        data: bytes like object supporting find, e.g. a :class:`mmap.mmap`
+
+    Returns:
+        list of tuples (header, begin, end): data[begin:end] are the
+        lines of the samples of the chunk. Chunks without samples are
+        dropped.
+    '''
+    mem = memoryview(data).cast('c')
+    n = len(data)
+    parts = []
+    pos = 0
+    while pos < n:
+        stop = data.find(b'\n\n', pos)
+        if stop < 0:
+            stop = n
+        eol = data.find(b'\n', pos, stop)
+        if eol == pos:
+            # empty line
+            pos += 1
+            continue
+        if eol > pos:
+            header = read_header(mem[pos:eol])
+            end = stop
+            if stop == n and data[n - 1:] == b'\n':
+                end -= 1
+            if end > eol + 1:
+                parts.append((header, eol + 1, end))
+        pos = stop + 2
+    return parts
+
+
+def _split_payload(data):
+    '''Find the chunks of complete PB/HTTP data
+
+    Returns:
+        list of tuples (header, samples): samples are the lines of the
+        samples of the chunk (a view of data). Chunks without samples
+        are dropped.
+    '''
+    mem = memoryview(data).cast('c')
+    return [(header, mem[begin:end])
+            for header, begin, end in _payload_offsets(data)]
+
+
+def _fill(jobs, threads):
+    '''Run :func:`fill_rows` for each job, using up to threads threads
+
+    Jobs are tuples of the arguments of :func:`fill_rows`.
+
+    Returns:
+        list of the results of :func:`fill_rows`, in the order of the jobs
+    '''
+    if threads <= 1 or len(jobs) <= 1:
+        return [fill_rows(*job) for job in jobs]
+
+    # balance the number of lines: largest first to the least loaded
+    groups = [[] for _ in range(min(threads, len(jobs)))]
+    load = [0] * len(groups)
+    order = sorted(range(len(jobs)), key=lambda k: len(jobs[k][2]),
+                   reverse=True)
+    for k in order:
+        i = load.index(min(load))
+        groups[i].append(k)
+        load[i] += len(jobs[k][2])
+
+    results = [None] * len(jobs)
+
+    def run(group):
+        for k in group:
+            results[k] = fill_rows(*jobs[k])
+
+    # one task per group: at most threads of the shared workers are used
+    executor = _get_decode_executor()
+    futures = [executor.submit(run, group) for group in groups]
+    for future in futures:
+        future.result()
+    return results
+
+
+def _window_parts(parts, t_start, t_stop):
+    '''Restrict the samples of the chunks to the window t_start..t_stop
+
+    As the appliance does, only the last sample before t_start is kept,
+    even if several chunks start before t_start.
+
+    Returns:
+        the parts (header, samples) with samples in the window, and the
+        end of each of their lines
+    '''
+    windows = []
+    last_before = None
+    for header, seq in parts:
+        e = line_ends(seq)
+        i0, i1 = window_lines(seq, header, e, t_start, t_stop)
+        if i1 <= i0:
+            continue
+        start = e[i0 - 1] + 1 if i0 else 0
+        before = (t_start is not None
+                  and sample_time(seq[start:e[i0]], header) < t_start)
+        if before:
+            last_before = len(windows)
+        windows.append((header, seq, e, i0, i1, before))
+
+    selected = []
+    ends = []
+    for k, (header, seq, e, i0, i1, before) in enumerate(windows):
+        if before and k != last_before:
+            # a later chunk holds the last sample before t_start
+            i0 += 1
+            if i1 <= i0:
+                continue
+        start = e[i0 - 1] + 1 if i0 else 0
+        selected.append((header, seq[start:e[i1 - 1]]))
+        ends.append(e[i0:i1] - start)
+    return selected, ends
+
+
+def _decode_chunks(data, *, threads=None, with_info=False, t_start=None,
+                   t_stop=None):
+    '''Decode complete PB/HTTP data
+
+    Args:
+        threads:   number of threads decoding the chunks
+                   (default :data:`decode_threads`)
+        with_info: add the :class:`SampleInfo` of each chunk
+        t_start, t_stop: if given, only the samples in this window (in
+                   nano seconds since the epoch, both included) and the
+                   last sample before t_start are decoded. The lines of
+                   the window are found by binary search, see
+                   :func:`window_lines`.
+
+    All chunk boundaries are searched first. If all chunks are of the same
+    numeric type, one output array is allocated and the chunks are decoded
+    in parallel, each into its own slice. The values of the chunks are
+    then adjacent views of this array (see :func:`_join`).
+
+    Large chunks are split into ranges of samples using the index of
+    their lines, so that a single chunk is decoded by several threads too.
+
+    Returns:
+        list of tuples (header, values, secs, nanos, times[, info])
+    '''
+    if threads is None:
+        threads = decode_threads
+    parts = _split_payload(data)
+    ends = None
+    if t_start is not None or t_stop is not None:
+        parts, ends = _window_parts(parts, t_start, t_stop)
+    kinds = {(header.type, header.elementCount) for header, _ in parts}
+    if len(kinds) != 1 or numeric_dtype(parts[0][0]) is None:
+        return [(header,) + read_chunk(seq, header, with_times=True,
+                                       with_info=with_info)
+                for header, seq in parts]
+
+    if ends is None:
+        ends = [line_ends(seq) for _, seq in parts]
+    total = sum(len(e) for e in ends)
+    header = parts[0][0]
+    if header.type >= 7:
+        values = np.empty((total, header.elementCount),
+                          dtype=numeric_dtype(header))
+    else:
+        values = np.empty(total, dtype=numeric_dtype(header))
+    secs = np.empty(total, dtype=np.int32)
+    nanos = np.empty(total, dtype=np.int32)
+    times = np.empty(total, dtype=np.int64)
+    info = empty_sample_info(total) if with_info else None
+
+    if len(data) < parallel_decode_min_bytes:
+        threads = 1
+    step = max(math.ceil(total / threads), parallel_decode_min_samples)
+
+    chunks = []
+    jobs = []
+    ranges = []
+    offset = 0
+    for (header, seq), e in zip(parts, ends):
+        n = len(e)
+        rows = slice(offset, offset + n)
+        arrays = values[rows], secs[rows], nanos[rows], times[rows]
+        if info is not None:
+            chunk_info = SampleInfo(info.severity[rows], info.status[rows],
+                                    info.repeatcount[rows], None)
+        for i0 in range(0, n, step):
+            i1 = min(i0 + step, n)
+            start = e[i0 - 1] + 1 if i0 else 0
+            job = (seq, header, e[i0:i1], start) + tuple(
+                arr[i0:i1] for arr in arrays)
+            if info is not None:
+                job += (SampleInfo(*(arr[i0:i1] for arr in chunk_info[:3]),
+                                   None),)
+            jobs.append(job)
+            ranges.append((len(chunks), i0))
+        chunks.append((header,) + arrays)
+        if info is not None:
+            chunks[-1] += (chunk_info,)
+        offset += n
+
+    fields = _fill(jobs, threads)
+    if info is not None:
+        # field values of the ranges, counted from the start of their chunk
+        collected = [([], []) for _ in chunks]
+        for (k, i0), f in zip(ranges, fields):
+            collected[k][0].append(f)
+            collected[k][1].append(i0)
+        for k, (f, offsets) in enumerate(collected):
+            chunk_info = chunks[k][5]._replace(fields=_join_fields(f, offsets))
+            chunks[k] = chunks[k][:5] + (chunk_info,)
+    return chunks
+
+
+def _to_ns(t):
+    '''datetime to nanoseconds since the epoch
+    '''
+    return int(t.timestamp()) * 10**9 + t.microsecond * 1000
+
+
+def _select_window(pieces, t0, t1):
+    '''Combine the chunks of consecutive partitions for the window t0..t1
+
+    Args:
+        pieces: sequence of (start, end, chunks) with the decoded chunks
+                (including times) of the partition start..end
+
+    Each partition contributes its samples in [start, end), the last one
+    its samples up to t1 (included, as in the request). As the appliance
+    does, the last sample before t0 is kept in front of the samples in
+    [t0, t1].
+    '''
+    t0_ns = _to_ns(t0)
+    t1_ns = _to_ns(t1)
+    selected = []
+    n_before = 0
+    for i, (start, end, chunks) in enumerate(pieces):
+        if i == len(pieces) - 1:
+            end_ns = t1_ns
+        else:
+            end_ns = min(_to_ns(end) - 1, t1_ns)
+        for header, values, secs, nanos, t in chunks:
+            mask = t <= end_ns
+            if i > 0:
+                # the first partition holds the sample before t0
+                mask &= t >= _to_ns(start)
+            if not mask.any():
+                continue
+            if not mask.all():
+                t, values, secs, nanos = t[mask], values[mask], secs[mask], nanos[mask]
+            n_before += np.count_nonzero(t < t0_ns)
+            selected.append((header, values, secs, nanos, t))
+
+    # drop all samples before t0 apart from the last one
+    drop = n_before - 1
+    while drop > 0 and selected:
+        header, values, secs, nanos, t = selected[0]
+        if len(secs) <= drop:
+            drop -= len(secs)
+            selected.pop(0)
         else:
-            pass
-            # logger.debug('no data')
+            selected[0] = (header, values[drop:], secs[drop:], nanos[drop:],
+                           t[drop:])
+            drop = 0
+    return selected
+
+
+def _split_window(t0, t1, n):
+    '''Split t0..t1 into n sub windows of (about) the same length
 
-    return res, years, header
+    The borders are rounded to full seconds, the resolution of the
+    requests sent to the appliance.
+
+    Returns:
+        list of tuples (start, end)
+    '''
+    step = (t1 - t0) / n
+    borders = [t0]
+    for i in range(1, n):
+        border = (t0 + i * step).replace(microsecond=0)
+        if border > borders[-1]:
+            borders.append(border)
+    borders.append(t1)
+    return list(zip(borders[:-1], borders[1:]))
+
+
+def get_data_from_archiver(data, *, threads=None, with_info=False,
+                           t_start=None, t_stop=None):
+    '''Decode complete PB/HTTP data
+
+    Args:
+        threads:   number of threads decoding the chunks
+                   (default :data:`decode_threads`)
+        with_info: decode severity, status, repeat count and field values
+                   of the samples too
+        t_start, t_stop: only decode the samples of this window (in nano
+                   seconds since the epoch) and the last sample before
+                   t_start, see :func:`_decode_chunks`
+
+    Returns:
+        list of tuples (values, secs, nanos) per chunk, time of each
+        sample in nano seconds since the epoch, header of the last chunk
+        [, :class:`SampleInfo` of all samples if with_info is True]
+    '''
+    chunks = _decode_chunks(data, threads=threads, with_info=with_info,
+                            t_start=t_start, t_stop=t_stop)
+    return _collect_chunks(chunks, with_info=with_info)
+
+
+def iter_data_from_stream(f, *, block_size=None, max_samples=None,
+                          with_times=False):
+    '''Decode PB/HTTP data from file like object f chunk by chunk
+
+    Args:
+        f:           file like object e.g. a response of the transport
+        block_size:  number of bytes read at once
+                     (default :data:`stream_block_size`)
+        max_samples: hand out long chunks in pieces of (about) this
+                     number of samples
+        with_times:  add the sample times in nano seconds since the epoch
+
+    Yields:
+        tuple (header, values, secs, nanos[, times]) for each chunk
+    '''
+    if block_size is None:
+        block_size = stream_block_size
+    decoder = StreamDecoder(read_header, max_samples=max_samples,
+                            with_times=with_times)
+    while True:
+        block = f.read(block_size)
+        if not block:
+            break
+        yield from decoder.feed(block)
+    yield from decoder.close()
+
+
+def get_data_from_stream(f, *, block_size=None):
+    '''Decode PB/HTTP data while it is read from file like object f
+
+    Args:
+        f:          file like object e.g. a response of the transport
+        block_size: number of bytes read at once
+                    (default :data:`stream_block_size`)
+
+    The response body is never held completely in memory. Samples are
+    decoded block by block into growable arrays, so the peak memory is
+    close to the size of the decoded result.
+    '''
+    return _collect_chunks(iter_data_from_stream(f, block_size=block_size,
+                                                 with_times=True))
 
 
 def get_data(data, *, return_type='pandas', time_format='timestamp',
-             padding=False, t_start=None, t_stop=None, timezone=None):
-    #print("get_data.cache_info: {}".format(request_data.cache_info()))
+             padding=False, t_start=None, t_stop=None, timezone=None,
+             with_info=False, downsample=None):
     """Parses HTTP/PB data buffer
 
     see [HTTPPB]_
 
     args:
-        return_type (str, optional) : requested data type (pandas|raw). Defaults to pandas
+        return_type (str, optional) : requested data type (pandas|raw|arrow|polars). Defaults to pandas
         time_format (str, optional) : requested time format (raw, timestamp, datetime). Defaults to timestamp
         padding (str, optional) : restrict timestamp to requested time range (cuts first entry and adds dummy last entry)
+        t_start, t_stop (optional) : only decode the samples in this time window and the last sample before t_start (:class:`datetime.datetime` or ISO string, naive times are UTC). The samples are found by binary search; the others are not decoded
+        with_info (bool, optional) : add alarm severity, status, repeat count and field values of the samples. Defaults to False
+        downsample (tuple, optional) : (method, points) reduce scalar numeric data for plotting: ('lttb', n) keeps n samples selected by Largest-Triangle-Three-Buckets, ('minmax', n) the minimum and maximum of n equally long time intervals
 
     The following return types are supported
         'pandas'
             pandas DataFrame
 
         'raw'
-            tuple (header, values, secs, nanos)
+            tuple (header, values, secs, nanos[, info])
+
+        'arrow'
+            :class:`pyarrow.Table`, see :mod:`bact_archiver.columnar`
+
+        'polars'
+            :class:`polars.DataFrame`, see :mod:`bact_archiver.columnar`
+
+    The arrow and polars results wrap the decoded numeric arrays without
+    copying them. Times are a `timestamp[ns, UTC]` column, waveforms
+    `FixedSizeList` (polars: `Array`) columns.
+
+    With `with_info` the pandas DataFrame gets the additional columns
+    severity, status and repeatcount; the field values (e.g.
+    cnxlostepsecs when the connection was lost) are found in the
+    DataFrame `df.meta.fields` with the columns name and value, indexed
+    like the samples. For 'raw' the :class:`SampleInfo` is returned as
+    last item.
 
     The following time formats are supported:
         'raw'
@@ -150,103 +717,528 @@ def get_data(data, *, return_type='pandas', time_format='timestamp',
     """
 
 
-    res, years, header = get_data_from_archiver(data)
+    decoded = get_data_from_archiver(
+        data, with_info=with_info,
+        t_start=to_epoch_ns(t_start) if t_start is not None else None,
+        t_stop=to_epoch_ns(t_stop) if t_stop is not None else None)
+    return _format_data(*decoded, return_type=return_type,
+                        time_format=time_format, padding=padding,
+                        t_start=t_start, t_stop=t_stop, timezone=timezone,
+                        downsample=downsample)
 
+
+def _format_data(res, times, header, info=None, *, return_type='pandas',
+                 time_format='timestamp', padding=False, t_start=None,
+                 t_stop=None, timezone=None, downsample=None):
+    '''Combine the decoded chunks as requested by return_type and time_format
+
+    Args:
+        times: time of each sample in nano seconds since the epoch
+        info:  :class:`SampleInfo` of all samples or None
+
+    see :func:`get_data`
+    '''
     # if single chunk with data, return here
     if len(res) == 0:
         logger.error('no data received')
         return None
     elif len(res) == 1:
         values, secs, nanos = res[0]
-        years = years[0] * np.ones(len(secs), dtype=int)
-        # print('One Chunk Only')
-        # print('chunk.header.year = ',chunk.header.year)
     else:
         # if multible chunks, combine data and return
-        # print("{} chunks found".format(len(res)))
-        values = np.concatenate([r[0] for r in res])
+        values = _join([r[0] for r in res])
+        secs = _join([r[1] for r in res])
+        nanos = _join([r[2] for r in res])
 
+    if downsample is not None:
+        values, secs, nanos, times, info = _downsample(
+            downsample, values, secs, nanos, times, info)
 
+    if padding and info is not None:
+        raise ValueError('padding is not supported together with the sample info')
 
-        secs = np.concatenate([r[1] for r in res])
-        nanos = np.concatenate([r[2] for r in res])
+    if return_type in ('arrow', 'polars'):
+        convert = to_arrow if return_type == 'arrow' else to_polars
+        return convert(header, values, times, secs, nanos, info,
+                       time_format=time_format, padding=padding,
+                       t_start=t_start, t_stop=t_stop)
 
     if return_type == 'pandas':
         if time_format == 'datetime':
-            dt = convert_data_time(years=years,secs=secs, nsecs=nanos)
+            if padding:
+                # move first value to start of requested time range and
+                # add dummy last value at end of requested time range
+                values, times = pad_samples(values, times, t_start, t_stop)
+            dt = convert_epoch_ns(times)
             df = pd.DataFrame(values, index=dt)
             if len(df.columns) == 1:
                 df.columns = ['val']
 
-            if padding:
-                if t_start is not None and t_stop is not None and len(df.columns) == 1:
-                    # move first value to start of requested time range
-                    first = pd.DataFrame([df['val'][0]], columns = ["val"], index=[t_start])
-                    # add dummy last value at end of requested time range
-                    last = pd.DataFrame([df['val'][-1]], columns = ["val"], index=[t_stop])
-                    df = pd.concat([first ,df[1:], last ])
-                else:
-                    raise NotImplemented('padding not implemented for non-scalars')
-
         elif time_format == 'raw':
             df = pd.DataFrame({'second': secs, 'ns': nanos, 'val': values})
         elif time_format == 'timestamp':
-            offset = datetime.datetime(header.year,
-                                       1,
-                                       1,
-                                       tzinfo=dateutil.tz.tzutc()).timestamp()
-            # df = pd.DataFrame({'timestamp':offset+secs+1.e-9*nanos, 'val':values})
-            t = pd.Series(offset + secs + 1.e-9 * nanos, name='timestamp')
+            # times include the year offset of each chunk: correct for
+            # requests spanning new year
+            t = pd.Series(times / 1e9, name='timestamp')
             df = pd.DataFrame(values, index=t)
 
         else:
             raise ValueError('Unknown time format: {}'.format(time_format))
 
+        if info is not None:
+            df['severity'] = info.severity
+            df['status'] = info.status
+            df['repeatcount'] = info.repeatcount
+
         df.meta = types.SimpleNamespace()
         df.meta.header = header
+        if info is not None:
+            df.meta.fields = pd.DataFrame(
+                {'name': info.fields.name, 'value': info.fields.value},
+                index=df.index[info.fields.index])
 
         return df
 
     else:  # return_type=='raw'
+        if info is not None:
+            return (header, values, secs, nanos, info)
         return (header, values, secs, nanos)
 
 
 class Archiver(ArchiverBasis):
     '''Access implemented with cython and protoc compiler
+
+    Args:
+        config:          archiver configuration
+        transport:       see :class:`bact_archiver.archiver.ArchiverBasis`
+        result_cache:    see :class:`bact_archiver.archiver.ArchiverBasis`
+        partition_cache: persistent cache of raw data, see
+                         :class:`bact_archiver.partition_cache.PartitionCache`.
+                         If None it is created as described by the
+                         configuration (if `cache_dir` is given)
     '''
+    def __init__(self, *, config, transport=None, result_cache=None,
+                 partition_cache=None):
+        super().__init__(config=config, transport=transport,
+                         result_cache=result_cache)
+        if partition_cache is None:
+            partition_cache = create_partition_cache(config)
+        self.partition_cache = partition_cache
+
+    def getData(self, pvname, *, t0, t1, use_cache=True, max_bytes=None,
+                retries=2, decode_threads=None, with_info=False,
+                operator=None, bin_seconds=None, target_points=None, **kws):
+        '''Get archiver data for single EPICS variable in given time frame.
+
+        Args:
+            use_cache: use the result cache and the partition cache,
+                       if configured
+            max_bytes: if given, split the window into sub windows so that
+                       the data of each is expected to stay below this
+                       number of bytes. The sub windows are fetched in
+                       parallel, see :meth:`_getChunksSplit`
+            retries:   number of retries for a failing sub window
+            decode_threads: number of threads decoding the response
+                       (default: `decode_threads` of the configuration).
+                       If given, the response is read completely and
+                       decoded in parallel, otherwise it is decoded
+                       while reading.
+            with_info: add severity, status, repeat count and field values
+                       of the samples, see :func:`get_data`. The data is
+                       then requested in one piece: the partition cache
+                       and max_bytes are not used.
+            operator:  an :class:`ApplianceOperators` (e.g. 'mean'): the
+                       data is reduced by the appliance before sending.
+                       The partition cache and max_bytes are not used.
+            bin_seconds: size of the bins of the operator in seconds or
+                       'auto': the size is chosen so that about
+                       `target_points` bins cover the window. If the
+                       appliance reports no more samples than that
+                       (see :meth:`guessSize`), the raw data is returned.
+            target_points: number of points for 'auto' (default:
+                       `auto_bin_points`)
+
+        see :meth:`bact_archiver.archiver.ArchiverInterface.getData` for the
+        other arguments.
+        '''
+        decoded, t0_str, t1_str = self._getDecodedWindow(
+            pvname, t0=t0, t1=t1, use_cache=use_cache, max_bytes=max_bytes,
+            retries=retries, decode_threads=decode_threads,
+            with_info=with_info, operator=operator, bin_seconds=bin_seconds,
+            target_points=target_points)
+        return _format_data(*decoded, t_start=t0_str, t_stop=t1_str, **kws)
+
+    def getAligned(self, pvnames, *, t0, t1, grid=None, **kws):
+        '''Values of several scalar variables on a common time grid
+
+        Args:
+            pvnames: sequence of variables to obtain
+            t0:      start time a :class:`datetime.datetime` object
+            t1:      end time a :class:`datetime.datetime` object
+            grid:    step of the grid (seconds or
+                     :class:`datetime.timedelta`) starting at t0, or the
+                     sorted times of the grid. If None the times of all
+                     samples within t0..t1 are used.
+            kws:     request options of :meth:`getData`, e.g. max_bytes
+                     or use_cache
+
+        Returns:
+            :class:`AlignedData`: for each grid point and variable the
+            value of the last sample at or before the grid point (zero
+            order hold) and its age in nano seconds. Before the first
+            sample the value is NaN and the age -1. Failing variables
+            are reported in `errors` and get NaN columns.
+
+        The variables are fetched in parallel on :attr:`executor` and
+        joined onto the grid by :func:`bact_archiver.epics_event.asof_join`
+        straight from the decoded times.
+
+        Example::
+
+            aligned = archiver.getAligned(pvnames, t0=t0, t1=t1, grid=1.0)
+            df = pd.DataFrame(aligned.values, columns=aligned.pvnames,
+                              index=convert_epoch_ns(aligned.times))
+        '''
+        pvnames = list(pvnames)
+        times = _grid_ns(grid, t0, t1) if grid is not None else None
+        futures = [
+            self.executor.submit(self._getDecodedWindow, pvname, t0=t0,
+                                 t1=t1, **kws)
+            for pvname in pvnames
+        ]
+        samples = {}
+        errors = {}
+        for column, (pvname, future) in enumerate(zip(pvnames, futures)):
+            try:
+                decoded, _, _ = future.result()
+                samples[column] = _scalar_samples(*decoded[:3])
+            except Exception as exc:
+                logger.error('Failed to get data for pv %s: reason %s',
+                             pvname, exc)
+                errors[pvname] = exc
+
+        if times is None:
+            times = np.unique(np.concatenate(
+                [np.empty(0, dtype=np.int64)]
+                + [t for t, _ in samples.values()]))
+            times = times[np.searchsorted(times, to_epoch_ns(t0)):
+                          np.searchsorted(times, to_epoch_ns(t1), side='right')]
+        values = np.full((len(times), len(pvnames)), np.nan)
+        age = np.full(values.shape, -1, dtype=np.int64)
+        for column, (t, v) in samples.items():
+            asof_join(t, v, times, values[:, column], age[:, column])
+        return AlignedData(times, values, age, pvnames, errors)
+
+    def _getDecodedWindow(self, pvname, *, t0, t1, use_cache=True,
+                          max_bytes=None, retries=2, decode_threads=None,
+                          with_info=False, operator=None, bin_seconds=None,
+                          target_points=None):
+        '''Decoded data of the window t0..t1, see :meth:`getData`
+
+        Returns:
+            tuple (decoded, t0_str, t1_str): decoded as returned by
+            :func:`get_data_from_archiver`, the window as sent to the
+            appliance
+        '''
+        t0_str, t1_str = self._convert_window(pvname, t0, t1)
+        if decode_threads is None:
+            decode_threads = getattr(self.config, 'decode_threads', None)
+        if operator is None and bin_seconds is not None:
+            raise ValueError('bin_seconds requires an operator')
+        if bin_seconds == 'auto':
+            if target_points is None:
+                target_points = auto_bin_points
+            bin_seconds = self._autoBinSeconds(pvname, t0=t0, t1=t1,
+                                               points=target_points)
+            if bin_seconds is None:
+                operator = None
+        op = 'raw' if operator is None else operator_name(operator, bin_seconds)
+
+        def compute():
+            if operator is not None:
+                return self._getDecoded(pvname, t0=t0_str, t1=t1_str,
+                                        threads=decode_threads,
+                                        with_info=with_info, operator=op)
+            if with_info:
+                return self._getDecoded(pvname, t0=t0_str, t1=t1_str,
+                                        threads=decode_threads, with_info=True)
+            if self.partition_cache is not None and use_cache:
+                chunks = self._getChunksCached(pvname, t0=t0.astimezone(_utc),
+                                               t1=t1.astimezone(_utc),
+                                               threads=decode_threads)
+                return _collect_chunks(chunks)
+            if max_bytes is not None:
+                chunks = self._getChunksSplit(pvname, t0=t0.astimezone(_utc),
+                                              t1=t1.astimezone(_utc),
+                                              max_bytes=max_bytes,
+                                              retries=retries)
+                if chunks is not None:
+                    return _collect_chunks(chunks)
+            return self._getDecoded(pvname, t0=t0_str, t1=t1_str,
+                                    threads=decode_threads)
+
+        kind = 'decoded+info' if with_info else 'decoded'
+        key = pvname, op, t0_str, t1_str, kind
+        decoded = self._cached(key, t1, compute, use_cache=use_cache)
+        return decoded, t0_str, t1_str
+
+    def _getDecoded(self, pvname, *, t0, t1, threads=None, with_info=False,
+                    operator=None):
+        '''Request and decode the data while reading the response
+
+        If threads is given or with_info is True, the complete response
+        is read first and then decoded using this number of threads.
+        operator is the name of a post processor, see :func:`operator_name`.
+        '''
+        var = pvname if operator is None else '{}({})'.format(operator, pvname)
+        url = self._data_url(quote(var), t0=t0, t1=t1)
+        logger.debug('Using url %s', url)
+        try:
+            f = self.transport.open(url)
+        except Exception as ex:
+            logger.error('Failed to open url {}: reason {}'.format(url, ex))
+            raise ex
+
+        with f:
+            if threads is not None or with_info:
+                return get_data_from_archiver(f.read(), threads=threads,
+                                              with_info=with_info)
+            return get_data_from_stream(f)
+
     def _getData(self, pvname, *, t0, t1, **kwargs):
-        fmt = self.data_url_fmt
-        url = fmt.format(format='raw', var=quote(pvname),
-                         t0=quote(t0), t1=quote(t1))
+        res, times, header = self._getDecoded(pvname, t0=t0, t1=t1)
+        return _format_data(res, times, header, t_start=t0, t_stop=t1,
+                            **kwargs)
+
+    def _getChunksCached(self, pvname, *, t0, t1, threads=None):
+        '''Decoded chunks for t0..t1 using the partition cache
+
+        Immutable partitions are read from the cache if available,
+        otherwise requested completely and stored. Recent partitions are
+        always requested, and only the part within t0..t1. The missing
+        partitions are requested in parallel on :attr:`executor`.
+        '''
+        cache = self.partition_cache
+        now = datetime.datetime.now(_utc)
+        partitions = []
+        missing = []
+        for start, end in cache.partitions(t0, t1):
+            immutable = cache.is_immutable(end, now)
+            data = cache.get(pvname, start) if immutable else None
+            if data is None:
+                missing.append((start, end, immutable))
+            else:
+                logger.debug('Partition cache hit: pv %s partition %s',
+                             pvname, start)
+            partitions.append((start, end, data))
+
+        def fetch(partition):
+            start, end, immutable = partition
+            if immutable:
+                window = start, end
+            else:
+                window = max(start, t0), min(end, t1)
+            url = self._data_url(
+                quote(pvname), t0=convert_datetime_to_timestamp(window[0]),
+                t1=convert_datetime_to_timestamp(window[1]))
+            logger.debug('Partition cache miss: using url %s', url)
+            data = self.transport.get(url)
+            if immutable:
+                cache.put(pvname, start, data)
+            return data
+
+        fetched = dict(zip([p[0] for p in missing], self._map(fetch, missing)))
+        pieces = []
+        for start, end, data in partitions:
+            if data is None:
+                data = fetched[start]
+            # only the samples of the window are decoded
+            chunks = _decode_chunks(data, threads=threads,
+                                    t_start=_to_ns(t0), t_stop=_to_ns(t1))
+            pieces.append((start, end, chunks))
+        return _select_window(pieces, t0, t1)
+
+    def _getChunksSplit(self, pvname, *, t0, t1, max_bytes, retries=2):
+        '''Decoded chunks for t0..t1 fetched in sub windows
+
+        The number of sub windows is chosen using :meth:`guessSize`, so
+        that the expected number of bytes (samples times bytes per
+        sample) of each sub window stays below max_bytes. The sub windows
+        are requested in parallel. A failing one is retried up to retries
+        times on its own. The results are combined in time order;
+        samples at the borders are not duplicated.
+
+        Returns:
+            None if a single request is sufficient or the size could not
+            be estimated
+        '''
+        try:
+            ncount, nbytes = self.guessSize(pvname, t0, t1)
+        except Exception as exc:
+            logger.warning('Could not estimate size of pv %s: %s.'
+                           ' Not splitting the request', pvname, exc)
+            return None
+        # seconds and nano seconds
+        nbytes += 8
+        n = math.ceil(int(ncount) * nbytes / max_bytes)
+        if n <= 1:
+            return None
+        windows = _split_window(t0, t1, n)
+        if len(windows) <= 1:
+            return None
+        logger.info('Splitting request for pv %s into %d sub windows',
+                    pvname, len(windows))
+
+        def fetch(start, end):
+            url = self._data_url(quote(pvname),
+                                 t0=convert_datetime_to_timestamp(start),
+                                 t1=convert_datetime_to_timestamp(end))
+            for attempt in range(retries + 1):
+                try:
+                    with self.transport.open(url) as f:
+                        return list(iter_data_from_stream(f, with_times=True))
+                except Exception as exc:
+                    if attempt >= retries:
+                        logger.error('Failed to fetch sub window %s..%s of'
+                                     ' pv %s: %s', start, end, pvname, exc)
+                        raise
+                    logger.warning('Retrying sub window %s..%s of pv %s'
+                                   ' after: %s', start, end, pvname, exc)
+
+        # own pool: getData itself can run on self.executor (getDataMany)
+        workers = min(self.max_workers, len(windows))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(fetch, start, end)
+                       for start, end in windows]
+            pieces = [(start, end, future.result())
+                      for (start, end), future in zip(windows, futures)]
+        return _select_window(pieces, t0, t1)
+
+    def iterData(self, pvname, *, t0, t1, max_samples=None):
+        '''Iterate over the decoded chunks of the data of a single variable
+
+        Args:
+            pvname:      variable to obtain
+            t0:          start time a :class:`datetime.datetime` object
+            t1:          end time a :class:`datetime.datetime` object
+            max_samples: hand out long chunks in pieces of (about) this
+                         number of samples
+
+        Yields:
+            tuple (header, values, secs, nanos) for each chunk as it arrives
+
+        The chunks are decoded while the response is read. Only the
+        current chunk is held in memory. Suited for jobs which only
+        require running aggregates over long time spans.
+
+        Example::
+
+            total = 0
+            for header, values, secs, nanos in archiver.iterData(pvname, t0=t0, t1=t1):
+                total += values.sum()
+        '''
+        t0_str, t1_str = self._convert_window(pvname, t0, t1)
+        url = self._data_url(quote(pvname), t0=t0_str, t1=t1_str)
         logger.debug('Using url %s', url)
         try:
-            f = urlopen(url)
+            f = self.transport.open(url)
         except Exception as ex:
             logger.error('Failed to open url {}: reason {}'.format(url, ex))
             raise ex
 
-        return get_data(f.read(), t_start=t0, t_stop=t1, **kwargs)
+        # closing the generator early closes the response
+        with f:
+            yield from iter_data_from_stream(f, max_samples=max_samples)
 
-    @lru_cache(maxsize=64)
-    def _requestData(self, pvname, *, t0, t1,  dtype='raw'):
-        #print("request_data.cache_info: {}".format(request_data.cache_info()))
-        fmt = self.data_url_fmt
-        request = fmt.format(format='raw', var=dquote(pvname, dtype),
-                             t0=quote(t0), t1=quote(t1))
+    def getStats(self, pvname, *, t0, t1, interval=None, ddof=1,
+                 max_samples=None, time_format='timestamp'):
+        '''Count, mean, std, min and max of a variable per time interval
+
+        Args:
+            pvname:      variable to obtain
+            t0:          start time a :class:`datetime.datetime` object
+            t1:          end time a :class:`datetime.datetime` object
+            interval:    length of the intervals in seconds or a
+                         :class:`datetime.timedelta`; None for the whole
+                         window
+            ddof:        delta degrees of freedom of std
+            max_samples: decode the response in pieces of (about) this
+                         number of samples (default `stats_block_samples`)
+            time_format: 'timestamp' or 'datetime' for the index
+
+        Returns:
+            :class:`pandas.DataFrame` with one row per interval, see
+            :meth:`bact_archiver.stats.StatsAccumulator.result`.
+            Waveforms get statistics per element.
+
+        The samples are decoded while the response is read and merged
+        into the statistics piece by piece: the memory used depends on
+        the number of intervals, not on the number of samples.
+        '''
+        if max_samples is None:
+            max_samples = stats_block_samples
+        t0_str, t1_str = self._convert_window(pvname, t0, t1)
+        stats = StatsAccumulator(to_epoch_ns(t0_str), to_epoch_ns(t1_str),
+                                 interval)
+        url = self._data_url(quote(pvname), t0=t0_str, t1=t1_str)
+        logger.debug('Using url %s', url)
+        try:
+            f = self.transport.open(url)
+        except Exception as ex:
+            logger.error('Failed to open url {}: reason {}'.format(url, ex))
+            raise ex
+
+        with f:
+            for header, values, secs, nanos, times in iter_data_from_stream(
+                    f, max_samples=max_samples, with_times=True):
+                stats.add(values, times)
+        return stats.result(ddof=ddof, time_format=time_format)
+
+    def follow(self, pvnames, *, window, capacity=100000):
+        '''Follow variables: each poll requests only the new samples
+
+        Args:
+            pvnames:  variables to follow
+            window:   time span of interest, a :class:`datetime.timedelta`
+            capacity: number of samples kept per variable
+
+        Returns:
+            a :class:`bact_archiver.follow.Follower`
+        '''
+        return Follower(self, pvnames, window=window, capacity=capacity)
+
+    def _requestData(self, pvname, *, t0, t1,  dtype='raw', bin_seconds=None):
+        request = self._data_url(dquote(pvname, dtype, bin_seconds),
+                                 t0=t0, t1=t1)
         logger.info("request_data({}...)".format(request))
         try:
-            f = urlopen(request)
-            return f.read()
+            return self.transport.get(request)
         except Exception as e:
             logger.error('Failed to handle request {} reason {}'.format(request, e))
             raise e
 
-    def requestData(self, pvname, *, t0, t1, dtype='raw'):
-        '''
+    def requestData(self, pvname, *, t0, t1, dtype='raw', bin_seconds=None,
+                    use_cache=True):
+        '''Raw PB/HTTP data as returned by the appliance
+
+        Args:
+            dtype:     'raw' or an operator of :class:`ApplianceOperators`
+            bin_seconds: bin size of the operator in seconds
+            use_cache: use the result cache, if configured
         '''
         t0_str = convert_datetime_to_timestamp(t0)
         t1_str = convert_datetime_to_timestamp(t1)
-        return self._requestData(pvname, t0=t0_str, t1=t1_str, dtype=dtype)
+
+        def compute():
+            return self._requestData(pvname, t0=t0_str, t1=t1_str, dtype=dtype,
+                                     bin_seconds=bin_seconds)
+
+        op = dtype if dtype == 'raw' else operator_name(dtype, bin_seconds)
+        key = pvname, op, t0_str, t1_str, 'bytes'
+        if t1.tzinfo is None:
+            # naive times are requested as UTC here
+            t1 = t1.replace(tzinfo=_utc)
+        return self._cached(key, t1, compute, use_cache=use_cache)
 
     def guessSize(self, pvname, t0, t1):
 
@@ -264,20 +1256,34 @@ class Archiver(ArchiverBasis):
             if header.type == 0 or header.type == 7:
                 # TODO: support string types
                 raise NotImplementedError('string types not supported yet')
-            nbytes = np.typeDict[_dtypes[header.type]](0).nbytes
+            nbytes = np.dtype(_dtypes[header.type]).itemsize
             nbytes *= header.elementCount
         else:
             count = int(info['elementCount'])
             dbrtype = info['DBRType'].split('_')[2]
-            #print(dbrtype)
             if dbrtype in ['STRING']:
                 # TODO: support string types
                 raise NotImplementedError('string types not supported yet')
             else:
                 nbytes = _dsize[_dbrtypes[dbrtype]] * count
-                #print(count,nbytes)
 
         data = self.requestData(pvname, t0=t0, t1=t1, dtype='ncount')
         header, values, secs, nanos = get_data(data, return_type='raw')
         ncount = values[0]
         return (ncount, nbytes)
+
+    def _autoBinSeconds(self, pvname, *, t0, t1, points):
+        '''Bin size in seconds giving about points bins in t0..t1
+
+        Returns:
+            None if the window holds at most points samples
+        '''
+        try:
+            ncount, _ = self.guessSize(pvname, t0, t1)
+        except Exception as ex:
+            logger.info('Could not count the samples of %s: %s', pvname, ex)
+        else:
+            if ncount <= points:
+                return None
+        seconds = (t1 - t0).total_seconds()
+        return max(1, int(math.ceil(seconds / points)))
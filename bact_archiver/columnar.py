@@ -0,0 +1,116 @@
+"""Decoded data as Apache Arrow tables or polars DataFrames
+
+Used by :func:`bact_archiver.carchiver.get_data` for the return types
+'arrow' and 'polars'. pyarrow (and polars) are optional: they are only
+imported when these return types are requested.
+
+Numeric columns wrap the decoded numpy buffers; no data is copied.
+Strings and the bytes of V4 generic types are copied into arrow binary
+arrays.
+
+Columns:
+    * timestamp: `timestamp[ns, UTC]`
+    * second, ns: seconds into the year and nano seconds (int32);
+      only for the time format 'raw'
+    * val: the values. Waveforms are `FixedSizeList` columns of
+      elementCount elements
+    * severity, status, repeatcount: if the sample info is requested
+
+The header of the (last) chunk is stored in the metadata of the schema
+as JSON under the key `header`.
+"""
+import json
+
+import numpy as np
+
+from .utils import pad_samples
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError as exc:
+        raise ImportError("return types 'arrow' and 'polars' require pyarrow")\
+            from exc
+    return pyarrow
+
+
+def _wrap(pa, arr, dtype):
+    '''Arrow array of type dtype using the buffer of numpy array arr
+    '''
+    arr = np.ascontiguousarray(arr)
+    return pa.Array.from_buffers(dtype, len(arr), [None, pa.py_buffer(arr)])
+
+
+def _values(pa, values):
+    '''Arrow array of the values; waveforms as fixed size lists
+    '''
+    if values.dtype.kind in 'SO':
+        flat = pa.array(values.ravel().tolist(), type=pa.binary())
+    else:
+        flat = _wrap(pa, values.ravel(), pa.from_numpy_dtype(values.dtype))
+    if values.ndim == 1:
+        return flat
+    return pa.FixedSizeListArray.from_arrays(flat, values.shape[1])
+
+
+def _header_json(header):
+    if header is None:
+        return '{}'
+    return json.dumps({
+        'pvname': str(getattr(header, 'pvname', '')),
+        'type': int(header.type),
+        'year': int(header.year),
+        'elementCount': int(header.elementCount),
+        'headers': dict(getattr(header, 'headers', None) or {}),
+    })
+
+
+def to_arrow(header, values, times, secs, nanos, info=None, *,
+             time_format='timestamp', padding=False, t_start=None,
+             t_stop=None):
+    '''Create a :class:`pyarrow.Table` of the decoded samples
+
+    Args:
+        header: header of the (last) chunk
+        values, secs, nanos: decoded arrays of all chunks
+        times: time of each sample in nano seconds since the epoch
+        info:  :class:`bact_archiver.epics_event.SampleInfo` or None
+        time_format: 'raw' adds the columns second and ns
+        padding: move the first sample to t_start and repeat the last
+                 one at t_stop (scalars only). The arrays are copied.
+    '''
+    pa = _import_pyarrow()
+    if padding:
+        if info is not None:
+            raise ValueError('padding is not supported together with the'
+                             ' sample info')
+        values, times = pad_samples(values, times, t_start, t_stop)
+
+    columns = {'timestamp': _wrap(pa, times, pa.timestamp('ns', tz='UTC'))}
+    if time_format == 'raw':
+        if padding:
+            raise ValueError('padding is not supported for the time format raw')
+        columns['second'] = _wrap(pa, secs, pa.int32())
+        columns['ns'] = _wrap(pa, nanos, pa.int32())
+    elif time_format not in ('timestamp', 'datetime'):
+        raise ValueError('Unknown time format: {}'.format(time_format))
+    columns['val'] = _values(pa, values)
+    if info is not None:
+        columns['severity'] = _wrap(pa, info.severity, pa.uint16())
+        columns['status'] = _wrap(pa, info.status, pa.uint16())
+        columns['repeatcount'] = _wrap(pa, info.repeatcount, pa.uint32())
+    return pa.table(columns, metadata={'header': _header_json(header)})
+
+
+def to_polars(*args, **kwargs):
+    '''Create a :class:`polars.DataFrame` of the decoded samples
+
+    The arrow table created by :func:`to_arrow` is handed over without
+    copying the numeric columns. Waveforms become `Array` columns.
+    '''
+    try:
+        import polars as pl
+    except ImportError as exc:
+        raise ImportError("return type 'polars' requires polars") from exc
+    return pl.from_arrow(to_arrow(*args, **kwargs), rechunk=False)
@@ -27,14 +27,50 @@ class ArchiverConfiguration(ArchiverConfigurationInterface):
         name: short name or nickname of the archiver
         base_url : the base url of the archiver
 
+        transport: transport used to access the archiver: 'pooled'
+                   (persistent keep alive connections, default) or 'urllib'.
+                   'pooled' falls back to 'urllib' if a proxy is
+                   configured for the archiver in the environment
+        pool_size: number of idle connections kept per host
+        timeout: socket timeout in seconds
+        max_workers: maximum number of requests run in parallel by
+                   methods fetching several pvs e.g.
+                   :meth:`bact_archiver.archiver.ArchiverBasis.getDataMany`
+        cache_dir: directory of the persistent partition cache
+                   (see :mod:`bact_archiver.partition_cache`).
+                   No cache is used if not given.
+        cache_size: maximum size of the partition cache in bytes
+        cache_horizon: partitions ending later than now - cache_horizon
+                   (seconds) are not cached
+        cache_partition: length of a cache partition in seconds
+        result_cache_size: maximum size in bytes of the in process cache
+                   of decoded results (see :mod:`bact_archiver.result_cache`).
+                   0 disables it.
+        result_cache_horizon: windows ending later than now -
+                   result_cache_horizon (seconds) are not cached
+        decode_threads: number of threads decoding a response. If given,
+                   :meth:`bact_archiver.carchiver.Archiver.getData` reads
+                   the complete response and decodes it in parallel
+                   instead of decoding it while reading. Responses
+                   decoded from a buffer use
+                   :data:`bact_archiver.carchiver.decode_threads` if not
+                   given.
+
     Retrieval path can be url.
     If base_url is not given, it is assumed that the retrieval path
     and management path contain the server path too.
     management_port can be only used if a base_url is given.
+
+    Values read from the configuration file are strings. These are
+    converted to the required type here.
     """
     def __init__(self, name=None, base_url=None, retrieval_path='retrieval',
                  management_path='mgmt', management_port=17665,
-                 description=""):
+                 description="", transport='pooled', pool_size=4,
+                 timeout=None, max_workers=4, cache_dir=None,
+                 cache_size=1 << 30, cache_horizon=86400,
+                 cache_partition=86400, result_cache_size=256 << 20,
+                 result_cache_horizon=3600, decode_threads=None):
         """
         """
         self.name = name
@@ -43,12 +79,30 @@ class ArchiverConfiguration(ArchiverConfigurationInterface):
         self.management_path = management_path
         self.management_port = management_port
         self.description = description
+        self.transport = transport
+        self.pool_size = int(pool_size)
+        self.timeout = float(timeout) if timeout is not None else None
+        self.max_workers = int(max_workers)
+        self.cache_dir = cache_dir
+        self.cache_size = int(cache_size)
+        self.cache_horizon = float(cache_horizon)
+        self.cache_partition = float(cache_partition)
+        self.result_cache_size = int(result_cache_size)
+        self.result_cache_horizon = float(result_cache_horizon)
+        self.decode_threads = (int(decode_threads)
+                               if decode_threads is not None else None)
 
     def __repr__(self):
         args_text = "base_url={}, ".format(self.base_url)
         args_text += "retrieval_path={}, ".format(self.retrieval_path)
         args_text += "management_port={}, ".format(self.management_port)
         args_text += "management_path={}, ".format(self.management_path)
+        args_text += "transport={}, ".format(self.transport)
+        args_text += "pool_size={}, ".format(self.pool_size)
+        args_text += "timeout={}, ".format(self.timeout)
+        args_text += "max_workers={}, ".format(self.max_workers)
+        args_text += "cache_dir={}, ".format(self.cache_dir)
+        args_text += "decode_threads={}, ".format(self.decode_threads)
         txt = "{}({}, {})".format(self.__class__.__name__, self.name,
                                   args_text)
         return txt
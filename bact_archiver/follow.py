@@ -0,0 +1,202 @@
+"""Follow variables: request only the samples added since the last poll
+
+Example::
+
+    follower = archiver.follow(['TOPUPCC:rdCur', 'MDIZ2T5G:lt10'],
+                               window=datetime.timedelta(hours=1))
+    while True:
+        follower.poll()
+        times, values = follower.window('TOPUPCC:rdCur')
+        plot(times, values)
+        time.sleep(5)
+
+The first poll requests the whole window, later ones only the time since
+the last sample of each variable. The samples are kept in a
+:class:`RingBuffer` per variable.
+"""
+import datetime
+import logging
+
+import numpy as np
+
+from .utils import to_epoch_ns
+
+logger = logging.getLogger('bact-archiver')
+
+_utc = datetime.timezone.utc
+
+
+class RingBuffer:
+    '''The last capacity samples: times and values
+
+    Every sample is stored twice, at i and i + capacity of arrays twice
+    as long. Thus the samples are always found in time order in one
+    contiguous part of the arrays and :meth:`view` does not copy.
+    Waveforms keep their elements as second axis.
+    '''
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError('capacity has to be positive')
+        self.capacity = capacity
+        self.size = 0
+        # next slot to write
+        self.head = 0
+        self.times = np.empty(2 * capacity, dtype=np.int64)
+        self.values = None
+
+    def __len__(self):
+        return self.size
+
+    def _ensure(self, values):
+        shape = (2 * self.capacity,) + values.shape[1:]
+        if self.values is None:
+            self.values = np.empty(shape, dtype=values.dtype)
+        elif self.values.shape != shape:
+            raise ValueError('samples of shape {} do not match {}'.format(
+                values.shape[1:], self.values.shape[1:]))
+        else:
+            # e.g. strings longer than the ones before
+            dtype = np.promote_types(self.values.dtype, values.dtype)
+            if dtype != self.values.dtype:
+                self.values = self.values.astype(dtype)
+
+    def append(self, times, values):
+        '''Add samples; the oldest ones are dropped if full
+        '''
+        n = len(times)
+        if n == 0:
+            return
+        self._ensure(values)
+        if n > self.capacity:
+            times = times[-self.capacity:]
+            values = values[-self.capacity:]
+            n = self.capacity
+        slots = (self.head + np.arange(n)) % self.capacity
+        for offset in (0, self.capacity):
+            self.times[slots + offset] = times
+            self.values[slots + offset] = values
+        self.head = (self.head + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+
+    def view(self):
+        '''Times and values of the samples in time order
+
+        The arrays are views of the buffer: they are overwritten by the
+        next :meth:`append`. Copy them to keep them longer.
+        '''
+        if self.values is None:
+            return self.times[:0], np.empty(0)
+        stop = self.head + self.capacity
+        start = stop - self.size
+        return self.times[start:stop], self.values[start:stop]
+
+
+class Follower:
+    '''Keep the recent samples of several variables up to date
+
+    Args:
+        archiver: a :class:`bact_archiver.carchiver.Archiver`
+        pvnames:  variables to follow
+        window:   time span of interest, a :class:`datetime.timedelta`
+        capacity: number of samples kept per variable
+
+    Use :meth:`bact_archiver.carchiver.Archiver.follow` to create it.
+    '''
+    def __init__(self, archiver, pvnames, *, window, capacity=100000):
+        self.archiver = archiver
+        self.pvnames = list(pvnames)
+        self.window_length = window
+        self.buffers = {pvname: RingBuffer(capacity)
+                        for pvname in self.pvnames}
+        # time of the last sample received per variable (nano seconds)
+        self.last = {pvname: None for pvname in self.pvnames}
+        self.now = None
+        self.errors = {}
+
+    def __repr__(self):
+        return '{}({} pvs, window={})'.format(
+            self.__class__.__name__, len(self.pvnames), self.window_length)
+
+    def _start(self, pvname, now):
+        last = self.last[pvname]
+        if last is None:
+            return now - self.window_length
+        # requests are sent with a resolution of seconds: samples up to
+        # last are requested again and dropped
+        return datetime.datetime.fromtimestamp(last // 10**9, _utc)
+
+    def poll(self, now=None):
+        '''Request the new samples of all variables
+
+        Args:
+            now: end of the requests (default: the current time)
+
+        Returns:
+            dict, dict: number of new samples by pvname, exception by
+            pvname. Failing variables are tried again at the next poll.
+
+        The variables are requested in parallel on the executor of the
+        archiver. The result cache is not used.
+        '''
+        if now is None:
+            now = datetime.datetime.now(_utc)
+        futures = {
+            pvname: self.archiver.executor.submit(
+                self.archiver._getDecodedWindow, pvname,
+                t0=self._start(pvname, now), t1=now, use_cache=False)
+            for pvname in self.pvnames
+        }
+        counts = {}
+        errors = {}
+        for pvname, future in futures.items():
+            try:
+                decoded, _, _ = future.result()
+            except Exception as exc:
+                logger.error('Failed to follow pv %s: reason %s', pvname, exc)
+                errors[pvname] = exc
+                continue
+            counts[pvname] = self._append(pvname, *decoded[:2])
+        self.now = now
+        self.errors = errors
+        return counts, errors
+
+    def _append(self, pvname, res, times):
+        '''Append the decoded chunks after the last known sample
+        '''
+        last = self.last[pvname]
+        start = 0
+        if last is not None and len(res):
+            start = int(np.searchsorted(times, last, side='right'))
+        count = 0
+        offset = 0
+        for values, _, _ in res:
+            n = len(values)
+            begin = max(start - offset, 0)
+            if begin < n:
+                self.buffers[pvname].append(times[offset + begin:offset + n],
+                                            values[begin:])
+                count += n - begin
+            offset += n
+        if count:
+            self.last[pvname] = int(times[-1])
+        return count
+
+    def data(self, pvname):
+        '''All samples kept for pvname: times (nano seconds since the
+        epoch) and values, see :meth:`RingBuffer.view`
+        '''
+        return self.buffers[pvname].view()
+
+    def window(self, pvname):
+        '''Samples of pvname within the window before the last poll
+
+        The last sample before the window is included, as done by the
+        appliance. Views of the buffer are returned, see
+        :meth:`RingBuffer.view`.
+        '''
+        times, values = self.data(pvname)
+        if self.now is None:
+            return times, values
+        start = to_epoch_ns(self.now - self.window_length)
+        i = max(int(np.searchsorted(times, start, side='right')) - 1, 0)
+        return times[i:], values[i:]
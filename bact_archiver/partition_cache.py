@@ -0,0 +1,226 @@
+"""Persistent cache of raw PB/HTTP data on disk
+
+Data of a pv are stored per time partition (e.g. a day) as returned
+by the appliance. A request is answered by combining the cached
+partitions with requests for the missing ones.
+
+Partitions ending before "now - horizon" are considered immutable:
+these are stored and never fetched again. More recent partitions
+are always requested from the appliance and are not stored.
+
+The total size of the cache is limited. If exceeded, the least recently
+used partition files are removed. Several processes can share the
+same cache directory: files are written atomically and readers
+tolerate files removed by other processes. Each process keeps a running
+total of the size; the directory is only scanned when this total
+exceeds the limit (and once to start with).
+
+Configure it in `archiver.cfg` using the keys `cache_dir`, `cache_size`
+(bytes), `cache_horizon` (seconds) and `cache_partition` (seconds).
+"""
+import contextlib
+import datetime
+import logging
+import os
+import tempfile
+import threading
+from urllib.parse import quote
+
+try:
+    import fcntl
+except ImportError:
+    # e.g. windows: eviction is then not serialised between processes
+    fcntl = None
+
+logger = logging.getLogger('bact-archiver')
+
+_utc = datetime.timezone.utc
+_epoch = datetime.datetime(1970, 1, 1, tzinfo=_utc)
+
+#: format of the partition start used in the file names
+_partition_fmt = '%Y%m%dT%H%M%S'
+
+
+class PartitionCache:
+    '''Raw PB/HTTP data of pvs per fixed time partition on disk
+
+    Args:
+        directory: directory to store the data in
+        max_bytes: maximum total size of the cached files
+        horizon:   partitions ending later than now - horizon are
+                   not cached (:class:`datetime.timedelta`)
+        partition: length of a partition (:class:`datetime.timedelta`).
+                   Partitions are aligned to the unix epoch; thus daily
+                   partitions start at midnight UTC.
+    '''
+    def __init__(self, directory, *, max_bytes=1 << 30,
+                 horizon=datetime.timedelta(days=1),
+                 partition=datetime.timedelta(days=1)):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.horizon = horizon
+        self.partition = partition
+        os.makedirs(directory, exist_ok=True)
+        # running total of the bytes cached, None until first needed
+        self._total = None
+        self._total_lock = threading.Lock()
+
+    def __repr__(self):
+        txt = '{}({}, max_bytes={}, horizon={}, partition={})'
+        return txt.format(self.__class__.__name__, self.directory,
+                          self.max_bytes, self.horizon, self.partition)
+
+    def partitions(self, t0: datetime.datetime, t1: datetime.datetime):
+        '''Partitions covering the time span t0 to t1
+
+        Returns:
+            list of tuples (start, end) of timezone aware datetimes in UTC
+        '''
+        step = self.partition
+        n = (t0.astimezone(_utc) - _epoch) // step
+        start = _epoch + n * step
+        result = []
+        while True:
+            end = start + step
+            result.append((start, end))
+            if end >= t1:
+                return result
+            start = end
+
+    def is_immutable(self, end: datetime.datetime, now=None) -> bool:
+        '''Data of a partition ending at end will not change anymore
+        '''
+        if now is None:
+            now = datetime.datetime.now(_utc)
+        return end <= now - self.horizon
+
+    def _path(self, pvname, start):
+        dirname = os.path.join(self.directory, quote(pvname, safe=''))
+        fname = start.astimezone(_utc).strftime(_partition_fmt) + '.pb'
+        return dirname, os.path.join(dirname, fname)
+
+    def get(self, pvname: str, start: datetime.datetime):
+        '''Raw data of the partition starting at start or None if not cached
+        '''
+        dirname, path = self._path(pvname, start)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        # modification time marks the last use for the eviction
+        with contextlib.suppress(FileNotFoundError):
+            os.utime(path)
+        return data
+
+    def put(self, pvname: str, start: datetime.datetime, data: bytes):
+        '''Store the raw data of the partition starting at start
+        '''
+        dirname, path = self._path(pvname, start)
+        os.makedirs(dirname, exist_ok=True)
+        try:
+            replaced = os.stat(path).st_size
+        except FileNotFoundError:
+            replaced = 0
+        # write to a temporary file first: readers never see partial data
+        fd, tmp = tempfile.mkstemp(dir=dirname, prefix='.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp)
+            raise
+        with self._total_lock:
+            if self._total is None:
+                self._total = self.size()
+            else:
+                self._total += len(data) - replaced
+            exceeded = self._total > self.max_bytes
+        if exceeded:
+            self.evict()
+
+    def _files(self):
+        '''All cached partition files as tuples (mtime, size, path)
+        '''
+        files = []
+        for dirpath, dirnames, filenames in os.walk(self.directory):
+            for fname in filenames:
+                if fname.startswith('.') or not fname.endswith('.pb'):
+                    continue
+                path = os.path.join(dirpath, fname)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+        return files
+
+    @contextlib.contextmanager
+    def _lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.directory, '.lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def size(self) -> int:
+        '''Total size of the cached files in bytes
+        '''
+        return sum(size for _, size, _ in self._files())
+
+    def evict(self):
+        '''Remove least recently used partitions until below max_bytes
+        '''
+        with self._lock():
+            files = self._files()
+            total = sum(size for _, size, _ in files)
+            if total > self.max_bytes:
+                files.sort()
+                for mtime, size, path in files:
+                    if total <= self.max_bytes:
+                        break
+                    logger.debug('Evicting %s from partition cache', path)
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(path)
+                    total -= size
+        # also picks up the files written by other processes
+        with self._total_lock:
+            self._total = total
+
+    def clear(self):
+        '''Remove all cached partitions
+        '''
+        with self._lock():
+            for _, _, path in self._files():
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(path)
+        with self._total_lock:
+            self._total = 0
+
+
+def create_partition_cache(config):
+    '''Create the partition cache described by an archiver configuration
+
+    Returns:
+        None if the configuration does not define `cache_dir`
+    '''
+    directory = getattr(config, 'cache_dir', None)
+    if not directory:
+        return None
+    kws = {}
+    for key, name, convert in (
+            ('max_bytes', 'cache_size', int),
+            ('horizon', 'cache_horizon',
+             lambda v: datetime.timedelta(seconds=float(v))),
+            ('partition', 'cache_partition',
+             lambda v: datetime.timedelta(seconds=float(v)))):
+        value = getattr(config, name, None)
+        if value is not None:
+            kws[key] = convert(value)
+    return PartitionCache(os.path.expanduser(directory), **kws)
@@ -0,0 +1,220 @@
+"""Offline access to PB files
+
+Reads the raw PB/HTTP data saved by
+:meth:`bact_archiver.archiver.ArchiverBasis.saveBPRaw` as well as the
+partition files of the PB storage (STS, MTS, LTS) of an archiver
+appliance: there each file holds one chunk, a header line followed by
+one line per sample.
+
+The files are memory mapped and the samples are decoded by the kernels
+of :mod:`bact_archiver.epics_event` directly from the mapped memory.
+Time windows are found by a binary search over the byte offsets of the
+samples: a line starts after any new line character, so only the times
+of a few samples have to be read to find the window, whatever the size
+of the file.
+
+Example::
+
+    with PBFileReader('/arch/lts/TOPUPCC') as reader:
+        df = reader.getData('TOPUPCC:rdCur', t0=t0, t1=t1)
+"""
+import logging
+import mmap
+import os
+
+from .carchiver import _collect_chunks, _format_data, _payload_offsets
+from .epics_event import read_chunk, sample_time
+from .utils import to_epoch_ns
+
+logger = logging.getLogger('bact-archiver')
+
+
+class _Chunk:
+    '''Samples of one chunk: data[begin:end] of the mapped file
+    '''
+    __slots__ = ['fname', 'data', 'mem', 'header', 'begin', 'end']
+
+    def __init__(self, fname, data, mem, header, begin, end):
+        self.fname = fname
+        self.data = data
+        self.mem = mem
+        self.header = header
+        self.begin = begin
+        self.end = end
+
+    def line_start(self, pos):
+        '''Start of the first line starting at or after pos
+        '''
+        if pos <= self.begin:
+            return self.begin
+        eol = self.data.find(b'\n', pos - 1, self.end)
+        return self.end if eol < 0 else eol + 1
+
+    def line_end(self, start):
+        eol = self.data.find(b'\n', start, self.end)
+        return self.end if eol < 0 else eol
+
+    def time(self, start):
+        '''Time in nano seconds since the epoch of the line at start
+        '''
+        return sample_time(self.mem[start:self.line_end(start)], self.header)
+
+    def search(self, t):
+        '''Start of the first line with a time of at least t
+
+        Returns:
+            end if all samples are earlier
+        '''
+        best = self.end
+        lo, hi = self.begin, self.end
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = self.line_start(mid)
+            if start >= hi:
+                # no line starts in mid..hi
+                hi = mid
+            elif self.time(start) >= t:
+                best = hi = start
+            else:
+                lo = self.line_end(start) + 1
+        return best
+
+    def decode(self, t0_ns=None, t1_ns=None, with_info=False,
+               previous=False):
+        '''Decoded samples in t0_ns..t1_ns (both included)
+
+        If previous is True, the last sample before t0_ns is included
+        too (see :func:`bact_archiver.epics_event.window_lines`).
+
+        Returns:
+            None if no sample is in the window, otherwise a tuple
+            (header, values, secs, nanos, times[, info])
+        '''
+        start = self.begin if t0_ns is None else self.search(t0_ns)
+        if previous and start > self.begin:
+            # step back to the start of the line before
+            eol = self.data.rfind(b'\n', self.begin, start - 1)
+            start = self.begin if eol < 0 else eol + 1
+        stop = self.end if t1_ns is None else self.search(t1_ns + 1)
+        if stop < self.end:
+            # drop the new line character
+            stop -= 1
+        if stop <= start:
+            return None
+        decoded = read_chunk(self.mem[start:stop], self.header,
+                             with_times=True, with_info=with_info)
+        return (self.header,) + decoded
+
+
+class PBFileReader:
+    '''Read PB files using memory maps
+
+    Args:
+        path: a PB file or a directory. All files ending on `.pb` found
+              below a directory are read, e.g. the partitions of the PB
+              storage of an appliance.
+
+    The files stay mapped until :meth:`close` is called.
+    '''
+    def __init__(self, path):
+        self.path = path
+        if os.path.isdir(path):
+            files = []
+            for dirpath, _, fnames in os.walk(path):
+                files.extend(os.path.join(dirpath, fname) for fname in fnames
+                             if fname.endswith('.pb'))
+            self.files = sorted(files)
+        else:
+            self.files = [path]
+        self._maps = []
+        self._chunks = None
+
+    def __repr__(self):
+        return '{}({!r})'.format(self.__class__.__name__, self.path)
+
+    def _index(self):
+        '''Chunks of all files, mapping the files on first use
+        '''
+        if self._chunks is not None:
+            return self._chunks
+        chunks = []
+        for fname in self.files:
+            with open(fname, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    logger.debug('Skipping empty PB file %s', fname)
+                    continue
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            mem = memoryview(data).cast('c')
+            self._maps.append((data, mem))
+            chunks.extend(_Chunk(fname, data, mem, header, begin, end)
+                          for header, begin, end in _payload_offsets(data))
+        # partitions of different files are not necessarily in name order
+        chunks.sort(key=lambda chunk: chunk.time(chunk.begin))
+        self._chunks = chunks
+        return chunks
+
+    def pvnames(self):
+        '''Names of the variables found in the files
+        '''
+        return sorted({chunk.header.pvname for chunk in self._index()})
+
+    def getData(self, pvname=None, *, t0=None, t1=None, with_info=False,
+                **kws):
+        '''Data of a single variable in the time window t0..t1
+
+        Args:
+            pvname: variable to read; can be omitted if the files contain
+                    a single variable
+            t0:     start time (:class:`datetime.datetime`, naive times
+                    are UTC). Default: the first sample. As the
+                    appliance does, the last sample before t0 is
+                    included.
+            t1:     end time (included). Default: the last sample
+            with_info: see :func:`bact_archiver.carchiver.get_data`
+
+        The other arguments are the ones of
+        :func:`bact_archiver.carchiver.get_data`.
+        '''
+        chunks = self._index()
+        if pvname is None:
+            pvnames = self.pvnames()
+            if len(pvnames) > 1:
+                raise ValueError('Files of several pvs found: {}'.format(
+                    ', '.join(pvnames)))
+        else:
+            chunks = [chunk for chunk in chunks
+                      if chunk.header.pvname == pvname]
+        t0_ns = to_epoch_ns(t0) if t0 is not None else None
+        t1_ns = to_epoch_ns(t1) if t1 is not None else None
+
+        # as the appliance does, the last sample before t0 is included:
+        # it is found in the last chunk starting before t0
+        before = None
+        if t0_ns is not None:
+            for k, chunk in enumerate(chunks):
+                if chunk.time(chunk.begin) < t0_ns:
+                    before = k
+
+        decoded = []
+        for k, chunk in enumerate(chunks):
+            res = chunk.decode(t0_ns, t1_ns, with_info=with_info,
+                               previous=k == before)
+            if res is not None:
+                decoded.append(res)
+        return _format_data(*_collect_chunks(decoded, with_info=with_info),
+                            t_start=t0, t_stop=t1, **kws)
+
+    def close(self):
+        '''Unmap the files
+        '''
+        self._chunks = None
+        maps, self._maps = self._maps, []
+        for data, mem in maps:
+            mem.release()
+            data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
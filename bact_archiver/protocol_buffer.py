@@ -1,23 +1,40 @@
-from . import epics_event_pb2 as proto
+"""Description of the EPICS types used by the archiver appliance
+
+The python protobuf classes (:mod:`bact_archiver.epics_event_pb2`) are
+only imported when :data:`decoder` is accessed; the compiled decoder does
+not need them.
+"""
+
+
+def _decoder():
+    from . import epics_event_pb2 as proto
+    return {
+        0: proto.ScalarString,
+        1: proto.ScalarShort,
+        2: proto.ScalarFloat,
+        3: proto.ScalarEnum,
+        4: proto.ScalarByte,
+        5: proto.ScalarInt,
+        6: proto.ScalarDouble,
+        7: proto.VectorString,
+        8: proto.VectorShort,
+        9: proto.VectorFloat,
+        10: proto.VectorEnum,
+        11: proto.VectorChar,
+        12: proto.VectorInt,
+        13: proto.VectorDouble,
+        14: proto.V4GenericBytes,
+    }
+
+
+def __getattr__(name):
+    #: select protocol buffer decoder for EPICS type
+    if name == 'decoder':
+        global decoder
+        decoder = _decoder()
+        return decoder
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
 
-#: select protocol buffer decoder for EPICS type
-decoder = {
-    0: proto.ScalarString,
-    1: proto.ScalarShort,
-    2: proto.ScalarFloat,
-    3: proto.ScalarEnum,
-    4: proto.ScalarByte,
-    5: proto.ScalarInt,
-    6: proto.ScalarDouble,
-    7: proto.VectorString,
-    8: proto.VectorShort,
-    9: proto.VectorFloat,
-    10: proto.VectorEnum,
-    11: proto.VectorChar,
-    12: proto.VectorInt,
-    13: proto.VectorDouble,
-    14: proto.V4GenericBytes,
-}
 
 #: translate EPICS types to numpy types
 dtypes = {
@@ -37,6 +54,29 @@ dtypes = {
     13: "f8",
 }
 
+#: numpy types of the values returned by
+#: :func:`bact_archiver.epics_event.read_chunk`
+#:
+#: The width of the strings is the one of EPICS strings; the decoder uses
+#: the width of the longest string found.
+decoder_dtypes = {
+    0: "S40",
+    1: "i2",
+    2: "f4",
+    3: "i4",
+    4: "i1",
+    5: "i4",
+    6: "f8",
+    7: "S40",
+    8: "i2",
+    9: "f4",
+    10: "i4",
+    11: "i1",
+    12: "i4",
+    13: "f8",
+    14: "O",
+}
+
 dsize = {
     0: 40,
     1: 2,
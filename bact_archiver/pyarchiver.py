@@ -9,7 +9,7 @@ from .archiver import ArchiverBasis
 from .protocol_buffer import Chunk, dtypes as _dtypes, decoder as _decoder
 from . import epics_event_pb2 as proto
 
-from urllib.request import urlopen, quote
+from urllib.request import quote
 import numpy as np
 import logging
 
@@ -18,12 +18,10 @@ logger = logging.getLogger('bact_archiver')
 
 class Archiver(ArchiverBasis):
     def _getData(self, pvname, *, t0, t1, **kwargs):
-        fmt = self.data_url_fmt
-        url = fmt.format(format='raw', var=quote(pvname),
-                         t0=quote(t0), t1=quote(t1))
-        f = urlopen(url)
+        url = self._data_url(quote(pvname), t0=t0, t1=t1)
+        raw = self.transport.get(url)
         try:
-            data = get_data(f.read())
+            data = get_data(raw)
         except Exception as exc:
             fmt = 'Data retrieval using url {} raised exception {}'
             logger.error(fmt.format(url, exc))
@@ -53,8 +51,10 @@ def get_data(data):
                 event.ParseFromString(
                     inp.replace(b'\x1b\x02', b'\x0a').replace(
                         b'\x1b\x03', b'\x0d').replace(b'\x1b\x01', b'\x1b'))
-                return [v
-                        for v in event.val], event.secondsintoyear, event.nano
+                val = event.val
+                if isinstance(val, bytes):
+                    val = np.frombuffer(val, dtype='i1')
+                return [v for v in val], event.secondsintoyear, event.nano
 
             # Not sure if the same applied for scalars. So for now I put it here
             if len(lines) == 0:
@@ -74,7 +74,11 @@ def get_data(data):
                 event.ParseFromString(
                     inp.replace(b'\x1b\x02', b'\x0a').replace(
                         b'\x1b\x03', b'\x0d').replace(b'\x1b\x01', b'\x1b'))
-                return event.val, event.secondsintoyear, event.nano
+                val = event.val
+                if header.type == 4:
+                    # first byte as signed character
+                    val = np.frombuffer(val[:1] or b'\0', dtype='i1')[0]
+                return val, event.secondsintoyear, event.nano
 
             chunk.values = np.array(
                 [parse(l) for l in lines],
@@ -0,0 +1,180 @@
+"""In process cache of decoded results
+
+Replaces caching by :func:`functools.lru_cache`, which hashed the
+complete response and kept a fixed number of entries regardless of their
+size. Entries are keyed on the request: (archiver, pv, operator, t0, t1,
+kind), where kind tells decoded data from raw bytes.
+The cache is bounded by the total number of bytes of the cached arrays.
+
+Results of windows reaching into the live "now" are not cached:
+the appliance can still add data to them.
+"""
+import collections
+import datetime
+import logging
+import threading
+
+import numpy as np
+
+logger = logging.getLogger('bact-archiver')
+
+_utc = datetime.timezone.utc
+
+#: statistics of a :class:`ResultCache`
+CacheStatistics = collections.namedtuple(
+    'CacheStatistics', ['hits', 'misses', 'evictions', 'entries', 'nbytes'])
+
+
+def _nbytes(value):
+    '''Memory used by the arrays and buffers in value
+    '''
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(v) for v in value)
+    return 0
+
+
+def _copy(value, *, writeable):
+    '''Copy of the arrays in value, read only unless writeable
+
+    The cache keeps read only copies of the stored results and hands out
+    writeable copies: neither the callers nor the cache see the changes
+    of the other.
+    '''
+    if isinstance(value, np.ndarray):
+        value = value.copy()
+        value.flags.writeable = writeable
+        return value
+    if isinstance(value, tuple) and hasattr(value, '_fields'):
+        # named tuples, e.g. SampleInfo
+        return type(value)(*[_copy(v, writeable=writeable) for v in value])
+    if isinstance(value, (tuple, list)):
+        return type(value)(_copy(v, writeable=writeable) for v in value)
+    return value
+
+
+class ResultCache:
+    '''Least recently used cache bounded by the size of its entries
+
+    Args:
+        max_bytes: maximum total size of the cached entries
+        horizon:   windows ending later than now - horizon are considered
+                   live and not cached (:class:`datetime.timedelta`)
+
+    Safe to use from several threads.
+    '''
+    def __init__(self, *, max_bytes=256 << 20,
+                 horizon=datetime.timedelta(hours=1)):
+        self.max_bytes = max_bytes
+        self.horizon = horizon
+        self._entries = collections.OrderedDict()
+        self._nbytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        txt = '{}(max_bytes={}, horizon={})'
+        return txt.format(self.__class__.__name__, self.max_bytes,
+                          self.horizon)
+
+    def is_live(self, t1: datetime.datetime, now=None) -> bool:
+        '''True if a window ending at t1 can still get new data
+
+        Naive datetimes are local time, as for the windows of
+        :meth:`bact_archiver.archiver.ArchiverBasis.getData`
+        '''
+        t1 = t1.astimezone(_utc)
+        if now is None:
+            now = datetime.datetime.now(_utc)
+        return t1 > now - self.horizon
+
+    def get(self, key):
+        '''Copy of the cached value or None
+        '''
+        with self._lock:
+            try:
+                value, nbytes = self._entries[key]
+            except KeyError:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+        return _copy(value, writeable=True)
+
+    def put(self, key, value):
+        '''Store a copy of value; evicts least recently used entries if
+        required
+        '''
+        nbytes = _nbytes(value)
+        if nbytes > self.max_bytes:
+            logger.debug('Result of %s too large for the cache: %d bytes',
+                         key, nbytes)
+            return
+        value = _copy(value, writeable=False)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._nbytes -= old[1]
+            self._entries[key] = value, nbytes
+            self._nbytes += nbytes
+            while self._nbytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._nbytes -= evicted
+                self._evictions += 1
+
+    def invalidate(self, pvname=None, *, since=None):
+        '''Remove entries
+
+        Args:
+            pvname: only entries of this pv (default: all pvs)
+            since:  only entries of windows ending after since
+                    (:class:`datetime.datetime` or string as used in the key).
+                    Use it to drop windows reaching into the live "now".
+
+        Returns:
+            number of removed entries
+        '''
+        if isinstance(since, datetime.datetime):
+            from .archiver import convert_datetime_to_timestamp
+            since = convert_datetime_to_timestamp(since.astimezone(_utc))
+        with self._lock:
+            keys = [
+                key for key in self._entries
+                if (pvname is None or key[1] == pvname)
+                and (since is None or key[4] > since)
+            ]
+            for key in keys:
+                _, nbytes = self._entries.pop(key)
+                self._nbytes -= nbytes
+        return len(keys)
+
+    def clear(self):
+        '''Remove all entries; statistics are kept
+        '''
+        self.invalidate()
+
+    def stats(self) -> CacheStatistics:
+        '''Hits, misses, evictions, number of entries and their size
+        '''
+        with self._lock:
+            return CacheStatistics(self._hits, self._misses, self._evictions,
+                                   len(self._entries), self._nbytes)
+
+
+def create_result_cache(config):
+    '''Create the result cache described by an archiver configuration
+
+    Returns:
+        None if `result_cache_size` is 0
+    '''
+    max_bytes = getattr(config, 'result_cache_size', 256 << 20)
+    if not max_bytes:
+        return None
+    horizon = getattr(config, 'result_cache_horizon', 3600)
+    return ResultCache(max_bytes=max_bytes,
+                       horizon=datetime.timedelta(seconds=horizon))
@@ -0,0 +1,153 @@
+"""Aggregate statistics of decoded samples
+
+Used by :meth:`bact_archiver.carchiver.Archiver.getStats`: the decoded
+pieces of a response are fed into :class:`StatsAccumulator` as they
+arrive. Count, mean and sum of squared deviations of each interval are
+merged piece by piece (the parallel variant of Welford's algorithm, see
+Chan, Golub and LeVeque 1979), so only the pieces and the statistics are
+held in memory, never all samples.
+
+Waveforms get statistics per element.
+"""
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from .utils import convert_epoch_ns
+
+_NS_PER_SECOND = 1000000000
+
+#: statistics computed by :class:`StatsAccumulator`
+stat_names = ('count', 'mean', 'std', 'min', 'max')
+
+
+def _interval_ns(interval):
+    if isinstance(interval, datetime.timedelta):
+        return interval // datetime.timedelta(microseconds=1) * 1000
+    return int(round(float(interval) * _NS_PER_SECOND))
+
+
+class StatsAccumulator:
+    '''Running count, mean, variance, minimum and maximum per interval
+
+    Args:
+        t_start, t_stop: window in nano seconds since the epoch (both
+                         included). Samples outside are ignored.
+        interval:        length of the intervals: seconds or a
+                         :class:`datetime.timedelta`. None for a single
+                         interval covering the window.
+
+    NaNs are not counted.
+    '''
+    def __init__(self, t_start, t_stop, interval=None):
+        if t_stop < t_start:
+            raise ValueError('t_stop before t_start')
+        self.t_start = t_start
+        self.t_stop = t_stop
+        if interval is None:
+            self.interval_ns = t_stop - t_start + 1
+        else:
+            self.interval_ns = _interval_ns(interval)
+            if self.interval_ns <= 0:
+                raise ValueError('interval has to be positive')
+        self.intervals = (t_stop - t_start) // self.interval_ns + 1
+        self.elements = None
+
+    def _allocate(self, elements):
+        shape = (self.intervals, elements)
+        self.elements = elements
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+        self.min = np.full(shape, np.inf)
+        self.max = np.full(shape, -np.inf)
+
+    def add(self, values, times):
+        '''Merge the samples values taken at times (sorted)
+        '''
+        if values.dtype.kind not in 'iuf':
+            raise ValueError('statistics require numeric values, not {}'
+                             .format(values.dtype))
+        values = values.reshape(len(values), int(np.prod(values.shape[1:])))
+        if self.elements is None:
+            self._allocate(values.shape[1])
+        elif values.shape[1] != self.elements:
+            raise ValueError('element count changed from {} to {}'.format(
+                self.elements, values.shape[1]))
+
+        i0, i1 = np.searchsorted(times, [self.t_start, self.t_stop + 1])
+        if i1 <= i0:
+            return
+        values = values[i0:i1].astype(np.float64)
+        bins = (times[i0:i1] - self.t_start) // self.interval_ns
+        # times are sorted: each interval is a run of samples
+        starts = np.flatnonzero(np.diff(bins)) + 1
+        starts = np.concatenate([[0], starts])
+        idx = bins[starts]
+
+        valid = ~np.isnan(values)
+        n = np.add.reduceat(valid, starts, axis=0).astype(np.int64)
+        total = np.add.reduceat(np.where(valid, values, 0), starts, axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = total / n
+        counts = np.diff(np.append(starts, len(values)))
+        dev = np.where(valid, values - np.repeat(mean, counts, axis=0), 0)
+        m2 = np.add.reduceat(dev * dev, starts, axis=0)
+        vmin = np.minimum.reduceat(np.where(valid, values, np.inf), starts,
+                                   axis=0)
+        vmax = np.maximum.reduceat(np.where(valid, values, -np.inf), starts,
+                                   axis=0)
+
+        # merge with the statistics of the previous pieces
+        na = self.count[idx]
+        nt = na + n
+        with np.errstate(invalid='ignore', divide='ignore'):
+            delta = np.where(n > 0, mean - self.mean[idx], 0)
+            w = np.where(nt > 0, n / nt, 0)
+            self.mean[idx] += delta * w
+            self.m2[idx] += m2 + delta * delta * na * w
+        self.count[idx] = nt
+        np.minimum(self.min[idx], vmin, out=vmin)
+        np.maximum(self.max[idx], vmax, out=vmax)
+        self.min[idx] = vmin
+        self.max[idx] = vmax
+
+    def result(self, *, ddof=1, time_format='timestamp'):
+        '''Statistics as :class:`pandas.DataFrame`, one row per interval
+
+        The index is the start of the interval. The columns are
+        `stat_names`; for waveforms a :class:`pandas.MultiIndex` of
+        statistic and element. Intervals without samples have a count
+        of 0 and NaN otherwise.
+        '''
+        starts = self.t_start + np.arange(self.intervals) * self.interval_ns
+        if time_format == 'timestamp':
+            index = pd.Index(starts / 1e9, name='timestamp')
+        elif time_format == 'datetime':
+            index = convert_epoch_ns(starts)
+        else:
+            raise ValueError('Unknown time format: {}'.format(time_format))
+
+        if self.elements is None:
+            self._allocate(1)
+        count = self.count
+        empty = count == 0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std = np.sqrt(self.m2 / (count - ddof))
+        std[count <= ddof] = np.nan
+        stats = {
+            'count': count,
+            'mean': np.where(empty, np.nan, self.mean),
+            'std': std,
+            'min': np.where(empty, np.nan, self.min),
+            'max': np.where(empty, np.nan, self.max),
+        }
+        if self.elements == 1:
+            return pd.DataFrame({name: stats[name][:, 0]
+                                 for name in stat_names}, index=index)
+        columns = pd.MultiIndex.from_product(
+            [stat_names, range(self.elements)], names=['stat', 'element'])
+        data = np.concatenate([stats[name] for name in stat_names], axis=1)
+        df = pd.DataFrame(data, index=index, columns=columns)
+        return df.astype({('count', k): np.int64 for k in range(self.elements)})
@@ -0,0 +1,530 @@
+"""HTTP transport used by the archivers to talk to the appliance
+
+Each :class:`bact_archiver.archiver.ArchiverBasis` owns a transport.
+All requests of the package (data retrieval, bpl commands, raw dumps)
+are routed through it.
+
+Two transports are provided:
+
+    :class:`HTTPTransport`
+        keeps a pool of persistent (keep-alive) connections per host.
+        Subsequent requests to the same appliance reuse an already
+        established TCP (and TLS) connection. This is the default.
+
+    :class:`UrllibTransport`
+        opens a fresh connection for each request using
+        :func:`urllib.request.urlopen`, honouring the proxies configured
+        in the environment (`http_proxy`, `https_proxy`, `no_proxy`).
+
+Select the transport in `archiver.cfg` using the key `transport`
+(`pooled` or `urllib`); `pool_size` and `timeout` are passed on
+to the transport. :class:`HTTPTransport` does not support proxies: if
+the environment sends requests to the appliance through a proxy,
+:class:`UrllibTransport` is used instead.
+
+:class:`AsyncHTTPTransport` is the asyncio counterpart of
+:class:`HTTPTransport` used by :class:`bact_archiver.asyncarchiver.AsyncArchiver`.
+"""
+import asyncio
+import email.parser
+import http.client
+import logging
+import queue
+import ssl
+import threading
+from abc import ABCMeta, abstractmethod
+from urllib.error import HTTPError
+from urllib.parse import urljoin, urlsplit
+from urllib.request import getproxies, proxy_bypass, urlopen
+
+logger = logging.getLogger('bact-archiver')
+
+#: status codes which are followed by :class:`HTTPTransport`
+_redirect_codes = (301, 302, 303, 307, 308)
+
+#: errors indicating that the server closed an idle keep alive connection
+_stale_connection_errors = (http.client.RemoteDisconnected,
+                            http.client.BadStatusLine,
+                            ConnectionResetError, BrokenPipeError)
+
+
+class TransportInterface(metaclass=ABCMeta):
+    '''Transport interface definition
+    '''
+    @abstractmethod
+    def open(self, url: str):
+        '''Send a GET request to url
+
+        Returns:
+            a file like response object. Use it as context manager so
+            that the underlying connection is released when done.
+
+        Raises:
+            :class:`urllib.error.HTTPError` if the server does not
+            answer with status 200
+        '''
+
+    def get(self, url: str) -> bytes:
+        '''Send a GET request to url and return the complete body
+        '''
+        with self.open(url) as response:
+            return response.read()
+
+    def close(self):
+        '''Release all resources held by the transport
+        '''
+
+
+class UrllibTransport(TransportInterface):
+    '''One connection per request using :func:`urllib.request.urlopen`
+    '''
+    def __init__(self, *, timeout=None):
+        self.timeout = timeout
+
+    def open(self, url):
+        if self.timeout is None:
+            return urlopen(url)
+        return urlopen(url, timeout=self.timeout)
+
+    def __repr__(self):
+        return '{}(timeout={})'.format(self.__class__.__name__, self.timeout)
+
+
+class _PooledResponse:
+    '''File like wrapper returning the connection to its pool once done
+    '''
+    def __init__(self, response, connection, pool):
+        self._response = response
+        self._connection = connection
+        self._pool = pool
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+
+    def read(self, amt=None):
+        return self._response.read(amt)
+
+    def readinto(self, b):
+        return self._response.readinto(b)
+
+    def close(self):
+        if self._connection is None:
+            return
+        connection, self._connection = self._connection, None
+        response = self._response
+        # connection can only be reused if the body was consumed
+        # completely and the server intends to keep it open
+        reusable = response.isclosed() and not response.will_close
+        if not reusable:
+            response.close()
+            connection.close()
+            return
+        self._pool.release(connection)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _ConnectionPool:
+    '''Idle keep alive connections to a single host
+    '''
+    def __init__(self, *, scheme, host, port, maxsize, timeout):
+        if scheme == 'https':
+            self._cls = http.client.HTTPSConnection
+        elif scheme == 'http':
+            self._cls = http.client.HTTPConnection
+        else:
+            raise ValueError('Unsupported url scheme {}'.format(scheme))
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=maxsize)
+
+    def acquire(self):
+        '''Get an idle connection or create a new one
+
+        Returns:
+            connection, flag if the connection was reused
+        '''
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return self.connect(), False
+
+    def connect(self):
+        '''Create a new connection
+        '''
+        logger.debug('Opening new connection to %s:%s', self.host, self.port)
+        kws = {}
+        if self.timeout is not None:
+            kws['timeout'] = self.timeout
+        return self._cls(self.host, self.port, **kws)
+
+    def release(self, connection):
+        try:
+            self._idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def close(self):
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            connection.close()
+
+
+class HTTPTransport(TransportInterface):
+    '''Persistent connection pool per host with keep-alive
+
+    Args:
+        pool_size: maximum number of idle connections kept per host.
+                   More requests can be run concurrently; the surplus
+                   connections are closed when released.
+        timeout:   socket timeout in seconds (None: system default)
+        max_redirects: number of redirects to follow
+
+    Safe to use from several threads.
+    '''
+    def __init__(self, *, pool_size=4, timeout=None, max_redirects=5):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def _get_pool(self, scheme, netloc):
+        key = scheme, netloc
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                parts = urlsplit('{}://{}'.format(scheme, netloc))
+                pool = _ConnectionPool(scheme=scheme, host=parts.hostname,
+                                       port=parts.port, maxsize=self.pool_size,
+                                       timeout=self.timeout)
+                self._pools[key] = pool
+        return pool
+
+    @staticmethod
+    def _send(connection, path):
+        try:
+            connection.request('GET', path, headers={'Connection': 'keep-alive'})
+            return connection.getresponse()
+        except Exception:
+            connection.close()
+            raise
+
+    def _request(self, url):
+        parts = urlsplit(url)
+        pool = self._get_pool(parts.scheme, parts.netloc)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        connection, reused = pool.acquire()
+        try:
+            response = self._send(connection, path)
+        except _stale_connection_errors:
+            if not reused:
+                raise
+            # server closed the idle connection: retry once on a fresh one
+            logger.debug('Stale connection to %s, reconnecting', parts.netloc)
+            connection = pool.connect()
+            response = self._send(connection, path)
+        return _PooledResponse(response, connection, pool)
+
+    def open(self, url):
+        for _ in range(self.max_redirects + 1):
+            response = self._request(url)
+            if response.status == 200:
+                return response
+
+            # drain the body so that the connection can be reused
+            body = response.read()
+            response.close()
+            location = response.headers.get('Location')
+            if response.status in _redirect_codes and location:
+                url = urljoin(url, location)
+                logger.debug('Following redirect to %s', url)
+                continue
+            logger.debug('Request %s failed with status %s: %s',
+                         url, response.status, body[:200])
+            raise HTTPError(url, response.status, response.reason,
+                            response.headers, None)
+
+        raise HTTPError(url, response.status,
+                        'Too many redirects ({})'.format(self.max_redirects),
+                        response.headers, None)
+
+    def close(self):
+        with self._lock:
+            pools = list(self._pools.values())
+            self._pools.clear()
+        for pool in pools:
+            pool.close()
+
+    def __repr__(self):
+        txt = '{}(pool_size={}, timeout={})'
+        return txt.format(self.__class__.__name__, self.pool_size, self.timeout)
+
+
+class _AsyncResponse:
+    '''Status, headers and body of a response read by :class:`AsyncHTTPTransport`
+    '''
+    def __init__(self, *, status, reason, headers, body, will_close):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+        self.will_close = will_close
+
+
+class _AsyncConnection:
+    '''HTTP/1.1 connection on top of asyncio streams
+    '''
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    async def request(self, host, path):
+        request = (
+            'GET {} HTTP/1.1\r\n'
+            'Host: {}\r\n'
+            'Connection: keep-alive\r\n'
+            'Accept-Encoding: identity\r\n'
+            '\r\n'
+        ).format(path, host)
+        self.writer.write(request.encode('ascii'))
+        await self.writer.drain()
+        return await self._read_response()
+
+    async def _read_response(self):
+        reader = self.reader
+        line = await reader.readline()
+        if not line:
+            raise http.client.RemoteDisconnected(
+                'Remote end closed connection without response')
+        try:
+            version, status, reason = line.decode('iso-8859-1').split(None, 2)
+        except ValueError:
+            version, status = line.decode('iso-8859-1').split(None, 1)
+            reason = ''
+        status = int(status)
+        reason = reason.strip()
+
+        lines = []
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            lines.append(line.decode('iso-8859-1'))
+        headers = email.parser.Parser(_class=http.client.HTTPMessage).parsestr(
+            ''.join(lines))
+
+        will_close = (version != 'HTTP/1.1'
+                      or headers.get('Connection', '').lower() == 'close')
+        transfer_encoding = headers.get('Transfer-Encoding', '').lower()
+        length = headers.get('Content-Length')
+        if 'chunked' in transfer_encoding:
+            body = await self._read_chunked()
+        elif length is not None:
+            body = await reader.readexactly(int(length))
+        elif status in (204, 304) or 100 <= status < 200:
+            body = b''
+        else:
+            body = await reader.read()
+            will_close = True
+
+        return _AsyncResponse(status=status, reason=reason, headers=headers,
+                              body=body, will_close=will_close)
+
+    async def _read_chunked(self):
+        reader = self.reader
+        parts = []
+        while True:
+            line = await reader.readline()
+            size = int(line.split(b';', 1)[0].strip(), 16)
+            if size == 0:
+                break
+            parts.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+        # skip trailers
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+        return b''.join(parts)
+
+    def close(self):
+        self.writer.close()
+
+
+class AsyncHTTPTransport:
+    '''Non blocking HTTP transport with keep alive connections per host
+
+    Args:
+        pool_size: maximum number of idle connections kept per host
+        timeout:   timeout in seconds for a single request (None: no timeout)
+        limit:     maximum number of requests in flight at the same time
+        max_redirects: number of redirects to follow
+
+    All coroutines have to be run by the same event loop.
+    '''
+    def __init__(self, *, pool_size=4, timeout=None, limit=100,
+                 max_redirects=5):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.limit = limit
+        self.max_redirects = max_redirects
+        self._idle = {}
+        self._semaphore = None
+
+    async def _connect(self, scheme, host, port):
+        if scheme == 'https':
+            context = ssl.create_default_context()
+            reader, writer = await asyncio.open_connection(
+                host, port or 443, ssl=context)
+        elif scheme == 'http':
+            reader, writer = await asyncio.open_connection(host, port or 80)
+        else:
+            raise ValueError('Unsupported url scheme {}'.format(scheme))
+        logger.debug('Opened new connection to %s:%s', host, port)
+        return _AsyncConnection(reader, writer)
+
+    async def _request(self, url):
+        parts = urlsplit(url)
+        key = parts.scheme, parts.netloc
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        idle = self._idle.setdefault(key, [])
+        reused = bool(idle)
+        if reused:
+            connection = idle.pop()
+        else:
+            connection = await self._connect(parts.scheme, parts.hostname,
+                                             parts.port)
+        try:
+            response = await connection.request(parts.netloc, path)
+        except _stale_connection_errors + (asyncio.IncompleteReadError,):
+            connection.close()
+            if not reused:
+                raise
+            # server closed the idle connection: retry once on a fresh one
+            logger.debug('Stale connection to %s, reconnecting', parts.netloc)
+            connection = await self._connect(parts.scheme, parts.hostname,
+                                             parts.port)
+            try:
+                response = await connection.request(parts.netloc, path)
+            except BaseException:
+                connection.close()
+                raise
+        except BaseException:
+            # includes cancellation: the connection state is unknown
+            connection.close()
+            raise
+
+        if response.will_close or len(idle) >= self.pool_size:
+            connection.close()
+        else:
+            idle.append(connection)
+        return response
+
+    async def _get(self, url):
+        for _ in range(self.max_redirects + 1):
+            response = await self._request(url)
+            if response.status == 200:
+                return response.body
+
+            location = response.headers.get('Location')
+            if response.status in _redirect_codes and location:
+                url = urljoin(url, location)
+                logger.debug('Following redirect to %s', url)
+                continue
+            raise HTTPError(url, response.status, response.reason,
+                            response.headers, None)
+
+        raise HTTPError(url, response.status,
+                        'Too many redirects ({})'.format(self.max_redirects),
+                        response.headers, None)
+
+    async def get(self, url: str) -> bytes:
+        '''Send a GET request to url and return the complete body
+
+        Raises:
+            :class:`urllib.error.HTTPError` if the server does not
+            answer with status 200
+        '''
+        if self._semaphore is None:
+            # created here so that it is bound to the running loop
+            self._semaphore = asyncio.Semaphore(self.limit)
+        async with self._semaphore:
+            if self.timeout is None:
+                return await self._get(url)
+            return await asyncio.wait_for(self._get(url), self.timeout)
+
+    async def close(self):
+        '''Close all idle connections
+        '''
+        idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+    def __repr__(self):
+        txt = '{}(pool_size={}, timeout={}, limit={})'
+        return txt.format(self.__class__.__name__, self.pool_size,
+                          self.timeout, self.limit)
+
+
+#: transports selectable by the key `transport` in the configuration
+transports = {
+    'pooled': HTTPTransport,
+    'urllib': UrllibTransport,
+}
+
+
+def uses_proxy(url: str) -> bool:
+    '''True if urllib sends requests to url through a proxy
+
+    The proxies are the ones of the environment, see
+    :func:`urllib.request.getproxies` and :func:`urllib.request.proxy_bypass`.
+    '''
+    parts = urlsplit(url)
+    if parts.scheme not in getproxies():
+        return False
+    return not proxy_bypass(parts.netloc.rpartition('@')[2])
+
+
+def create_transport(config) -> TransportInterface:
+    '''Create the transport described by an archiver configuration
+
+    Configurations not providing the transport settings (e.g. ones
+    implemented by local packages) get a pooled transport with default
+    settings. If the appliance is reached through a proxy, a
+    :class:`UrllibTransport` is created instead of the pooled one.
+    '''
+    name = getattr(config, 'transport', 'pooled')
+    try:
+        cls = transports[name]
+    except KeyError:
+        txt = 'Unknown transport {}: known transports {}'.format(
+            name, list(transports.keys()))
+        logger.error(txt)
+        raise ValueError(txt)
+
+    url = getattr(config, 'retrieval_url', None)
+    if cls is HTTPTransport and url is not None and uses_proxy(url):
+        logger.warning('Requests to %s are sent through a proxy: using'
+                       ' the urllib transport instead of the pooled one', url)
+        cls = UrllibTransport
+
+    timeout = getattr(config, 'timeout', None)
+    if cls is UrllibTransport:
+        return cls(timeout=timeout)
+    return cls(pool_size=getattr(config, 'pool_size', 4), timeout=timeout)
@@ -1,16 +1,67 @@
 from typing import Sequence
 
 import dateutil
+import numpy as np
 import pandas as pd
 
+def year_start_ns(years: Sequence) -> np.ndarray:
+    """start of the given years (UTC) in nano seconds since the epoch
+
+    Vectorised: suitable for one year per chunk as well as per sample.
+    """
+    years = np.asarray(years, dtype=np.int64) - 1970
+    return years.astype("datetime64[Y]").astype("datetime64[ns]").view(np.int64)
+
+
+def epoch_ns(years: Sequence, secs: Sequence, nsecs: Sequence) -> np.ndarray:
+    """time given in years, secs (into the year) and nsecs as nano seconds
+    since the epoch
+    """
+    secs = np.asarray(secs, dtype=np.int64)
+    return year_start_ns(years) + secs * 1000000000 + np.asarray(nsecs)
+
+
 def convert_data_time(years: Sequence, secs: Sequence, nsecs: Sequence) -> pd.DatetimeIndex:
     """convert time given in years, secs and nsecs to DatetimeIndex
-    Todo:
-        use the function in the archiver
     """
-    df = pd.DataFrame(
-        {"year": years, "month": 1, "day": 1, "second": secs, "ns": nsecs}
-    )
-    dt = pd.to_datetime(df, utc=True)
-    dt = pd.DatetimeIndex(dt, name="datetime").tz_convert(dateutil.tz.tzlocal())
-    return dt
+    return convert_epoch_ns(epoch_ns(years, secs, nsecs))
+
+
+def convert_epoch_ns(times: np.ndarray) -> pd.DatetimeIndex:
+    """convert time given in nano seconds since the epoch to DatetimeIndex
+
+    The int64 array is viewed as datetime64[ns] without conversion;
+    attaching the time zone is a single vectorised pass.
+    """
+    times = np.asarray(times, dtype=np.int64)
+    dt = pd.DatetimeIndex(times.view("datetime64[ns]"), name="datetime",
+                          copy=False)
+    return dt.tz_localize("UTC").tz_convert(dateutil.tz.tzlocal())
+
+
+def to_epoch_ns(t) -> int:
+    """nano seconds since the epoch of t
+
+    t can be a :class:`datetime.datetime`, an ISO formatted string (as
+    sent to the appliance) or a :class:`numpy.datetime64`. Naive times
+    are taken as UTC, as done by the appliance.
+    """
+    t = pd.Timestamp(t)
+    if t.tzinfo is None:
+        t = t.tz_localize("UTC")
+    return t.value
+
+
+def pad_samples(values: np.ndarray, times: np.ndarray, t_start, t_stop):
+    """move the first sample to t_start and repeat the last one at t_stop
+
+    Returns new arrays (values, times); times in nano seconds since the
+    epoch. Only implemented for scalar values.
+    """
+    if t_start is None or t_stop is None:
+        raise ValueError("padding requires t_start and t_stop")
+    if np.ndim(values) != 1:
+        raise ValueError("padding not implemented for non-scalars")
+    times = np.append(times, to_epoch_ns(t_stop))
+    times[0] = to_epoch_ns(t_start)
+    return np.append(values, values[-1:]), times
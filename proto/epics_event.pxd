@@ -9,91 +9,242 @@ cdef extern from "google/protobuf/stubs/port.h" namespace "::google::protobuf":
      ctypedef int int32
      ctypedef int uint32
 
+cdef extern from "google/protobuf/repeated_field.h" namespace "::google::protobuf":
+    cdef cppclass RepeatedField[T] nogil:
+        int size()
+        const T* data()
+
 cdef extern from "epics_event.pb.h" namespace "EPICS":
     cdef enum PayloadType:
         pass
 
-    cdef cppclass FieldValue:
-        pass
+    cdef cppclass FieldValue nogil:
+        const string& name()
+        const string& val()
 
     cdef cppclass PayloadInfo nogil:
         PayloadInfo() except +
         bool ParseFromString(const string& data) except +
+        bool ParseFromArray(const void* data, int size) except +
         int32 year()
         PayloadType type()
         int32 elementcount()
-        string pvname()
+        const string& pvname()
         int32 headers_size()
-        FieldValue headers(int)
+        const FieldValue& headers(int)
 
     # LINAC1C:stGun
     cdef cppclass ScalarString nogil:
         ScalarString() except +
         bool ParseFromString(const string& data) except +
+        bool ParseFromArray(const void* data, int size) except +
         uint32 secondsintoyear()
         uint32 nano()
-        string val()
+        int32 severity()
+        int32 status()
+        uint32 repeatcount()
+        int fieldvalues_size()
+        const FieldValue& fieldvalues(int)
+        const string& val()
 
     # TOPUPCC:rdCur
     cdef cppclass ScalarDouble nogil:
         ScalarDouble() except +
         bool ParseFromString(const string& data) except +
+        bool ParseFromArray(const void* data, int size) except +
         uint32 secondsintoyear()
         uint32 nano()
-        float val()
+        int32 severity()
+        int32 status()
+        uint32 repeatcount()
+        int fieldvalues_size()
+        const FieldValue& fieldvalues(int)
+        double val()
 
     # TOPUPCC:numShots
     cdef cppclass ScalarInt nogil:
         ScalarInt() except +
         bool ParseFromString(const string& data) except +
+        bool ParseFromArray(const void* data, int size) except +
         uint32 secondsintoyear()
         uint32 nano()
+        int32 severity()
+        int32 status()
+        uint32 repeatcount()
+        int fieldvalues_size()
+        const FieldValue& fieldvalues(int)
         int32 val()
 
     # TOPUPCC:selTrgSR
     cdef cppclass ScalarEnum nogil:
         ScalarEnum() except +
         bool ParseFromString(const string& data) except +
+        bool ParseFromArray(const void* data, int size) except +
         uint32 secondsintoyear()
         uint32 nano()
+        int32 severity()
+        int32 status()
+        uint32 repeatcount()
+        int fieldvalues_size()
+        const FieldValue& fieldvalues(int)
         int32 val()
 
     # CUMZR:MBcurrent
     cdef cppclass VectorDouble nogil:
         VectorDouble() except +
         bool ParseFromString(const string& data) except +
+        bool ParseFromArray(const void* data, int size) except +
         uint32 secondsintoyear()
         uint32 nano()
-        float val(int)
+        int32 severity()
+        int32 status()
+        uint32 repeatcount()
+        int fieldvalues_size()
+        const FieldValue& fieldvalues(int)
+        double val(int)
+        const RepeatedField[double]& val()
 
     # BBQR:X:SRAM:MEAN
     cdef cppclass VectorFloat nogil:
         VectorFloat() except +
         bool ParseFromString(const string& data) except +
+        bool ParseFromArray(const void* data, int size) except +
         uint32 secondsintoyear()
         uint32 nano()
+        int32 severity()
+        int32 status()
+        uint32 repeatcount()
+        int fieldvalues_size()
+        const FieldValue& fieldvalues(int)
         float val(int)
+        const RepeatedField[float]& val()
 
     # BBQR:X:FB:MASK
     cdef cppclass VectorChar nogil:
         VectorChar() except +
         bool ParseFromString(const string& data) except +
+        bool ParseFromArray(const void* data, int size) except +
         uint32 secondsintoyear()
         uint32 nano()
-        string val()
+        int32 severity()
+        int32 status()
+        uint32 repeatcount()
+        int fieldvalues_size()
+        const FieldValue& fieldvalues(int)
+        const string& val()
 
     # BBQR:X:SRAM:MAXRMS
     cdef cppclass VectorShort nogil:
         VectorShort() except +
         bool ParseFromString(const string& data) except +
+        bool ParseFromArray(const void* data, int size) except +
         uint32 secondsintoyear()
         uint32 nano()
+        int32 severity()
+        int32 status()
+        uint32 repeatcount()
+        int fieldvalues_size()
+        const FieldValue& fieldvalues(int)
         int32 val(int)
+        const RepeatedField[int32]& val()
 
     # FILL:fullhistogram
     cdef cppclass VectorInt nogil:
         VectorInt() except +
         bool ParseFromString(const string& data) except +
+        bool ParseFromArray(const void* data, int size) except +
         uint32 secondsintoyear()
         uint32 nano()
+        int32 severity()
+        int32 status()
+        uint32 repeatcount()
+        int fieldvalues_size()
+        const FieldValue& fieldvalues(int)
         int32 val(int)
+        const RepeatedField[int32]& val()
+
+    # SCALAR_SHORT
+    cdef cppclass ScalarShort nogil:
+        ScalarShort() except +
+        bool ParseFromString(const string& data) except +
+        bool ParseFromArray(const void* data, int size) except +
+        uint32 secondsintoyear()
+        uint32 nano()
+        int32 severity()
+        int32 status()
+        uint32 repeatcount()
+        int fieldvalues_size()
+        const FieldValue& fieldvalues(int)
+        int32 val()
+
+    # SCALAR_FLOAT
+    cdef cppclass ScalarFloat nogil:
+        ScalarFloat() except +
+        bool ParseFromString(const string& data) except +
+        bool ParseFromArray(const void* data, int size) except +
+        uint32 secondsintoyear()
+        uint32 nano()
+        int32 severity()
+        int32 status()
+        uint32 repeatcount()
+        int fieldvalues_size()
+        const FieldValue& fieldvalues(int)
+        float val()
+
+    # SCALAR_BYTE
+    cdef cppclass ScalarByte nogil:
+        ScalarByte() except +
+        bool ParseFromString(const string& data) except +
+        bool ParseFromArray(const void* data, int size) except +
+        uint32 secondsintoyear()
+        uint32 nano()
+        int32 severity()
+        int32 status()
+        uint32 repeatcount()
+        int fieldvalues_size()
+        const FieldValue& fieldvalues(int)
+        const string& val()
+
+    # WAVEFORM_STRING
+    cdef cppclass VectorString nogil:
+        VectorString() except +
+        bool ParseFromString(const string& data) except +
+        bool ParseFromArray(const void* data, int size) except +
+        uint32 secondsintoyear()
+        uint32 nano()
+        int32 severity()
+        int32 status()
+        uint32 repeatcount()
+        int fieldvalues_size()
+        const FieldValue& fieldvalues(int)
+        int val_size()
+        const string& val(int)
+
+    # WAVEFORM_ENUM
+    cdef cppclass VectorEnum nogil:
+        VectorEnum() except +
+        bool ParseFromString(const string& data) except +
+        bool ParseFromArray(const void* data, int size) except +
+        uint32 secondsintoyear()
+        uint32 nano()
+        int32 severity()
+        int32 status()
+        uint32 repeatcount()
+        int fieldvalues_size()
+        const FieldValue& fieldvalues(int)
+        int32 val(int)
+        const RepeatedField[int32]& val()
+
+    # V4_GENERIC_BYTES
+    cdef cppclass V4GenericBytes nogil:
+        V4GenericBytes() except +
+        bool ParseFromString(const string& data) except +
+        bool ParseFromArray(const void* data, int size) except +
+        uint32 secondsintoyear()
+        uint32 nano()
+        int32 severity()
+        int32 status()
+        uint32 repeatcount()
+        int fieldvalues_size()
+        const FieldValue& fieldvalues(int)
+        const string& val()
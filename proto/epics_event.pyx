@@ -13,14 +13,32 @@ Documentation of the Archiver Protocol-buffer format:
 
 The following functions are expected to be called by external modules?
     * :func:`read_chunk`
-    * :func:`read_header`
+    * :func:`read_header` and :class:`Header`
+    * :class:`StreamDecoder`
+    * :func:`line_ends` and :func:`fill_rows` to decode parts of chunks
+      into preallocated arrays
+    * :func:`window_lines` and :func:`sample_time` to find the samples of
+      a time window
+    * :class:`SampleInfo` and :class:`FieldValues` holding severity,
+      status, repeat count and field values of the samples
+    * :func:`minmax_indices` and :func:`lttb_indices` to downsample
+      decoded samples
+    * :func:`asof_join` to align samples to a time grid
 """
 
 # read EPICSEvent.pxd definition of Protocol-Buffer code
-from epics_event cimport PayloadInfo,  string
+from epics_event cimport PayloadInfo, FieldValue, string
 from epics_event cimport ScalarDouble, ScalarString, ScalarEnum, ScalarInt
-from epics_event cimport VectorDouble, VectorFloat
-from epics_event cimport VectorInt, VectorShort, VectorChar
+from epics_event cimport ScalarShort, ScalarFloat, ScalarByte
+from epics_event cimport VectorDouble, VectorFloat, VectorString, VectorEnum
+from epics_event cimport VectorInt, VectorShort, VectorChar, V4GenericBytes
+from epics_event cimport RepeatedField, int32
+
+from libc.math cimport NAN, fabs
+from libc.string cimport memchr, memcpy
+from libcpp.vector cimport vector
+
+import collections
 
 import numpy as np
 cimport numpy as np
@@ -28,16 +46,23 @@ cimport cython
 
 
 
-@cython.boundscheck(False) # turn off bounds-checking for entire function
-@cython.wraparound(False)  # turn off negative index wrapping for entire function
-cdef string cdecode(char[:] data, string & res) nogil:
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef const char* unescape(const char* data, Py_ssize_t n, string & res,
+                          Py_ssize_t* size) except NULL nogil:
     """Decode a PB message.
 
     Args:
-        data : a char buffer
+        data : pointer to the escaped message
+        n    : its length
+        res  : a reference to the string to place the result into if
+               required. Reuse it for the next message: its memory is
+               kept
+        size : set to the length of the decoded message
 
     Returns:
-        string : a reference to the string to place the result into
+        pointer to the decoded message: data itself if no escape sequence
+        is found, otherwise the contents of res
 
     As serialized PB messages are binary data; after serialization, newline
     characters are escaped to maintain a "sample per line" constraint.
@@ -47,69 +72,324 @@ cdef string cdecode(char[:] data, string & res) nogil:
     * newline character ``\n`` =  ``0x0A`` to ``0x1B 0x02``
     * carriage return character ``0x0D`` to  ``0x1B 0x03``
 
-
-    This encoding is reversed here
-
-    WARNING:
-           This function does not check that the string res is long enough!
+    This encoding is reversed here. The escape characters are searched
+    with memchr; the runs in between are copied in bulk.
     """
-    cdef string *res_p = & res
-    res_p.clear()
+    cdef const char* end = data + n
+    cdef const char* p = data
+    cdef const char* q = <const char*> memchr(data, 0x1b, n)
     cdef char c
-    cdef int i=0
-    cdef int N = data.shape[0]
-    while i<N:
-        c = data[i]
-        if c==b'\x1b':
-            i+=1
-            c = data[i]
-            if c==b'\x02':
-                res_p[0]+=<char>b'\x0a'
-            elif c==b'\x03':
-                res_p[0]+=<char>b'\x0d'
-            elif c==b'\x01':
-                res_p[0]+=<char>b'\x1b'
-        else:
-            res_p[0]+=c
-        i+=1
-
+    if q == NULL:
+        # fast path: nothing to decode
+        size[0] = n
+        return data
+
+    res.clear()
+    res.reserve(n)
+    while q != NULL:
+        res.append(p, q - p)
+        if q + 1 < end:
+            c = q[1]
+            if c == 0x01:
+                res.push_back(0x1b)
+            elif c == 0x02:
+                res.push_back(0x0a)
+            elif c == 0x03:
+                res.push_back(0x0d)
+        p = q + 2
+        if p >= end:
+            break
+        q = <const char*> memchr(p, 0x1b, end - p)
+    if p < end:
+        res.append(p, end - p)
+    size[0] = res.size()
+    return res.data()
+
+
+cdef string cdecode(const char[:] data, string & res) nogil:
+    """Decode a PB message into res
+
+    see :func:`unescape`
+    """
+    cdef Py_ssize_t n = data.shape[0]
+    cdef Py_ssize_t size
+    cdef const char* p
+    res.clear()
+    if n == 0:
+        return res
+    p = unescape(&data[0], n, res, &size)
+    if p != res.data():
+        res.assign(p, size)
     return res
 
 
-@cython.boundscheck(False)
-@cython.wraparound(False)
-cdef int count_lines(char[:] seq) nogil:
-    """Number of new lines in the whole seq
+cdef int split_lines(const char* data, Py_ssize_t n,
+                     vector[Py_ssize_t] & ends) except -1 nogil:
+    """End of each line of data
 
     Args:
-        seq: a character sequence
+        data:  a character sequence
+        n:     its length
+        ends:  filled with the position of the new line character
+               terminating each line; the last entry is n
+
+    New lines are defined by '\n'. An empty sequence has no lines.
+    """
+    cdef const char* end = data + n
+    cdef const char* p = data
+    cdef const char* q
+    ends.clear()
+    if n == 0:
+        return 0
+    while True:
+        q = <const char*> memchr(p, 0x0a, end - p)
+        if q == NULL:
+            ends.push_back(n)
+            return 0
+        ends.push_back(q - data)
+        p = q + 1
+
+
+cdef np.int64_t NS_PER_SECOND = 1000000000
+
+
+cdef inline np.int64_t year_start_ns(int year) nogil:
+    """Start of the year (1st of January UTC) in nano seconds since the epoch
+
+    Days since the epoch computed as in the days_from_civil algorithm
+    of H. Hinnant; see
+    http://howardhinnant.github.io/date_algorithms.html
+    """
+    # january and february are counted to the previous year
+    cdef np.int64_t y = year - 1
+    cdef np.int64_t era = (y if y >= 0 else y - 399) // 400
+    cdef np.int64_t yoe = y - era * 400
+    # day of the (march based) year of the 1st of January
+    cdef np.int64_t doe = yoe * 365 + yoe // 4 - yoe // 100 + 306
+    cdef np.int64_t days = era * 146097 + doe - 719468
+    return days * 86400 * NS_PER_SECOND
+
+
+#
+# ---------- TIME OF A SAMPLE --------------------
+#
+
+# All sample messages start with the fields secondsintoyear (1) and
+# nano (2), both varints. They are read directly from the escaped line
+# without parsing the complete message.
+
+cdef inline int next_byte(const char** p, const char* end) nogil:
+    """Next unescaped byte of an escaped message or -1 at its end
+    """
+    cdef unsigned char c
+    if p[0] >= end:
+        return -1
+    c = <unsigned char> p[0][0]
+    p[0] += 1
+    if c != 0x1B:
+        return c
+    if p[0] >= end:
+        return -1
+    c = <unsigned char> p[0][0]
+    p[0] += 1
+    if c == 1:
+        return 0x1B
+    elif c == 2:
+        return 0x0A
+    elif c == 3:
+        return 0x0D
+    return -1
+
+
+cdef inline int read_varint(const char** p, const char* end,
+                            np.uint64_t* value) nogil:
+    cdef int shift = 0
+    cdef int c
+    value[0] = 0
+    while shift < 64:
+        c = next_byte(p, end)
+        if c < 0:
+            return -1
+        value[0] |= (<np.uint64_t> (c & 0x7F)) << shift
+        if c < 0x80:
+            return 0
+        shift += 7
+    return -1
+
+
+cdef int read_time(const char* data, Py_ssize_t n, np.int64_t offset,
+                   np.int64_t* t) nogil:
+    """Time of the sample of an escaped line in nano seconds since the epoch
+
+    Only the fields secondsintoyear and nano are read; the other fields
+    are skipped.
 
     Returns:
-        count: position of new line
+        0 on success, -1 if the line is not a valid sample
+    """
+    cdef const char* p = data
+    cdef const char* end = data + n
+    cdef np.uint64_t tag, value
+    cdef np.uint64_t secs = 0, nanos = 0
+    cdef int found = 0
+    cdef int wire, k
+    while found != 3:
+        if p >= end:
+            break
+        if read_varint(&p, end, &tag) < 0:
+            return -1
+        wire = tag & 7
+        if wire == 0:
+            if read_varint(&p, end, &value) < 0:
+                return -1
+            if tag >> 3 == 1:
+                secs = value
+                found |= 1
+            elif tag >> 3 == 2:
+                nanos = value
+                found |= 2
+        elif wire == 1 or wire == 5:
+            for k in range(8 if wire == 1 else 4):
+                if next_byte(&p, end) < 0:
+                    return -1
+        elif wire == 2:
+            if read_varint(&p, end, &value) < 0:
+                return -1
+            while value > 0:
+                if next_byte(&p, end) < 0:
+                    return -1
+                value -= 1
+        else:
+            return -1
+    if found != 3:
+        return -1
+    t[0] = offset + <np.int64_t> secs * NS_PER_SECOND + <np.int64_t> nanos
+    return 0
 
-    New lines are defined by '\n'
+
+cdef Py_ssize_t search_time(const char* data, const Py_ssize_t* ends,
+                            Py_ssize_t lo, Py_ssize_t hi, np.int64_t offset,
+                            np.int64_t t) except -2 nogil:
+    """Index of the first of the lines lo..hi-1 with a time of at least t
+
+    The lines have to be sorted by time. Returns hi if all are earlier.
     """
-    cdef int N = seq.shape[0]
-    cdef int i
-    if N==0 :
-        return 0
-    cdef int count = 1
-    for i in range(N):
-        if seq[i] == '\n':
-            count+=1
-    return count
+    cdef Py_ssize_t mid, start
+    cdef np.int64_t tm
+    while lo < hi:
+        mid = lo + (hi - lo) // 2
+        start = ends[mid - 1] + 1 if mid > 0 else 0
+        if read_time(data + start, ends[mid] - start, offset, &tm) < 0:
+            with gil:
+                raise ValueError('Could not read the time of sample {}'.format(mid))
+        if tm < t:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
 
-@cython.boundscheck(False)
-@cython.wraparound(False)
-cdef int cnext(char[:] seq, int idx) nogil:
-    """find end of current line
+
+#
+# ---------- SAMPLE INFO --------------------
+#
+
+#: alarm severity, status and repeat count of each sample, field values
+#: sent along with some samples (see :func:`read_chunk`)
+SampleInfo = collections.namedtuple(
+    'SampleInfo', ['severity', 'status', 'repeatcount', 'fields'])
+
+#: field values of the samples: index of the sample, name and value
+FieldValues = collections.namedtuple('FieldValues', ['index', 'name', 'value'])
+
+
+cdef struct SampleInfoOut:
+    # one entry per sample
+    np.uint16_t* severity
+    np.uint16_t* status
+    np.uint32_t* repeatcount
+    # one entry per field value
+    vector[Py_ssize_t]* field_index
+    vector[string]* field_names
+    vector[string]* field_values
+
+
+ctypedef fused event_t:
+    ScalarString
+    ScalarShort
+    ScalarFloat
+    ScalarEnum
+    ScalarByte
+    ScalarInt
+    ScalarDouble
+    VectorString
+    VectorShort
+    VectorFloat
+    VectorEnum
+    VectorChar
+    VectorInt
+    VectorDouble
+    V4GenericBytes
+
+
+cdef inline void store_info(event_t& event, SampleInfoOut* info,
+                            Py_ssize_t i) nogil:
+    """Copy severity, status, repeat count and field values of sample i
     """
-    cdef int N = seq.shape[0]
-    cdef int i
-    for i in range(idx,N):
-        if seq[i] == '\n':
-            return i
-    return N
+    cdef int k
+    cdef const FieldValue* field
+    info.severity[i] = <np.uint16_t> event.severity()
+    info.status[i] = <np.uint16_t> event.status()
+    info.repeatcount[i] = event.repeatcount()
+    for k in range(event.fieldvalues_size()):
+        field = &event.fieldvalues(k)
+        info.field_index.push_back(i)
+        info.field_names.push_back(field.name())
+        info.field_values.push_back(field.val())
+
+
+def empty_sample_info(Py_ssize_t n):
+    """:class:`SampleInfo` with uninitialised arrays for n samples
+    """
+    return SampleInfo(np.empty(n, dtype=np.uint16), np.empty(n, dtype=np.uint16),
+                      np.empty(n, dtype=np.uint32), None)
+
+
+cdef int init_info(SampleInfoOut* out, info, Py_ssize_t N) except -1:
+    """Point out to the arrays of the :class:`SampleInfo` info
+
+    The field value vectors have to be set by the caller.
+    """
+    for name, dtype in (('severity', np.uint16), ('status', np.uint16),
+                        ('repeatcount', np.uint32)):
+        arr = getattr(info, name)
+        if (not isinstance(arr, np.ndarray) or arr.dtype != dtype
+                or not arr.flags.c_contiguous or not arr.flags.writeable
+                or len(arr) != N):
+            raise ValueError('{} has to be a writeable C contiguous array of'
+                             ' {} with one entry per line'.format(
+                                 name, np.dtype(dtype)))
+    out.severity = <np.uint16_t*> np.PyArray_DATA(info.severity)
+    out.status = <np.uint16_t*> np.PyArray_DATA(info.status)
+    out.repeatcount = <np.uint32_t*> np.PyArray_DATA(info.repeatcount)
+    return 0
+
+
+cdef object field_table(vector[Py_ssize_t] & index, vector[string] & names,
+                        vector[string] & values):
+    """:class:`FieldValues` of the collected field values
+    """
+    cdef size_t k
+    cdef size_t n = index.size()
+    idx = np.empty(n, dtype=np.intp)
+    if n > 0:
+        memcpy(np.PyArray_DATA(idx), index.data(), n * sizeof(Py_ssize_t))
+    name = np.empty(n, dtype=object)
+    value = np.empty(n, dtype=object)
+    for k in range(n):
+        name[k] = names[k].decode('UTF-8', 'replace')
+        value[k] = values[k].decode('UTF-8', 'replace')
+    return FieldValues(idx, name, value)
+
 
 # reads one "chunk" according to the PB/HTTP protocol
 # using defined "decoder" for the given EPICS type
@@ -119,316 +399,1246 @@ cdef int cnext(char[:] seq, int idx) nogil:
 # ---------- SCALAR EPICS TYPES --------------------
 #
 
+cdef object fixed_width(vector[string] & strs, Py_ssize_t width, shape):
+    """Copy strs into a new numpy array of fixed width byte strings
+
+    The width is at least 1 (numpy does not support 'S0').
+    """
+    values = np.zeros(shape, dtype='S{}'.format(max(width, 1)))
+    cdef char* out = <char*> np.PyArray_DATA(values)
+    cdef Py_ssize_t itemsize = values.itemsize
+    cdef size_t k
+    with nogil:
+        for k in range(strs.size()):
+            memcpy(out + k * itemsize, strs[k].data(), strs[k].size())
+    return values
+
+
 # -0- EPICS STRING
+# fixed width byte strings, as wide as the longest string of the chunk
 @cython.boundscheck(False)
 @cython.wraparound(False)
-cdef read_chunk_str(char[:] seq, int N, np.ndarray[np.int32_t] secs, np.ndarray[np.int32_t] nanos):
-
-    values = np.empty(N,dtype=object)
+cdef read_chunk_str(const char* data, const Py_ssize_t* ends, Py_ssize_t N, np.ndarray[np.int32_t] secs, np.ndarray[np.int32_t] nanos,
+                   np.ndarray[np.int64_t] times, np.int64_t offset,
+                   SampleInfoOut* info):
 
     cdef ScalarString event
 
     cdef int i
-    cdef int start = 0
-    cdef int stop = -1
+    cdef Py_ssize_t start = 0
+    cdef Py_ssize_t size
+    cdef Py_ssize_t width = 0
+    cdef const char* line
     cdef string buf
+    cdef vector[string] strs
+    with nogil:
+        strs.reserve(N)
+        for i in range(N):
+            line = unescape(data + start, ends[i] - start, buf, &size)
+            event.ParseFromArray(line, size)
+            start = ends[i] + 1
+            strs.push_back(event.val())
+            width = max(width, <Py_ssize_t> strs.back().size())
+            secs[i] = event.secondsintoyear()
+            nanos[i] = event.nano()
+            times[i] = offset + <np.int64_t> secs[i] * NS_PER_SECOND + nanos[i]
+            if info != NULL:
+                store_info(event, info, i)
+
+    values = fixed_width(strs, width, N)
+    return values,secs,nanos
+
+# -1- EPICS SHORT
+# stored as sint32
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef int fill_i2(const char* data, const Py_ssize_t* ends, Py_ssize_t N,
+                 Py_ssize_t start, Py_ssize_t elements, void* out,
+                 np.int32_t* secs, np.int32_t* nanos, np.int64_t* times,
+                 np.int64_t offset, SampleInfoOut* info) except -1 nogil:
+    cdef np.int16_t* values = <np.int16_t*> out
+
+    cdef ScalarShort event
 
-    # needs GIL
+    cdef Py_ssize_t i
+    cdef Py_ssize_t size
+    cdef const char* line
+    cdef string buf
     for i in range(N):
-        start = stop+1
-        stop = cnext(seq, start)
-        event.ParseFromString(cdecode(seq[start:stop],buf))
-        values[i] = event.val()
+        line = unescape(data + start, ends[i] - start, buf, &size)
+        event.ParseFromArray(line, size)
+        start = ends[i] + 1
+        values[i] = <np.int16_t> event.val()
         secs[i] = event.secondsintoyear()
         nanos[i] = event.nano()
+        times[i] = offset + <np.int64_t> secs[i] * NS_PER_SECOND + nanos[i]
+        if info != NULL:
+            store_info(event, info, i)
+    return 0
 
-    return values,secs,nanos
+# -2- EPICS FLOAT
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef int fill_f4(const char* data, const Py_ssize_t* ends, Py_ssize_t N,
+                 Py_ssize_t start, Py_ssize_t elements, void* out,
+                 np.int32_t* secs, np.int32_t* nanos, np.int64_t* times,
+                 np.int64_t offset, SampleInfoOut* info) except -1 nogil:
+    cdef np.float32_t* values = <np.float32_t*> out
+
+    cdef ScalarFloat event
+
+    cdef Py_ssize_t i
+    cdef Py_ssize_t size
+    cdef const char* line
+    cdef string buf
+    for i in range(N):
+        line = unescape(data + start, ends[i] - start, buf, &size)
+        event.ParseFromArray(line, size)
+        start = ends[i] + 1
+        values[i] = <np.float32_t> event.val()
+        secs[i] = event.secondsintoyear()
+        nanos[i] = event.nano()
+        times[i] = offset + <np.int64_t> secs[i] * NS_PER_SECOND + nanos[i]
+        if info != NULL:
+            store_info(event, info, i)
+    return 0
 
 # -3- EPICS ENUM
 @cython.boundscheck(False)
 @cython.wraparound(False)
-cdef read_chunk_enum(char[:] seq, int N, np.ndarray[np.int32_t] secs, np.ndarray[np.int32_t] nanos):
-    cdef np.ndarray[np.int32_t] values = np.empty(N,dtype=np.int32)
+cdef int fill_enum(const char* data, const Py_ssize_t* ends, Py_ssize_t N,
+                   Py_ssize_t start, Py_ssize_t elements, void* out,
+                   np.int32_t* secs, np.int32_t* nanos, np.int64_t* times,
+                   np.int64_t offset, SampleInfoOut* info) except -1 nogil:
+    cdef np.int32_t* values = <np.int32_t*> out
 
     cdef ScalarEnum event
 
-    cdef int i
-    cdef int start = 0
-    cdef int stop = -1
+    cdef Py_ssize_t i
+    cdef Py_ssize_t size
+    cdef const char* line
     cdef string buf
-    with nogil:
-        # should be save to release GIL here
-        for i in range(N):
-            start = stop+1
-            stop = cnext(seq, start)
-            event.ParseFromString(cdecode(seq[start:stop],buf))
-            values[i] = event.val()
-            secs[i] = event.secondsintoyear()
-            nanos[i] = event.nano()
+    for i in range(N):
+        line = unescape(data + start, ends[i] - start, buf, &size)
+        event.ParseFromArray(line, size)
+        start = ends[i] + 1
+        values[i] = <np.int32_t> event.val()
+        secs[i] = event.secondsintoyear()
+        nanos[i] = event.nano()
+        times[i] = offset + <np.int64_t> secs[i] * NS_PER_SECOND + nanos[i]
+        if info != NULL:
+            store_info(event, info, i)
+    return 0
 
-    return values,secs,nanos
+# -4- EPICS CHAR
+# stored as bytes: the first byte is used
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef int fill_byte(const char* data, const Py_ssize_t* ends, Py_ssize_t N,
+                   Py_ssize_t start, Py_ssize_t elements, void* out,
+                   np.int32_t* secs, np.int32_t* nanos, np.int64_t* times,
+                   np.int64_t offset, SampleInfoOut* info) except -1 nogil:
+    cdef np.int8_t* values = <np.int8_t*> out
+    cdef const string* val
+    cdef ScalarByte event
+
+    cdef Py_ssize_t i
+    cdef Py_ssize_t size
+    cdef const char* line
+    cdef string buf
+    for i in range(N):
+        line = unescape(data + start, ends[i] - start, buf, &size)
+        event.ParseFromArray(line, size)
+        start = ends[i] + 1
+        val = &event.val()
+        values[i] = <np.int8_t> val.data()[0] if val.size() > 0 else 0
+        secs[i] = event.secondsintoyear()
+        nanos[i] = event.nano()
+        times[i] = offset + <np.int64_t> secs[i] * NS_PER_SECOND + nanos[i]
+        if info != NULL:
+            store_info(event, info, i)
+    return 0
 
 # -5- EPICS LONG
 @cython.boundscheck(False)
 @cython.wraparound(False)
-cdef read_chunk_i4(char[:] seq, int N, np.ndarray[np.int32_t] secs, np.ndarray[np.int32_t] nanos):
-    cdef np.ndarray[np.int32_t] values = np.empty(N,dtype=np.int32)
+cdef int fill_i4(const char* data, const Py_ssize_t* ends, Py_ssize_t N,
+                 Py_ssize_t start, Py_ssize_t elements, void* out,
+                 np.int32_t* secs, np.int32_t* nanos, np.int64_t* times,
+                 np.int64_t offset, SampleInfoOut* info) except -1 nogil:
+    cdef np.int32_t* values = <np.int32_t*> out
 
     cdef ScalarInt event
 
-    cdef int i
-    cdef int start = 0
-    cdef int stop = -1
+    cdef Py_ssize_t i
+    cdef Py_ssize_t size
+    cdef const char* line
     cdef string buf
-    with nogil:
-        # should be save to release GIL here
-        for i in range(N):
-            start = stop+1
-            stop = cnext(seq, start)
-            event.ParseFromString(cdecode(seq[start:stop],buf))
-            values[i] = event.val()
-            secs[i] = event.secondsintoyear()
-            nanos[i] = event.nano()
-
-    return values,secs,nanos
+    for i in range(N):
+        line = unescape(data + start, ends[i] - start, buf, &size)
+        event.ParseFromArray(line, size)
+        start = ends[i] + 1
+        values[i] = <np.int32_t> event.val()
+        secs[i] = event.secondsintoyear()
+        nanos[i] = event.nano()
+        times[i] = offset + <np.int64_t> secs[i] * NS_PER_SECOND + nanos[i]
+        if info != NULL:
+            store_info(event, info, i)
+    return 0
 
 # -6- EPICS DOUBLE - tested
 @cython.boundscheck(False)
 @cython.wraparound(False)
-cdef read_chunk_f8(char[:] seq, int N, np.ndarray[np.int32_t] secs, np.ndarray[np.int32_t] nanos):
-    cdef np.ndarray[np.float_t] values = np.empty(N,dtype=float)
+cdef int fill_f8(const char* data, const Py_ssize_t* ends, Py_ssize_t N,
+                 Py_ssize_t start, Py_ssize_t elements, void* out,
+                 np.int32_t* secs, np.int32_t* nanos, np.int64_t* times,
+                 np.int64_t offset, SampleInfoOut* info) except -1 nogil:
+    cdef np.float64_t* values = <np.float64_t*> out
 
     cdef ScalarDouble event
 
-    cdef int i
-    cdef int start = 0
-    cdef int stop = -1
+    cdef Py_ssize_t i
+    cdef Py_ssize_t size
+    cdef const char* line
     cdef string buf
-    with nogil:
-        # should be save to release GIL here
-        for i in range(N):
-            start = stop+1
-            stop = cnext(seq, start)
-            event.ParseFromString(cdecode(seq[start:stop],buf))
-            values[i] = event.val()
-            secs[i] = event.secondsintoyear()
-            nanos[i] = event.nano()
-
-    return values,secs,nanos
-
+    for i in range(N):
+        line = unescape(data + start, ends[i] - start, buf, &size)
+        event.ParseFromArray(line, size)
+        start = ends[i] + 1
+        values[i] = <np.float64_t> event.val()
+        secs[i] = event.secondsintoyear()
+        nanos[i] = event.nano()
+        times[i] = offset + <np.int64_t> secs[i] * NS_PER_SECOND + nanos[i]
+        if info != NULL:
+            store_info(event, info, i)
+    return 0
 
 #
 # ---------- WAVEFORM EPICS TYPES --------------------
 #
 
+# The rows of the waveforms are copied from the storage of the
+# repeated field. Samples with less elements than given by the header are
+# padded (NaN for floats, 0 else); surplus elements are dropped.
+
 # -8- WAVEFORM SHORT - tested
+# stored as sint32: converted element by element
 @cython.boundscheck(False)
 @cython.wraparound(False)
-cdef read_vchunk_i2(char[:] seq, int N, int elements, np.ndarray[np.int32_t] secs, np.ndarray[np.int32_t] nanos):
-    cdef np.ndarray[np.int16_t, ndim=2] values = np.empty((N,elements),dtype=np.int16)
+cdef int fill_vi2(const char* data, const Py_ssize_t* ends, Py_ssize_t N,
+                  Py_ssize_t start, Py_ssize_t elements, void* out,
+                  np.int32_t* secs, np.int32_t* nanos, np.int64_t* times,
+                  np.int64_t offset, SampleInfoOut* info) except -1 nogil:
+    cdef np.int16_t* values = <np.int16_t*> out
+    cdef const RepeatedField[int32]* val
+    cdef Py_ssize_t j, n
+    cdef const int32* src
+    cdef VectorShort event
 
-    cdef int i
-    cdef int start = 0
-    cdef int stop = -1
+    cdef Py_ssize_t i
+    cdef Py_ssize_t size
+    cdef const char* line
     cdef string buf
+    for i in range(N):
+        line = unescape(data + start, ends[i] - start, buf, &size)
+        event.ParseFromArray(line, size)
+        start = ends[i] + 1
+        val = &event.val()
+        n = min(<Py_ssize_t> val.size(), elements)
+        src = val.data()
+        for j in range(n):
+            values[j] = <np.int16_t> src[j]
+        for j in range(n, elements):
+            values[j] = 0
+        values += elements
+        secs[i] = event.secondsintoyear()
+        nanos[i] = event.nano()
+        times[i] = offset + <np.int64_t> secs[i] * NS_PER_SECOND + nanos[i]
+        if info != NULL:
+            store_info(event, info, i)
+    return 0
 
-    cdef VectorShort event
-    with nogil:
-        # should be save to release GIL here
-        for i in range(N):
-            start = stop+1
-            stop = cnext(seq, start)
-            event.ParseFromString(cdecode(seq[start:stop],buf))
-            for j in range(elements):
-                values[i,j] = event.val(j)
-            secs[i] = event.secondsintoyear()
-            nanos[i] = event.nano()
-    return values, secs, nanos
+# -9- WAVEFORM FLOAT - tested
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef int fill_vf4(const char* data, const Py_ssize_t* ends, Py_ssize_t N,
+                  Py_ssize_t start, Py_ssize_t elements, void* out,
+                  np.int32_t* secs, np.int32_t* nanos, np.int64_t* times,
+                  np.int64_t offset, SampleInfoOut* info) except -1 nogil:
+    cdef np.float32_t* values = <np.float32_t*> out
+    cdef const RepeatedField[float]* val
+    cdef Py_ssize_t j, n
+    cdef VectorFloat event
+
+    cdef Py_ssize_t i
+    cdef Py_ssize_t size
+    cdef const char* line
+    cdef string buf
+    for i in range(N):
+        line = unescape(data + start, ends[i] - start, buf, &size)
+        event.ParseFromArray(line, size)
+        start = ends[i] + 1
+        val = &event.val()
+        n = min(<Py_ssize_t> val.size(), elements)
+        memcpy(values, val.data(), n * sizeof(values[0]))
+        for j in range(n, elements):
+            values[j] = NAN
+        values += elements
+        secs[i] = event.secondsintoyear()
+        nanos[i] = event.nano()
+        times[i] = offset + <np.int64_t> secs[i] * NS_PER_SECOND + nanos[i]
+        if info != NULL:
+            store_info(event, info, i)
+    return 0
 
+# -10- WAVEFORM ENUM
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef int fill_venum(const char* data, const Py_ssize_t* ends, Py_ssize_t N,
+                    Py_ssize_t start, Py_ssize_t elements, void* out,
+                    np.int32_t* secs, np.int32_t* nanos, np.int64_t* times,
+                    np.int64_t offset, SampleInfoOut* info) except -1 nogil:
+    cdef np.int32_t* values = <np.int32_t*> out
+    cdef const RepeatedField[int32]* val
+    cdef Py_ssize_t j, n
+    cdef VectorEnum event
+
+    cdef Py_ssize_t i
+    cdef Py_ssize_t size
+    cdef const char* line
+    cdef string buf
+    for i in range(N):
+        line = unescape(data + start, ends[i] - start, buf, &size)
+        event.ParseFromArray(line, size)
+        start = ends[i] + 1
+        val = &event.val()
+        n = min(<Py_ssize_t> val.size(), elements)
+        memcpy(values, val.data(), n * sizeof(values[0]))
+        for j in range(n, elements):
+            values[j] = 0
+        values += elements
+        secs[i] = event.secondsintoyear()
+        nanos[i] = event.nano()
+        times[i] = offset + <np.int64_t> secs[i] * NS_PER_SECOND + nanos[i]
+        if info != NULL:
+            store_info(event, info, i)
+    return 0
 
-# -12- WAVEFORM LONG - failed?!
+# -11- WAVEFORM CHAR
 @cython.boundscheck(False)
 @cython.wraparound(False)
-cdef read_vchunk_i4(char[:] seq, int N, int elements, np.ndarray[np.int32_t] secs, np.ndarray[np.int32_t] nanos):
-    cdef np.ndarray[np.int32_t, ndim=2] values = np.empty((N,elements),dtype=np.int32)
+cdef int fill_vchar(const char* data, const Py_ssize_t* ends, Py_ssize_t N,
+                    Py_ssize_t start, Py_ssize_t elements, void* out,
+                    np.int32_t* secs, np.int32_t* nanos, np.int64_t* times,
+                    np.int64_t offset, SampleInfoOut* info) except -1 nogil:
+    cdef np.int8_t* values = <np.int8_t*> out
+    cdef const string* val
+    cdef Py_ssize_t j, n
+    cdef VectorChar event
 
-    cdef int i
-    cdef int start = 0
-    cdef int stop = -1
+    cdef Py_ssize_t i
+    cdef Py_ssize_t size
+    cdef const char* line
     cdef string buf
+    for i in range(N):
+        line = unescape(data + start, ends[i] - start, buf, &size)
+        event.ParseFromArray(line, size)
+        start = ends[i] + 1
+        val = &event.val()
+        n = min(<Py_ssize_t> val.size(), elements)
+        memcpy(values, val.data(), n * sizeof(values[0]))
+        for j in range(n, elements):
+            values[j] = 0
+        values += elements
+        secs[i] = event.secondsintoyear()
+        nanos[i] = event.nano()
+        times[i] = offset + <np.int64_t> secs[i] * NS_PER_SECOND + nanos[i]
+        if info != NULL:
+            store_info(event, info, i)
+    return 0
 
+# -12- WAVEFORM LONG
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef int fill_vi4(const char* data, const Py_ssize_t* ends, Py_ssize_t N,
+                  Py_ssize_t start, Py_ssize_t elements, void* out,
+                  np.int32_t* secs, np.int32_t* nanos, np.int64_t* times,
+                  np.int64_t offset, SampleInfoOut* info) except -1 nogil:
+    cdef np.int32_t* values = <np.int32_t*> out
+    cdef const RepeatedField[int32]* val
+    cdef Py_ssize_t j, n
     cdef VectorInt event
-    with nogil:
-        # should be save to release GIL here
-        for i in range(N):
-            start = stop+1
-            stop = cnext(seq, start)
-            event.ParseFromString(cdecode(seq[start:stop],buf))
-            for j in range(elements):
-                values[i,j] = event.val(j)
-            secs[i] = event.secondsintoyear()
-            nanos[i] = event.nano()
-    return values, secs, nanos
 
-# -9- WAVEFORM FLOAT - tested
+    cdef Py_ssize_t i
+    cdef Py_ssize_t size
+    cdef const char* line
+    cdef string buf
+    for i in range(N):
+        line = unescape(data + start, ends[i] - start, buf, &size)
+        event.ParseFromArray(line, size)
+        start = ends[i] + 1
+        val = &event.val()
+        n = min(<Py_ssize_t> val.size(), elements)
+        memcpy(values, val.data(), n * sizeof(values[0]))
+        for j in range(n, elements):
+            values[j] = 0
+        values += elements
+        secs[i] = event.secondsintoyear()
+        nanos[i] = event.nano()
+        times[i] = offset + <np.int64_t> secs[i] * NS_PER_SECOND + nanos[i]
+        if info != NULL:
+            store_info(event, info, i)
+    return 0
+
+# -13- WAVEFORM DOUBLE - tested
 @cython.boundscheck(False)
 @cython.wraparound(False)
-cdef read_vchunk_f4(char[:] seq, int N, int elements, np.ndarray[np.int32_t] secs, np.ndarray[np.int32_t] nanos):
-    cdef np.ndarray[np.float32_t, ndim=2] values = np.empty((N,elements),dtype=np.float32)
+cdef int fill_vf8(const char* data, const Py_ssize_t* ends, Py_ssize_t N,
+                  Py_ssize_t start, Py_ssize_t elements, void* out,
+                  np.int32_t* secs, np.int32_t* nanos, np.int64_t* times,
+                  np.int64_t offset, SampleInfoOut* info) except -1 nogil:
+    cdef np.float64_t* values = <np.float64_t*> out
+    cdef const RepeatedField[double]* val
+    cdef Py_ssize_t j, n
+    cdef VectorDouble event
 
+    cdef Py_ssize_t i
+    cdef Py_ssize_t size
+    cdef const char* line
+    cdef string buf
+    for i in range(N):
+        line = unescape(data + start, ends[i] - start, buf, &size)
+        event.ParseFromArray(line, size)
+        start = ends[i] + 1
+        val = &event.val()
+        n = min(<Py_ssize_t> val.size(), elements)
+        memcpy(values, val.data(), n * sizeof(values[0]))
+        for j in range(n, elements):
+            values[j] = NAN
+        values += elements
+        secs[i] = event.secondsintoyear()
+        nanos[i] = event.nano()
+        times[i] = offset + <np.int64_t> secs[i] * NS_PER_SECOND + nanos[i]
+        if info != NULL:
+            store_info(event, info, i)
+    return 0
+
+# kernels writing numeric samples to preallocated arrays,
+# indexed by the epics type
+ctypedef int (*fill_t)(const char*, const Py_ssize_t*, Py_ssize_t, Py_ssize_t,
+                       Py_ssize_t, void*, np.int32_t*, np.int32_t*, np.int64_t*,
+                       np.int64_t, SampleInfoOut*) except -1 nogil
+
+cdef fill_t fill_kernels[15]
+fill_kernels[1] = fill_i2
+fill_kernels[2] = fill_f4
+fill_kernels[3] = fill_enum
+fill_kernels[4] = fill_byte
+fill_kernels[5] = fill_i4
+fill_kernels[6] = fill_f8
+fill_kernels[8] = fill_vi2
+fill_kernels[9] = fill_vf4
+fill_kernels[10] = fill_venum
+fill_kernels[11] = fill_vchar
+fill_kernels[12] = fill_vi4
+fill_kernels[13] = fill_vf8
+
+#: numpy type of the values of the numeric epics types
+numeric_dtypes = {
+    1: np.int16, 2: np.float32, 3: np.int32, 4: np.int8, 5: np.int32,
+    6: np.float64, 8: np.int16, 9: np.float32, 10: np.int32, 11: np.int8,
+    12: np.int32, 13: np.float64,
+}
+
+
+# -7- WAVEFORM STRING
+# fixed width byte strings, missing elements are empty
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef read_vchunk_str(const char* data, const Py_ssize_t* ends, Py_ssize_t N, int elements, np.ndarray[np.int32_t] secs, np.ndarray[np.int32_t] nanos,
+                   np.ndarray[np.int64_t] times, np.int64_t offset,
+                   SampleInfoOut* info):
     cdef int i
-    cdef int start = 0
-    cdef int stop = -1
+    cdef Py_ssize_t j, n
+    cdef Py_ssize_t start = 0
+    cdef Py_ssize_t size
+    cdef Py_ssize_t width = 0
+    cdef const char* line
     cdef string buf
+    cdef vector[string] strs
 
-    cdef VectorFloat event
+    cdef VectorString event
     with nogil:
-        # should be save to release GIL here
+        strs.resize(N * elements)
         for i in range(N):
-            start = stop+1
-            stop = cnext(seq, start)
-            event.ParseFromString(cdecode(seq[start:stop],buf))
-            for j in range(elements):
-                values[i,j] = event.val(j)
+            line = unescape(data + start, ends[i] - start, buf, &size)
+            event.ParseFromArray(line, size)
+            start = ends[i] + 1
+            n = min(<Py_ssize_t> event.val_size(), elements)
+            for j in range(n):
+                strs[i * elements + j] = event.val(j)
+                width = max(width, <Py_ssize_t> event.val(j).size())
             secs[i] = event.secondsintoyear()
             nanos[i] = event.nano()
+            times[i] = offset + <np.int64_t> secs[i] * NS_PER_SECOND + nanos[i]
+            if info != NULL:
+                store_info(event, info, i)
+
+    values = fixed_width(strs, width, (N, elements))
     return values, secs, nanos
 
-# -13- WAVEFORM DOUBLE - tested
+# -14- V4 GENERIC BYTES
+# arbitrary binary data of varying length: object array of bytes
 @cython.boundscheck(False)
 @cython.wraparound(False)
-cdef read_vchunk_f8(char[:] seq, int N, int elements, np.ndarray[np.int32_t] secs, np.ndarray[np.int32_t] nanos):
-    cdef np.ndarray[np.float64_t, ndim=2] values = np.empty((N,elements),dtype=np.float64)
-
+cdef read_chunk_v4(const char* data, const Py_ssize_t* ends, Py_ssize_t N, np.ndarray[np.int32_t] secs, np.ndarray[np.int32_t] nanos,
+                   np.ndarray[np.int64_t] times, np.int64_t offset,
+                   SampleInfoOut* info):
     cdef int i
-    cdef int start = 0
-    cdef int stop = -1
+    cdef Py_ssize_t start = 0
+    cdef Py_ssize_t size
+    cdef const char* line
     cdef string buf
+    cdef vector[string] strs
 
-    cdef VectorDouble event
+    cdef V4GenericBytes event
     with nogil:
-        # should be save to release GIL here
+        strs.reserve(N)
         for i in range(N):
-            start = stop+1
-            stop = cnext(seq, start)
-            event.ParseFromString(cdecode(seq[start:stop],buf))
-            for j in range(elements):
-                values[i,j] = event.val(j)
+            line = unescape(data + start, ends[i] - start, buf, &size)
+            event.ParseFromArray(line, size)
+            start = ends[i] + 1
+            strs.push_back(event.val())
             secs[i] = event.secondsintoyear()
             nanos[i] = event.nano()
+            times[i] = offset + <np.int64_t> secs[i] * NS_PER_SECOND + nanos[i]
+            if info != NULL:
+                store_info(event, info, i)
+
+    values = np.empty(N, dtype=object)
+    for i in range(N):
+        values[i] = strs[i]
     return values, secs, nanos
 
-# -11- WAVEFORM CHAR
+
+#
+# ---------- DOWNSAMPLING --------------------
+#
+
+# Reduce decoded scalar samples to a number of points for plotting. The
+# kernels select samples: they return the indices of the samples to keep,
+# in time order.
+
+ctypedef fused sample_t:
+    np.int8_t
+    np.int16_t
+    np.int32_t
+    np.float32_t
+    np.float64_t
+
+
 @cython.boundscheck(False)
 @cython.wraparound(False)
-cdef read_vchunk_char(char[:] seq, int N, int elements, np.ndarray[np.int32_t] secs, np.ndarray[np.int32_t] nanos):
-    cdef np.ndarray[np.int8_t, ndim=2] values = np.empty((N,elements),dtype=np.int8)
+cdef Py_ssize_t minmax_kernel(const np.int64_t* times, const sample_t* values,
+                              Py_ssize_t N, Py_ssize_t buckets,
+                              Py_ssize_t* out) noexcept nogil:
+    """Minimum and maximum of each of buckets equally long time intervals
 
-    cdef int i
-    cdef int start = 0
-    cdef int stop = -1
-    cdef string buf, val
+    out needs room for 2 * buckets indices. NaNs are skipped; buckets
+    without samples give no index. Returns the number of indices.
+    """
+    cdef np.int64_t t0 = times[0]
+    cdef double width = (<double> (times[N - 1] - t0)) / buckets
+    cdef np.int64_t edge
+    cdef Py_ssize_t i = 0, n = 0, b, imin, imax
+    cdef sample_t v
+    for b in range(buckets):
+        if b == buckets - 1:
+            edge = times[N - 1] + 1
+        else:
+            edge = t0 + <np.int64_t> (width * (b + 1))
+        imin = imax = -1
+        while i < N and times[i] < edge:
+            v = values[i]
+            # false for NaN only
+            if v == v:
+                if imin < 0 or v < values[imin]:
+                    imin = i
+                if imax < 0 or v > values[imax]:
+                    imax = i
+            i += 1
+        if imin < 0:
+            continue
+        if imin == imax:
+            out[n] = imin
+            n += 1
+        else:
+            out[n] = min(imin, imax)
+            out[n + 1] = max(imin, imax)
+            n += 2
+    return n
 
-    cdef VectorChar event
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void lttb_kernel(const np.int64_t* times, const sample_t* values,
+                      Py_ssize_t N, Py_ssize_t n_out,
+                      Py_ssize_t* out) noexcept nogil:
+    """Largest-Triangle-Three-Buckets of S. Steinarsson (2013)
+
+    Keeps the first and the last sample and from each of n_out - 2
+    buckets of equal count the sample spanning the largest triangle with
+    the previously selected sample and the mean of the next bucket.
+    Requires 3 <= n_out < N. The bucket bounds are computed in integer
+    arithmetic: the buckets cover samples 1 .. N - 2 without gaps.
+    """
+    cdef Py_ssize_t m = N - 2, d = n_out - 2
+    cdef np.int64_t t0 = times[0]
+    cdef Py_ssize_t a = 0, k, i, start, stop, nstart, nstop, best
+    cdef double ax, ay, cx, cy, area, best_area
+    out[0] = 0
+    for k in range(n_out - 2):
+        start = k * m // d + 1
+        stop = (k + 1) * m // d + 1
+        if k == n_out - 3:
+            nstart, nstop = N - 1, N
+        else:
+            nstart = stop
+            nstop = min((k + 2) * m // d + 1, N)
+        cx = cy = 0
+        for i in range(nstart, nstop):
+            cx += <double> (times[i] - t0)
+            cy += <double> values[i]
+        cx /= nstop - nstart
+        cy /= nstop - nstart
+        ax = <double> (times[a] - t0)
+        ay = <double> values[a]
+        best = start
+        best_area = -1
+        for i in range(start, stop):
+            area = fabs((ax - cx) * (<double> values[i] - ay)
+                        - (ax - <double> (times[i] - t0)) * (cy - ay))
+            if area > best_area:
+                best_area = area
+                best = i
+        out[k + 1] = best
+        a = best
+    out[n_out - 1] = N - 1
+
+
+def minmax_indices(const np.int64_t[::1] times, const sample_t[::1] values,
+                   Py_ssize_t buckets):
+    """Indices of the minimum and maximum sample of each time bucket
+
+    Args:
+        times :   time of each sample (nano seconds, sorted)
+        values :  scalar numeric values
+        buckets : number of equally long intervals between the first and
+                  the last sample, e.g. the pixels of a plot
+
+    Returns:
+        sorted numpy array (np.intp) of at most 2 * buckets indices
+    """
+    cdef Py_ssize_t N = times.shape[0]
+    if values.shape[0] != N:
+        raise ValueError('times and values differ in length')
+    if buckets < 1:
+        raise ValueError('at least one bucket is required')
+    cdef np.ndarray[np.intp_t] res = np.empty(2 * buckets, dtype=np.intp)
+    cdef Py_ssize_t n = 0
+    if N > 0:
+        with nogil:
+            n = minmax_kernel(&times[0], &values[0], N, buckets,
+                              <Py_ssize_t*> np.PyArray_DATA(res))
+    return res[:n]
+
+
+def lttb_indices(const np.int64_t[::1] times, const sample_t[::1] values,
+                 Py_ssize_t n_out):
+    """Indices of the samples selected by Largest-Triangle-Three-Buckets
+
+    Args:
+        times :   time of each sample (nano seconds, sorted)
+        values :  scalar numeric values
+        n_out :   number of samples to keep (at least 3)
+
+    Returns:
+        sorted numpy array (np.intp) of min(n_out, len(times)) indices
+    """
+    cdef Py_ssize_t N = times.shape[0]
+    if values.shape[0] != N:
+        raise ValueError('times and values differ in length')
+    if n_out < 3:
+        raise ValueError('LTTB needs at least 3 output points')
+    if N <= n_out:
+        return np.arange(N, dtype=np.intp)
+    cdef np.ndarray[np.intp_t] res = np.empty(n_out, dtype=np.intp)
     with nogil:
-        # should be save to release GIL here
-        for i in range(N):
-            start = stop+1
-            stop = cnext(seq, start)
-            event.ParseFromString(cdecode(seq[start:stop],buf))
-            val = event.val()
-            for j in range(elements):
-                values[i,j] = val[j]
-            secs[i] = event.secondsintoyear()
-            nanos[i] = event.nano()
-    return values, secs, nanos
+        lttb_kernel(&times[0], &values[0], N, n_out,
+                    <Py_ssize_t*> np.PyArray_DATA(res))
+    return res
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def asof_join(const np.int64_t[::1] times, const sample_t[::1] values,
+              const np.int64_t[::1] grid, double[:] out,
+              np.int64_t[:] age):
+    """Zero order hold of samples onto a time grid
+
+    Args:
+        times :  time of each sample (nano seconds, sorted)
+        values : scalar numeric values
+        grid :   times to sample at (nano seconds, sorted)
+        out :    output, one entry per grid point: value of the last
+                 sample at or before the grid point, NaN if there is none
+        age :    output: time since that sample in nano seconds, -1 if
+                 there is none
+
+    out and age may be strided, e.g. columns of a matrix holding
+    several variables. Both inputs are walked once; the GIL is released.
+    """
+    cdef Py_ssize_t N = times.shape[0]
+    cdef Py_ssize_t G = grid.shape[0]
+    cdef Py_ssize_t i = -1, k
+    if values.shape[0] != N:
+        raise ValueError('times and values differ in length')
+    if out.shape[0] != G or age.shape[0] != G:
+        raise ValueError('outputs do not match the grid')
+    with nogil:
+        for k in range(G):
+            while i + 1 < N and times[i + 1] <= grid[k]:
+                i += 1
+            if i < 0:
+                out[k] = NAN
+                age[k] = -1
+            else:
+                out[k] = <double> values[i]
+                age[k] = grid[k] - times[i]
 
 
 #
 # ---- PYTHON functions ----
 #
-def read_chunk(char[:] seq, header):
+def line_ends(const char[:] seq):
+    """End of each line of seq
+
+    Returns:
+        numpy array (np.intp) of the positions of the new line characters
+        terminating the lines; the last entry is the length of seq
+
+    see :func:`fill_rows`
+    """
+    cdef vector[Py_ssize_t] ends
+    if seq.shape[0] > 0:
+        split_lines(&seq[0], seq.shape[0], ends)
+    cdef np.ndarray[np.intp_t] res = np.empty(ends.size(), dtype=np.intp)
+    if ends.size() > 0:
+        memcpy(np.PyArray_DATA(res), ends.data(), ends.size() * sizeof(Py_ssize_t))
+    return res
+
+
+def sample_time(const char[:] line, header):
+    """Time of the sample of an escaped line in nano seconds since the epoch
+
+    Only the time fields of the message are read.
+    """
+    cdef np.int64_t t
+    cdef int res = -1
+    if line.shape[0] > 0:
+        res = read_time(&line[0], line.shape[0], year_start_ns(header.year), &t)
+    if res < 0:
+        raise ValueError('Could not read the time of the sample')
+    return t
+
+
+def window_lines(const char[:] seq, header, const Py_ssize_t[::1] ends,
+                 t_start=None, t_stop=None):
+    """Lines of a chunk within a time window
+
+    Args:
+        seq :     the sample lines of the chunk, sorted by time
+        header :  header of the chunk
+        ends :    end of each line (see :func:`line_ends`)
+        t_start, t_stop : window in nano seconds since the epoch (both
+                  included); None for an open end
+
+    Returns:
+        tuple (i0, i1): the lines i0..i1-1 are within the window. As the
+        appliance does, the last line before t_start is included.
+
+    The lines are found by binary search; only the time fields of the
+    probed lines are read.
+    """
+    cdef Py_ssize_t N = ends.shape[0]
+    cdef Py_ssize_t i0 = 0
+    cdef Py_ssize_t i1 = N
+    cdef np.int64_t offset = year_start_ns(header.year)
+    if N == 0:
+        return 0, 0
+    cdef const char* data = &seq[0]
+    cdef np.int64_t t
+    if t_start is not None:
+        t = t_start
+        with nogil:
+            i0 = search_time(data, &ends[0], 0, N, offset, t)
+        i0 = max(i0 - 1, 0)
+    if t_stop is not None:
+        t = t_stop
+        with nogil:
+            i1 = search_time(data, &ends[0], i0, N, offset, t + 1)
+    return i0, max(i0, i1)
+
+
+def numeric_dtype(header):
+    """numpy type of the values of a chunk or None for strings and bytes
+    """
+    return numeric_dtypes.get(header.type)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def fill_rows(const char[:] seq, header, const Py_ssize_t[::1] ends,
+              Py_ssize_t start, values, np.int32_t[::1] secs,
+              np.int32_t[::1] nanos, np.int64_t[::1] times, info=None):
+    """Decode lines of a chunk of a numeric type into the given arrays
+
+    Args:
+        seq :    the sample lines of the chunk
+        header : header of the chunk
+        ends :   end of each line to decode (see :func:`line_ends`)
+        start :  start of the first line to decode
+        values, secs, nanos, times : C contiguous output arrays, one
+                 row per line. values has the type given by
+                 :func:`numeric_dtype` and elementCount columns for
+                 waveforms
+        info :   optional :class:`SampleInfo` (see
+                 :func:`empty_sample_info`): its arrays are filled with
+                 severity, status and repeat count of each line
+
+    Returns:
+        None, or the :class:`FieldValues` of the lines if info is given.
+        Their index counts from the first decoded line.
+
+    The GIL is released while decoding. Thus different parts of the
+    output can be filled from several threads.
+    """
+    cdef int epics_type = header.type
+    cdef Py_ssize_t elements = header.elementCount
+    cdef np.int64_t offset = year_start_ns(header.year)
+    cdef Py_ssize_t N = ends.shape[0]
+    cdef fill_t kernel = NULL
+    if 0 <= epics_type < 15:
+        kernel = fill_kernels[epics_type]
+    if kernel == NULL:
+        raise NotImplementedError('Type {} not supported'.format(epics_type))
+    if not values.flags.c_contiguous or values.dtype != numeric_dtypes[epics_type]:
+        raise ValueError('values have to be a C contiguous array of {}'.format(
+            np.dtype(numeric_dtypes[epics_type])))
+    if not (len(values) == secs.shape[0] == nanos.shape[0] == times.shape[0] == N):
+        raise ValueError('output arrays do not match the number of lines')
+    if values.size != N * (elements if epics_type >= 7 else 1):
+        raise ValueError('values do not match the element count')
+    cdef SampleInfoOut info_out
+    cdef SampleInfoOut* pinfo = NULL
+    cdef vector[Py_ssize_t] field_index
+    cdef vector[string] field_names, field_values
+    if info is not None:
+        init_info(&info_out, info, N)
+        info_out.field_index = &field_index
+        info_out.field_names = &field_names
+        info_out.field_values = &field_values
+        pinfo = &info_out
+    cdef void* out = np.PyArray_DATA(values)
+    if N > 0:
+        with nogil:
+            kernel(&seq[0], &ends[0], N, start, elements, out,
+                   &secs[0], &nanos[0], &times[0], offset, pinfo)
+    if info is not None:
+        return field_table(field_index, field_names, field_values)
+
+
+def read_chunk(const char[:] seq, header, with_times=False, with_info=False):
     """Read a protocol buffer chunk
 
     Args:
         seq : a character buffer
-        epics_type : an integer defining the epics type
-        elements   : the number of elements
+        header : header of the chunk; required attributes are type,
+                 elementCount and year (e.g. PayloadInfo)
+        with_times : if True additionally return the time of each sample
+                     in nano seconds since the epoch (np.int64)
+        with_info : if True additionally return a :class:`SampleInfo`:
+                    alarm severity and status (np.uint16) and repeat
+                    count (np.uint32) of each sample, and the field values
+                    sent along with some samples (e.g. cnxlostepsecs
+                    when the connection was lost) as :class:`FieldValues`.
+                    They are read in the same pass as the values.
 
 
     Returns:
-      values, seconds, nano_seconds
+      values, seconds, nano_seconds[, times][, info]
 
+    The times are computed in the decode loop using the year of the
+    header. They can be viewed as `datetime64[ns]` without copy.
 
-    Currently the following epics types are implemented:
-        *  0.  : string
-        *  3.  : enum
+    All epics types (PayloadType) are implemented:
+        *  0.  : string (fixed width byte strings)
+        *  1.  : i2 (signed [short] integers of two bytes)
+        *  2.  : f4 (floats of four bytes)
+        *  3.  : enum (i4)
+        *  4.  : i1 (characters)
         *  5.  : i4 (signed integers of four bytes)
         *  6.  : f8 (doubles of eight bytes)
-        *  9.  : i2 vector (signed [short] integers of two bytes)
-        *  11. : vector of characters
-        *  12. : f4 vector (floats of four bytes)
-        *  13. : f8 vector (floats of eight bytes)
+        *  7.  : string vector (fixed width byte strings)
+        *  8.  : i2 vector (signed [short] integers of two bytes)
+        *  9.  : f4 vector (floats of four bytes)
+        *  10. : enum vector (i4)
+        *  11. : vector of characters (i1)
+        *  12. : i4 vector (signed integers of four bytes)
+        *  13. : f8 vector (doubles of eight bytes)
+        *  14. : V4 generic bytes (object array of bytes)
+
+    The numpy types match
+    :data:`bact_archiver.protocol_buffer.decoder_dtypes`.
+    The width of the fixed width strings is given by the longest string
+    of the chunk.
 
     """
     cdef int epics_type = header.type
     cdef int elements = header.elementCount
-    cdef int N = count_lines(seq)
+    cdef np.int64_t offset = year_start_ns(header.year)
+    # one memchr pass to find the samples
+    cdef np.ndarray[np.intp_t] ends = line_ends(seq)
+    cdef Py_ssize_t N = len(ends)
+    cdef const char* data = &seq[0] if N > 0 else NULL
+    cdef const Py_ssize_t* pends = <const Py_ssize_t*> np.PyArray_DATA(ends)
 
     cdef np.ndarray[np.int32_t] secs = np.empty(N,dtype=np.int32)
     cdef np.ndarray[np.int32_t] nanos = np.empty(N,dtype=np.int32)
+    cdef np.ndarray[np.int64_t] times = np.empty(N,dtype=np.int64)
+
+    cdef SampleInfoOut info_out
+    cdef SampleInfoOut* pinfo = NULL
+    cdef vector[Py_ssize_t] field_index
+    cdef vector[string] field_names, field_values
+    info = None
+    if with_info:
+        info = empty_sample_info(N)
+        init_info(&info_out, info, N)
+        info_out.field_index = &field_index
+        info_out.field_names = &field_names
+        info_out.field_values = &field_values
+        pinfo = &info_out
+
+    dtype = numeric_dtypes.get(epics_type)
+    if dtype is not None:
+        if epics_type >= 7:
+            values = np.empty((N, elements), dtype=dtype)
+        else:
+            values = np.empty(N, dtype=dtype)
+        fields = fill_rows(seq, header, ends, 0, values, secs, nanos, times,
+                           info)
+        if info is not None:
+            info = info._replace(fields=fields)
+        res = values, secs, nanos
+    else:
+        if epics_type==0:
+            res = read_chunk_str(data, pends, N, secs, nanos, times, offset,
+                                 pinfo)
+        elif epics_type==7:
+            res = read_vchunk_str(data, pends, N, elements, secs, nanos, times,
+                                  offset, pinfo)
+        elif epics_type==14:
+            res = read_chunk_v4(data, pends, N, secs, nanos, times, offset,
+                                pinfo)
+        else:
+            # Why not raise an exception here
+            raise NotImplementedError('Type {} not supported'.format(epics_type))
+        if info is not None:
+            info = info._replace(fields=field_table(field_index, field_names,
+                                                    field_values))
+
+    if with_times:
+        res += (times,)
+    if with_info:
+        res += (info,)
+    return res
+
 
-    if epics_type==0:
-        return read_chunk_str(seq, N, secs, nanos)
-    elif epics_type==3:
-        return read_chunk_enum(seq, N, secs, nanos)
-    elif epics_type==5:
-        return read_chunk_i4(seq, N, secs, nanos)
-    elif epics_type==6:
-        return read_chunk_f8(seq, N, secs, nanos)
-    elif epics_type==8:
-        return read_vchunk_i2(seq, N, elements, secs, nanos)
-    elif epics_type==9:
-        return read_vchunk_f4(seq, N, elements, secs, nanos)
-    elif epics_type==11:
-        return read_vchunk_char(seq, N, elements, secs, nanos)
-    elif epics_type==12:
-        return read_vchunk_i4(seq, N, elements, secs, nanos)
-    elif epics_type==13:
-        return read_vchunk_f8(seq, N, elements, secs, nanos)
-
-    # Why not raise an exception here
-    raise NotImplementedError('Type {} not supported'.format(epics_type))
-
-
-def decode(char[:] line):
+def decode(const char[:] line):
     """Simple python wraper for cdecode
     """
     cdef string buf
     cdecode(line,buf)
     return buf
 
-def read_header(char[:] line):
+cdef class Header:
+    """Header of a chunk: the contents of the PayloadInfo message
+
+    Attributes:
+        type         : EPICS payload type (see
+                       :data:`bact_archiver.protocol_buffer.dtypes`)
+        year         : year the seconds of the samples refer to
+        elementCount : number of elements of a waveform
+        pvname       : name of the variable
+        headers      : dictionary of the extra fields sent along,
+                       e.g. EGU, PREC or HIHI. The values are strings.
+
+    Returned by :func:`read_header`. Does not need the protobuf python
+    package.
+    """
+    cdef readonly int type
+    cdef readonly int year
+    cdef readonly int elementCount
+    cdef readonly str pvname
+    cdef readonly dict headers
+
+    def __init__(self, type, year, elementCount, pvname='', headers=None):
+        self.type = type
+        self.year = year
+        self.elementCount = elementCount
+        self.pvname = pvname
+        self.headers = dict(headers) if headers is not None else {}
+
+    def __reduce__(self):
+        return (Header, (self.type, self.year, self.elementCount,
+                         self.pvname, self.headers))
+
+    def __eq__(self, other):
+        if not isinstance(other, Header):
+            return NotImplemented
+        return self.__reduce__() == other.__reduce__()
+
+    def __hash__(self):
+        return hash((self.type, self.year, self.elementCount, self.pvname))
+
+    def __repr__(self):
+        txt = '{}(type={}, year={}, elementCount={}, pvname={!r}, headers={})'
+        return txt.format(self.__class__.__name__, self.type, self.year,
+                          self.elementCount, self.pvname, self.headers)
+
+
+def read_header(const char[:] line):
     """Read the header of the payload
 
     Args:
-        line : char buffer
+        line : (still escaped) header line as char buffer
 
     Returns:
-        dic: dictionary containing
-            * type
-            * year
-            * elementcount
+        :class:`Header`
 
-    use carchiver.read_header if PayloadInfo is need directly
+    The PayloadInfo message is parsed by the compiled protobuf code.
     """
-    cdef PayloadInfo info = PayloadInfo()
+    cdef PayloadInfo info
     cdef string buf
-    info.ParseFromString(cdecode(line,buf))
+    cdef Py_ssize_t n = line.shape[0]
+    cdef Py_ssize_t size = 0
+    cdef const char* p = NULL
+    cdef const FieldValue* field
+    cdef int i
+    if n > 0:
+        p = unescape(&line[0], n, buf, &size)
+    if not info.ParseFromArray(p, size):
+        raise ValueError('Could not parse chunk header')
+
+    headers = {}
+    for i in range(info.headers_size()):
+        field = &info.headers(i)
+        headers[field.name().decode('UTF-8', 'replace')] = \
+            field.val().decode('UTF-8', 'replace')
+    return Header(info.type(), info.year(), info.elementcount(),
+                  info.pvname().decode('UTF-8', 'replace'), headers)
+
 
-    header = {}
-    header['type'] = info.type()
-    header['year'] = info.year()
-    header['elementcount'] = info.elementcount()
+#
+# ---- Streaming decoder ----
+#
+class _GrowableArray:
+    """Array with amortised appends along the first axis
+
+    The buffer is grown in place (realloc) by a factor of 1.5. When
+    finished it is trimmed to the number of stored rows. Thus the memory
+    needed stays close to the size of the final result.
+    """
+    def __init__(self, first):
+        # first is owned by the caller: freshly created by read_chunk
+        self.array = first
+        self.n = len(first)
+
+    def append(self, arr):
+        cdef Py_ssize_t n = len(arr)
+        cdef Py_ssize_t needed = self.n + n
+        cdef Py_ssize_t capacity = len(self.array)
+        if arr.dtype != self.array.dtype:
+            # strings wider than the ones seen so far
+            self.array = self.array.astype(np.result_type(self.array, arr))
+        if needed > capacity:
+            capacity = max(needed, capacity + capacity // 2)
+            # no views of the buffer are handed out before finish
+            self.array.resize((capacity,) + self.array.shape[1:],
+                              refcheck=False)
+        self.array[self.n:needed] = arr
+        self.n = needed
+
+    def finish(self):
+        self.array.resize((self.n,) + self.array.shape[1:], refcheck=False)
+        return self.array
+
+
+cdef class StreamDecoder:
+    """Incremental decoder for a PB/HTTP data stream
 
-    return header
+    Args:
+        read_header : callable parsing a (still escaped) header line.
+                      It has to return an object with the attributes
+                      `type`, `year` and `elementCount` (e.g.
+                      :func:`read_header`)
+        max_samples : if given, a chunk is handed out in pieces as soon
+                      as this number of samples is collected. The
+                      pieces of one chunk share the same header.
+        with_times  : if True, the chunks additionally contain the
+                      times of the samples in nano seconds since the
+                      epoch (see :func:`read_chunk`)
+
+    The stream can be fed in blocks of arbitrary size using
+    :meth:`feed`. Lines (samples) and chunks split across block edges are
+    kept until the next block arrives. Samples of complete lines are
+    decoded immediately and appended to growable output arrays.
+
+    :meth:`feed` and :meth:`close` return the chunks completed so far as
+    list of tuples (header, values, secs, nanos[, times]). Chunks without
+    samples are dropped.
+
+    Example::
+
+        decoder = StreamDecoder(read_header)
+        chunks = []
+        for block in iter(lambda: f.read(2**20), b''):
+            chunks.extend(decoder.feed(block))
+        chunks.extend(decoder.close())
+    """
+    cdef object read_header
+    cdef object header
+    cdef object rest
+    cdef object values
+    cdef object secs
+    cdef object nanos
+    cdef object times
+    cdef Py_ssize_t max_samples
+    cdef bint with_times
+
+    def __init__(self, read_header, max_samples=None, with_times=False):
+        self.read_header = read_header
+        self.max_samples = max_samples if max_samples is not None else 0
+        self.with_times = with_times
+        self.header = None
+        self.rest = bytearray()
+        self.values = None
+        self.secs = None
+        self.nanos = None
+        self.times = None
+
+    def _add_samples(self, seq, chunks):
+        values, secs, nanos, times = read_chunk(seq, self.header,
+                                                with_times=True)
+        if self.values is None:
+            self.values = _GrowableArray(values)
+            self.secs = _GrowableArray(secs)
+            self.nanos = _GrowableArray(nanos)
+            self.times = _GrowableArray(times)
+        else:
+            self.values.append(values)
+            self.secs.append(secs)
+            self.nanos.append(nanos)
+            self.times.append(times)
+        if self.max_samples > 0 and self.secs.n >= self.max_samples:
+            self._flush(chunks)
+
+    def _flush(self, chunks):
+        if self.values is not None:
+            chunk = (self.header, self.values.finish(), self.secs.finish(),
+                     self.nanos.finish())
+            if self.with_times:
+                chunk += (self.times.finish(),)
+            chunks.append(chunk)
+        self.values = None
+        self.secs = None
+        self.nanos = None
+        self.times = None
+
+    def _finish_chunk(self, chunks):
+        self._flush(chunks)
+        self.header = None
+
+    def _process(self, buf, Py_ssize_t end, chunks):
+        """Process the complete lines in buf[:end]
+
+        buf[end-1] has to be a new line character
+        """
+        cdef const unsigned char[:] view = buf
+        cdef Py_ssize_t pos = 0
+        cdef Py_ssize_t stop
+        # typed as char for the decode functions
+        mem = memoryview(buf).cast('c')
+        while pos < end:
+            if self.header is None:
+                stop = buf.find(b'\n', pos, end)
+                if stop > pos:
+                    self.header = self.read_header(mem[pos:stop])
+                pos = stop + 1
+                continue
+
+            if view[pos] == 0x0A:
+                # empty line: end of chunk
+                self._finish_chunk(chunks)
+                pos += 1
+                continue
+
+            stop = buf.find(b'\n\n', pos, end)
+            if stop < 0:
+                self._add_samples(mem[pos:end - 1], chunks)
+                pos = end
+            else:
+                self._add_samples(mem[pos:stop], chunks)
+                self._finish_chunk(chunks)
+                pos = stop + 2
+
+    def feed(self, block):
+        """Decode the complete lines of the next block of the stream
+
+        Args:
+            block: bytes or bytearray
+
+        Returns:
+            list of the chunks completed with this block
+        """
+        cdef Py_ssize_t end
+        chunks = []
+        end = block.rfind(b'\n') + 1
+        if end == 0:
+            # no complete line yet
+            self.rest += block
+            return chunks
+        if self.rest:
+            buf = self.rest + block
+            end += len(self.rest)
+        else:
+            buf = block
+        self.rest = bytearray(buf[end:])
+        self._process(buf, end, chunks)
+        return chunks
+
+    def close(self):
+        """Decode the remaining data at the end of the stream
+
+        Returns:
+            list of the chunks completed
+        """
+        chunks = []
+        if self.rest:
+            buf, self.rest = self.rest + b'\n', bytearray()
+            self._process(buf, len(buf), chunks)
+        if self.header is not None:
+            self._finish_chunk(chunks)
+        return chunks
@@ -0,0 +1,36 @@
+"""Micro benchmark of the decoding of the PB/HTTP test data
+
+Not collected by the test runner. Run it from the tests directory::
+
+    python benchmark_decode.py [repeat]
+
+Prints the best time per call of :func:`get_data_from_archiver` and the
+throughput for each of the larger test files.
+"""
+import os
+import sys
+import timeit
+
+from bact_archiver.carchiver import get_data_from_archiver
+from common import test_data_dir
+
+test_files = [
+    '20171101_MBcurrent.pb',
+    '20171101_sram_mean.pb',
+    '20171101_sram_maxrms.pb',
+]
+
+
+def main(repeat=20):
+    for fname in test_files:
+        with open(os.path.join(test_data_dir, fname), 'rb') as f:
+            data = f.read()
+        timer = timeit.Timer(lambda: get_data_from_archiver(data))
+        number, _ = timer.autorange()
+        best = min(timer.repeat(repeat=repeat, number=number)) / number
+        print('{:28s} {:9.3f} ms {:8.1f} MB/s'.format(
+            fname, best * 1e3, len(data) / best / 1e6))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
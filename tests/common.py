@@ -6,3 +6,25 @@ import os.path
 _dir_name = os.path.dirname(__file__)
 test_data_dir = os.path.join(_dir_name, "test_data")
 test_data_dir = os.path.normpath(test_data_dir)
+
+
+def escape(data):
+    """Escape a serialised PB message as done by the archiver appliance
+    """
+    return data.replace(b'\x1b', b'\x1b\x01').replace(
+        b'\n', b'\x1b\x02').replace(b'\r', b'\x1b\x03')
+
+
+def make_pb(chunks):
+    """Create PB/HTTP data
+
+    Args:
+        chunks: sequence of (header, events): a PayloadInfo and a sequence
+                of serialisable sample messages
+    """
+    lines = []
+    for header, events in chunks:
+        seq = [escape(header.SerializeToString())]
+        seq.extend(escape(event.SerializeToString()) for event in events)
+        lines.append(b'\n'.join(seq))
+    return b'\n\n'.join(lines) + b'\n'
@@ -0,0 +1,148 @@
+# Minimal stand in for the archiver appliance retrieval interface
+"""HTTP server serving PB/HTTP data and bpl commands for the tests
+"""
+import bisect
+import datetime
+import http.server
+import json
+import os
+import threading
+from urllib.parse import urlsplit, parse_qs
+
+from bact_archiver import epics_event_pb2 as proto
+from bact_archiver.config import ArchiverConfiguration
+from common import make_pb, test_data_dir
+
+_utc = datetime.timezone.utc
+_request_fmt = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+
+def read_test_data(fname):
+    with open(os.path.join(test_data_dir, fname), 'rb') as f:
+        return f.read()
+
+
+class ScalarSeries:
+    """Scalar double pv with samples at given epoch seconds
+
+    Serves a request for [t0, t1] like the appliance: the last sample
+    before t0 followed by all samples up to t1, one chunk per year.
+    """
+    def __init__(self, pvname, times, values):
+        self.pvname = pvname
+        self.times = list(times)
+        self.values = list(values)
+
+    def __call__(self, pvname, t0, t1):
+        t0 = datetime.datetime.strptime(t0, _request_fmt).replace(tzinfo=_utc)
+        t1 = datetime.datetime.strptime(t1, _request_fmt).replace(tzinfo=_utc)
+        start = max(bisect.bisect_left(self.times, t0.timestamp()) - 1, 0)
+        stop = bisect.bisect_right(self.times, t1.timestamp())
+
+        chunks = []
+        for t, v in zip(self.times[start:stop], self.values[start:stop]):
+            dt = datetime.datetime.fromtimestamp(t, _utc)
+            year_start = datetime.datetime(dt.year, 1, 1, tzinfo=_utc)
+            if not chunks or chunks[-1][0].year != dt.year:
+                header = proto.PayloadInfo(type=6, pvname=self.pvname,
+                                           year=dt.year, elementCount=1)
+                chunks.append((header, []))
+            since = round((t - year_start.timestamp()) * 1e9)
+            event = proto.ScalarDouble(secondsintoyear=since // 10**9,
+                                       nano=since % 10**9, val=v)
+            chunks[-1][1].append(event)
+        if not chunks:
+            return b''
+        return make_pb(chunks)
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    # keep alive requires HTTP/1.1
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, body, status=200, content_type='application/octet-stream'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        appliance = self.server.appliance
+        parts = urlsplit(self.path)
+        query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        with appliance.lock:
+            appliance.requests.append((parts.path, query))
+            appliance.connections.add(self.client_address)
+
+        if parts.path == '/retrieval/data/getData.raw':
+            pvname = query['pv']
+            try:
+                data = appliance.data[pvname]
+            except KeyError:
+                self._reply(b'Not found', status=404, content_type='text/plain')
+                return
+            if callable(data):
+                try:
+                    data = data(pvname, query['from'], query['to'])
+                except Exception as exc:
+                    self._reply(str(exc).encode('UTF-8'), status=500,
+                                content_type='text/plain')
+                    return
+            self._reply(data)
+        elif parts.path.startswith('/retrieval/bpl/'):
+            cmd = parts.path[len('/retrieval/bpl/'):]
+            if cmd == 'getMatchingPVs':
+                body = json.dumps(sorted(appliance.data.keys()))
+            elif cmd == 'getMetadata':
+                body = json.dumps(appliance.metadata.get(query['pv'], {}))
+            else:
+                self._reply(b'Unknown command', status=404,
+                            content_type='text/plain')
+                return
+            self._reply(body.encode('UTF-8'), content_type='application/json')
+        else:
+            self._reply(b'Not found', status=404, content_type='text/plain')
+
+
+class _Server(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class FakeAppliance:
+    '''Serve data from a dictionary pvname -> PB/HTTP bytes
+
+    Values can be callables `f(pvname, t0, t1)` returning the bytes
+    '''
+    def __init__(self, data=None, metadata=None):
+        self.data = data if data is not None else {}
+        self.metadata = metadata if metadata is not None else {}
+        self.requests = []
+        self.connections = set()
+        self.lock = threading.Lock()
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        self._server.appliance = self
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        kwargs=dict(poll_interval=0.01),
+                                        daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address
+        return 'http://{}:{}'.format(host, port)
+
+    def config(self, **kwargs):
+        return ArchiverConfiguration(name='fake', base_url=self.base_url,
+                                     **kwargs)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,97 @@
+import datetime
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from bact_archiver import epics_event_pb2 as proto
+from bact_archiver.carchiver import Archiver
+from common import make_pb
+from fake_appliance import FakeAppliance, ScalarSeries
+
+_utc = datetime.timezone.utc
+
+
+class AlignedTest(unittest.TestCase):
+    """Several variables joined onto a common time grid
+    """
+
+    def setUp(self):
+        self.t0 = datetime.datetime(2017, 12, 31, 22, tzinfo=_utc)
+        self.t1 = datetime.datetime(2018, 1, 1, 2, tzinfo=_utc)
+        start = self.t0.timestamp()
+        rng = np.random.default_rng(3)
+        self.series = {}
+        for name, n in (('TEST:a', 500), ('TEST:b', 37)):
+            # on half seconds: exact in nano seconds
+            times = np.sort(rng.choice(4 * 3600, n, replace=False))
+            times = start - 100.5 + times
+            self.series[name] = ScalarSeries(name, times, rng.normal(size=n))
+        header = proto.PayloadInfo(type=13, pvname='TEST:wf', year=2017,
+                                   elementCount=2)
+        event = proto.VectorDouble(secondsintoyear=0, nano=0, val=[1, 2])
+        self.appliance = FakeAppliance(
+            data=dict(self.series, **{'TEST:wf': make_pb([(header, [event])])}))
+        self.appliance.__enter__()
+        self.archiver = Archiver(config=self.appliance.config())
+
+    def tearDown(self):
+        self.archiver.close()
+        self.appliance.__exit__(None, None, None)
+
+    def sample_ns(self, *names):
+        times = np.concatenate([self.series[name].times for name in names])
+        return (times * 2).astype(np.int64) * 500000000
+
+    def reference(self, name, grid):
+        series = self.series[name]
+        left = pd.DataFrame({'t': grid})
+        right = pd.DataFrame({'t': self.sample_ns(name), 'val': series.values})
+        return pd.merge_asof(left, right, on='t')['val'].values
+
+    def test00_grid(self):
+        pvnames = ['TEST:a', 'TEST:missing', 'TEST:b', 'TEST:wf']
+        res = self.archiver.getAligned(pvnames, t0=self.t0, t1=self.t1,
+                                       grid=datetime.timedelta(seconds=60))
+        self.assertEqual(res.pvnames, pvnames)
+        self.assertEqual(set(res.errors), {'TEST:missing', 'TEST:wf'})
+        self.assertEqual(res.values.shape, (241, 4))
+        self.assertEqual(res.times[0], self.t0.timestamp() * 1e9)
+        self.assertEqual(res.times[-1], self.t1.timestamp() * 1e9)
+        for column in (0, 2):
+            name = pvnames[column]
+            np.testing.assert_array_equal(res.values[:, column],
+                                          self.reference(name, res.times))
+            valid = res.age[:, column] >= 0
+            np.testing.assert_array_equal(valid,
+                                          ~np.isnan(res.values[:, column]))
+            # the age is the distance to the last sample
+            times = self.sample_ns(name)
+            last = times[np.searchsorted(times, res.times[valid],
+                                         side='right') - 1]
+            np.testing.assert_array_equal(res.age[valid, column],
+                                          res.times[valid] - last)
+        self.assertTrue(np.all(np.isnan(res.values[:, 1])))
+        self.assertTrue(np.all(res.age[:, 3] == -1))
+
+    def test01_sample_times(self):
+        res = self.archiver.getAligned(['TEST:b', 'TEST:a'], t0=self.t0,
+                                       t1=self.t1)
+        times = self.sample_ns('TEST:a', 'TEST:b')
+        times = np.unique(times[(times >= self.t0.timestamp() * 1e9)
+                              & (times <= self.t1.timestamp() * 1e9)])
+        np.testing.assert_array_equal(res.times, times)
+        np.testing.assert_array_equal(res.values[:, 1],
+                                      self.reference('TEST:a', res.times))
+        # explicit grid of times; naive times are UTC
+        grid = [datetime.datetime(2018, 1, 1), datetime.datetime(2018, 1, 1, 1)]
+        res = self.archiver.getAligned(['TEST:a'], t0=self.t0, t1=self.t1,
+                                       grid=grid)
+        self.assertEqual(res.times[0], 1514764800 * 10**9)
+        with self.assertRaises(ValueError):
+            self.archiver.getAligned(['TEST:a'], t0=self.t0, t1=self.t1,
+                                     grid=grid[::-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
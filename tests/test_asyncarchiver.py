@@ -0,0 +1,106 @@
+import asyncio
+import datetime
+import unittest
+from urllib.error import HTTPError
+
+from bact_archiver.asyncarchiver import AsyncArchiver
+from fake_appliance import FakeAppliance, read_test_data
+
+_utc = datetime.timezone.utc
+t0 = datetime.datetime(2017, 11, 1, tzinfo=_utc)
+t1 = datetime.datetime(2017, 11, 2, tzinfo=_utc)
+
+
+class AsyncArchiverTest(unittest.TestCase):
+    """Coroutine interface to the appliance
+    """
+
+    def setUp(self):
+        data = {
+            'TOPUPCC:rdCur': read_test_data('201710010200_rdCur.pb'),
+            'CUMZR:MBcurrent': read_test_data('20171101_MBcurrent.pb'),
+        }
+        metadata = {'TOPUPCC:rdCur': {'elementCount': '1',
+                                      'DBRType': 'DBR_SCALAR_DOUBLE'}}
+        self.appliance = FakeAppliance(data=data, metadata=metadata)
+        self.appliance.__enter__()
+
+    def tearDown(self):
+        self.appliance.__exit__(None, None, None)
+
+    def test00_get_data(self):
+        async def run():
+            async with AsyncArchiver(config=self.appliance.config()) as archiver:
+                small = await archiver.getData('TOPUPCC:rdCur', t0=t0, t1=t1)
+                # decoded in the thread pool
+                large = await archiver.getData('CUMZR:MBcurrent', t0=t0, t1=t1,
+                                               return_type='raw')
+            return small, large
+
+        small, large = asyncio.run(run())
+        self.assertEqual(len(small), 56)
+        header, values, secs, nanos = large
+        self.assertEqual(values.shape, (121, 400))
+
+    def test01_many_in_flight(self):
+        async def run():
+            async with AsyncArchiver(config=self.appliance.config()) as archiver:
+                tasks = [archiver.getData('TOPUPCC:rdCur', t0=t0, t1=t1)
+                         for _ in range(20)]
+                return await asyncio.gather(*tasks)
+
+        results = asyncio.run(run())
+        self.assertEqual([len(df) for df in results], [56] * 20)
+        self.assertEqual(len(self.appliance.requests), 20)
+
+    def test02_bpl(self):
+        async def run():
+            async with AsyncArchiver(config=self.appliance.config()) as archiver:
+                pvs = await archiver.getMatchingPVs()
+                info = await archiver.getTypeInfo('TOPUPCC:rdCur')
+                raw = await archiver.requestData('TOPUPCC:rdCur', t0=t0, t1=t1)
+            return pvs, info, raw
+
+        pvs, info, raw = asyncio.run(run())
+        self.assertEqual(pvs, ['CUMZR:MBcurrent', 'TOPUPCC:rdCur'])
+        self.assertEqual(info['elementCount'], '1')
+        self.assertEqual(raw, read_test_data('201710010200_rdCur.pb'))
+        # all requests sent over a single keep alive connection
+        self.assertEqual(len(self.appliance.connections), 1)
+
+    def test03_failures(self):
+        async def run():
+            async with AsyncArchiver(config=self.appliance.config()) as archiver:
+                return await archiver.getDataMany(['TOPUPCC:rdCur', 'unknown'],
+                                                  t0=t0, t1=t1)
+
+        data, errors = asyncio.run(run())
+        self.assertEqual(list(data.keys()), ['TOPUPCC:rdCur'])
+        self.assertIsInstance(errors['unknown'], HTTPError)
+
+    def test04_options(self):
+        async def run():
+            async with AsyncArchiver(config=self.appliance.config()) as archiver:
+                raw = await archiver.getData('CUMZR:MBcurrent', t0=t0, t1=t1,
+                                             return_type='raw',
+                                             decode_threads=2, with_info=True)
+                # samples without info are cached separately
+                again = await archiver.getData('CUMZR:MBcurrent', t0=t0,
+                                               t1=t1, return_type='raw')
+                with self.assertRaisesRegex(TypeError, 'max_bytes'):
+                    await archiver.getData('TOPUPCC:rdCur', t0=t0, t1=t1,
+                                           max_bytes=100)
+                with self.assertRaises(ValueError):
+                    await archiver.getData('TOPUPCC:rdCur', t0=t0, t1=t1,
+                                           bin_seconds=60)
+            return raw, again
+
+        raw, again = asyncio.run(run())
+        self.assertEqual(len(raw), 5)
+        self.assertEqual(len(raw[4].severity), 121)
+        self.assertEqual(again[1].shape, (121, 400))
+        self.assertEqual(len(self.appliance.requests), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import datetime
+import os
+import unittest
+
+import numpy as np
+
+from bact_archiver.carchiver import get_data, get_data_from_archiver
+from bact_archiver.columnar import to_arrow
+from common import test_data_dir
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+
+def read(fname):
+    with open(os.path.join(test_data_dir, fname), 'rb') as f:
+        return f.read()
+
+
+def address(arr):
+    return arr.__array_interface__['data'][0]
+
+
+@unittest.skipIf(pa is None, 'pyarrow not installed')
+class ArrowTest(unittest.TestCase):
+    """Arrow tables wrapping the decoded arrays
+    """
+
+    def test00_scalar(self):
+        data = read('201710010200_rdCur.pb')
+        header, values, secs, nanos = get_data(data, return_type='raw')
+        table = get_data(data, return_type='arrow')
+        self.assertEqual(table.column_names, ['timestamp', 'val'])
+        self.assertEqual(table.schema.field('timestamp').type,
+                         pa.timestamp('ns', tz='UTC'))
+        np.testing.assert_array_equal(table['val'].to_numpy(), values)
+        ref = get_data(data, time_format='timestamp').index.values
+        times = table['timestamp'].to_numpy().view(np.int64)
+        np.testing.assert_allclose(times / 1e9, ref)
+        self.assertIn(b'TOPUPCC:rdCur', table.schema.metadata[b'header'])
+
+    def test01_no_copy(self):
+        data = read('20171101_sram_mean.pb')
+        header, values, secs, nanos = get_data(data, return_type='raw')
+        table = get_data(data, return_type='arrow', time_format='raw')
+        self.assertEqual(table.column_names, ['timestamp', 'second', 'ns', 'val'])
+        self.assertEqual(table.schema.field('val').type,
+                         pa.list_(pa.float32(), header.elementCount))
+        col = table['val'].chunk(0)
+        np.testing.assert_array_equal(
+            col.flatten().to_numpy().reshape(values.shape), values)
+        # the arrow buffers are the ones of numpy
+        res, times, header = get_data_from_archiver(data)
+        values, secs, nanos = res[0]
+        table = to_arrow(header, values, times, secs, nanos)
+        buf = table['val'].chunk(0).values.buffers()[1]
+        self.assertEqual(buf.address, address(values))
+        buf = table['timestamp'].chunk(0).buffers()[1]
+        self.assertEqual(buf.address, address(times))
+
+    def test02_strings(self):
+        table = get_data(read('20171101_stGun.pb'), return_type='arrow')
+        self.assertEqual(table.schema.field('val').type, pa.binary())
+        self.assertEqual(table['val'][0].as_py(), b'GunHV PS Ready')
+
+    def test03_padding(self):
+        data = read('201710010200_rdCur.pb')
+        t0 = datetime.datetime(2017, 10, 1, 2, tzinfo=datetime.timezone.utc)
+        t1 = datetime.datetime(2017, 10, 1, 3, tzinfo=datetime.timezone.utc)
+        header, values, secs, nanos = get_data(data, return_type='raw')
+        table = get_data(data, return_type='arrow', padding=True,
+                         t_start=t0, t_stop=t1)
+        self.assertEqual(len(table), len(values) + 1)
+        times = table['timestamp'].to_pylist()
+        self.assertEqual((times[0], times[-1]), (t0, t1))
+        self.assertEqual(table['val'][-1].as_py(), values[-1])
+
+
+@unittest.skipIf(pa is None or pl is None, 'polars not installed')
+class PolarsTest(unittest.TestCase):
+    """polars DataFrames created from the arrow tables
+    """
+
+    def test00_waveform(self):
+        data = read('20171101_MBcurrent.pb')
+        header, values, secs, nanos = get_data(data, return_type='raw')
+        df = get_data(data, return_type='polars', with_info=True)
+        self.assertEqual(df.columns, ['timestamp', 'val', 'severity', 'status',
+                                      'repeatcount'])
+        self.assertEqual(df.schema['timestamp'], pl.Datetime('ns', 'UTC'))
+        self.assertEqual(df.schema['val'],
+                         pl.Array(pl.Float64, header.elementCount))
+        np.testing.assert_array_equal(df['val'].to_numpy(), values)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -26,3 +26,56 @@ def test_convert_date_time():
 
     for dt, t_nsec in zip(time_deltas, nsecs):
         assert dt == np.timedelta64(t_nsec, "ns")
+
+
+def test_convert_epoch_ns():
+    from bact_archiver.utils import convert_epoch_ns
+
+    years = [2017, 2017, 2018, 2018]
+    seconds = [31535999, 31535999, 0, 86400]
+    nsecs = [0, 999999999, 1, 500]
+    ref = convert_data_time(years, seconds, nsecs)
+
+    start = {2017: 1483228800, 2018: 1514764800}
+    times = [
+        (start[y] + s) * 10**9 + ns for y, s, ns in zip(years, seconds, nsecs)
+    ]
+    dt = convert_epoch_ns(np.array(times, dtype=np.int64))
+    assert dt.equals(ref)
+    assert dt.name == "datetime"
+
+
+def test_year_start_ns():
+    import datetime
+
+    from bact_archiver.utils import year_start_ns
+
+    years = [1970, 1999, 2000, 2017, 2018, 2024, 2100]
+    ref = [
+        int(datetime.datetime(y, 1, 1, tzinfo=datetime.timezone.utc).timestamp())
+        * 10**9
+        for y in years
+    ]
+    np.testing.assert_array_equal(year_start_ns(years), ref)
+
+
+def test_timestamp_over_new_year():
+    import datetime
+
+    from bact_archiver.carchiver import get_data
+    from fake_appliance import ScalarSeries
+
+    utc = datetime.timezone.utc
+    start = int(datetime.datetime(2017, 12, 31, 23, tzinfo=utc).timestamp())
+    times = [start + 600 * i + 0.5 for i in range(12)]
+    series = ScalarSeries("TEST:ramp", times, range(12))
+    data = series(
+        "TEST:ramp", "2017-12-31T23:00:00.000000Z", "2018-01-01T01:00:00.000000Z"
+    )
+
+    df = get_data(data, time_format="timestamp")
+    np.testing.assert_allclose(df.index.values, times, rtol=0, atol=1e-6)
+
+    df = get_data(data, time_format="datetime")
+    ref = [datetime.datetime.fromtimestamp(t, utc) for t in times]
+    assert list(df.index) == ref
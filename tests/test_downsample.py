@@ -0,0 +1,130 @@
+import os
+import unittest
+
+import numpy as np
+
+from bact_archiver import epics_event_pb2 as proto
+from bact_archiver.carchiver import get_data
+from bact_archiver.epics_event import lttb_indices, minmax_indices
+from common import make_pb, test_data_dir
+
+
+def lttb_reference(x, y, n_out):
+    '''Straight forward python implementation of LTTB
+    '''
+    x = x - x[0]
+    m, d = len(x) - 2, n_out - 2
+    selected = [0]
+    for k in range(n_out - 2):
+        start = k * m // d + 1
+        stop = (k + 1) * m // d + 1
+        nstop = len(x) if k == n_out - 3 else (k + 2) * m // d + 1
+        nstart = len(x) - 1 if k == n_out - 3 else stop
+        cx, cy = x[nstart:nstop].mean(), y[nstart:nstop].mean()
+        a = selected[-1]
+        area = np.abs((x[a] - cx) * (y[start:stop] - y[a])
+                      - (x[a] - x[start:stop]) * (cy - y[a]))
+        selected.append(start + int(np.argmax(area)))
+    selected.append(len(x) - 1)
+    return np.array(selected)
+
+
+class DownsampleTest(unittest.TestCase):
+    """Min/max per time bucket and Largest-Triangle-Three-Buckets
+    """
+
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.times = np.cumsum(rng.integers(1, 10**9, 5000)).astype(np.int64)
+        self.values = np.cumsum(rng.normal(size=5000))
+
+    def test00_lttb(self):
+        for dtype in (np.float64, np.float32, np.int32, np.int16):
+            with self.subTest(dtype=dtype):
+                values = (self.values * 10).astype(dtype)
+                idx = lttb_indices(self.times, values, 200)
+                np.testing.assert_array_equal(
+                    idx, lttb_reference(self.times.astype(float),
+                                        values.astype(float), 200))
+        idx = lttb_indices(self.times[:10], self.values[:10], 20)
+        np.testing.assert_array_equal(idx, np.arange(10))
+        with self.assertRaises(ValueError):
+            lttb_indices(self.times, self.values, 2)
+
+    def test01_minmax(self):
+        buckets = 100
+        idx = minmax_indices(self.times, self.values, buckets)
+        self.assertLessEqual(len(idx), 2 * buckets)
+        self.assertTrue(np.all(np.diff(idx) > 0))
+        # global extrema are kept
+        self.assertIn(np.argmin(self.values), idx)
+        self.assertIn(np.argmax(self.values), idx)
+        # NaNs are skipped
+        values = np.array([1, 5, 2, np.nan, 0.])
+        idx = minmax_indices(self.times[:5], values, 1)
+        np.testing.assert_array_equal(idx, [1, 4])
+        self.assertEqual(len(minmax_indices(self.times[:0], values[:0], 10)), 0)
+
+    def test02_get_data(self):
+        with open(os.path.join(test_data_dir, '201710010200_rdCur.pb'), 'rb') as f:
+            data = f.read()
+        df = get_data(data)
+        ref = lttb_reference(df.index.values, df.values[:, 0], 20)
+        small = get_data(data, downsample=('lttb', 20))
+        np.testing.assert_array_equal(small.index.values, df.index.values[ref])
+        np.testing.assert_array_equal(small.values[:, 0],
+                                      df.values[:, 0][ref])
+        header, values, secs, nanos = get_data(
+            data, return_type='raw', downsample=('minmax', 10))
+        self.assertLessEqual(len(values), 20)
+        with self.assertRaises(ValueError):
+            get_data(data, downsample=('median', 10))
+        with open(os.path.join(test_data_dir, '20171101_MBcurrent.pb'), 'rb') as f:
+            with self.assertRaises(ValueError):
+                get_data(f.read(), downsample=('lttb', 10))
+
+    def test03_sample_info(self):
+        header = proto.PayloadInfo(type=6, pvname='TEST:val', year=2017,
+                                   elementCount=1)
+        events = [proto.ScalarDouble(secondsintoyear=i, nano=0, val=v,
+                                     severity=i % 3)
+                  for i, v in enumerate([0, 10, 0, 0, -10, 0])]
+        events[4].fieldvalues.add(name='cnxlostepsecs', val='12')
+        events[2].fieldvalues.add(name='cnxregainedepsecs', val='13')
+        res = get_data(make_pb([(header, events)]), return_type='raw',
+                       with_info=True, downsample=('minmax', 1))
+        values, info = res[1], res[4]
+        np.testing.assert_array_equal(values, [10, -10])
+        np.testing.assert_array_equal(info.severity, [1, 1])
+        np.testing.assert_array_equal(info.fields.index, [1])
+        np.testing.assert_array_equal(info.fields.name, ['cnxlostepsecs'])
+
+    def test04_lttb_buckets(self):
+        rng = np.random.default_rng(3)
+        for N in (4, 5, 7, 10, 11, 97, 100, 101, 1000, 4999):
+            for n_out in sorted({3, 4, 5, 7, N // 3 + 2, N // 2 + 1, N - 1}):
+                if not 3 <= n_out < N:
+                    continue
+                with self.subTest(N=N, n_out=n_out):
+                    # constant values: the first sample of each bucket
+                    idx = lttb_indices(self.times[:N], np.zeros(N), n_out)
+                    self.assertEqual(len(idx), n_out)
+                    self.assertTrue(np.all(np.diff(idx) > 0))
+                    # the buckets are adjacent, not empty and cover
+                    # the samples 1 .. N - 2
+                    k = np.arange(n_out - 2)
+                    starts = k * (N - 2) // (n_out - 2) + 1
+                    np.testing.assert_array_equal(idx[1:-1], starts)
+                    stops = (k + 1) * (N - 2) // (n_out - 2) + 1
+                    np.testing.assert_array_equal(starts[1:], stops[:-1])
+                    self.assertTrue(np.all(stops > starts))
+                    self.assertEqual(stops[-1], N - 1)
+                    values = rng.normal(size=N)
+                    np.testing.assert_array_equal(
+                        lttb_indices(self.times[:N], values, n_out),
+                        lttb_reference(self.times[:N].astype(float), values,
+                                       n_out))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import datetime
+import unittest
+
+import numpy as np
+
+from bact_archiver.carchiver import Archiver
+from bact_archiver.follow import RingBuffer
+from fake_appliance import FakeAppliance, ScalarSeries
+
+_utc = datetime.timezone.utc
+
+
+class RingBufferTest(unittest.TestCase):
+    """Fixed capacity buffer handing out contiguous views
+    """
+
+    def test00_wrap(self):
+        buf = RingBuffer(5)
+        times, values = buf.view()
+        self.assertEqual(len(times), 0)
+        for start, n in ((0, 3), (3, 4), (7, 1), (8, 12)):
+            buf.append(np.arange(start, start + n),
+                       np.arange(start, start + n) * 10.)
+            times, values = buf.view()
+            expected = np.arange(max(start + n - 5, 0), start + n)
+            np.testing.assert_array_equal(times, expected)
+            np.testing.assert_array_equal(values, expected * 10)
+            # views, no copies
+            self.assertIs(values.base, buf.values)
+        self.assertEqual(len(buf), 5)
+
+    def test01_waveforms_and_strings(self):
+        buf = RingBuffer(3)
+        buf.append(np.arange(2), np.ones((2, 4)))
+        with self.assertRaises(ValueError):
+            buf.append(np.arange(2, 4), np.ones((2, 3)))
+        buf = RingBuffer(3)
+        buf.append(np.arange(2), np.array([b'a', b'b']))
+        buf.append(np.arange(2, 4), np.array([b'longer', b'c']))
+        np.testing.assert_array_equal(buf.view()[1], [b'b', b'longer', b'c'])
+
+
+class FollowerTest(unittest.TestCase):
+    """Polling only the samples since the last poll
+    """
+
+    def setUp(self):
+        self.start = datetime.datetime(2018, 1, 1, tzinfo=_utc)
+        times = [self.start.timestamp() + 10 * i + 0.25 for i in range(1000)]
+        self.series = {
+            'TEST:a': ScalarSeries('TEST:a', times, np.arange(1000)),
+            'TEST:b': ScalarSeries('TEST:b', times[::7], np.arange(0, 1000, 7)),
+        }
+        self.appliance = FakeAppliance(data=dict(self.series))
+        self.appliance.__enter__()
+        self.archiver = Archiver(config=self.appliance.config())
+
+    def tearDown(self):
+        self.archiver.close()
+        self.appliance.__exit__(None, None, None)
+
+    def test00_poll(self):
+        follower = self.archiver.follow(['TEST:a', 'TEST:b', 'TEST:missing'],
+                                        window=datetime.timedelta(minutes=10),
+                                        capacity=100)
+        now = self.start + datetime.timedelta(minutes=30)
+        counts, errors = follower.poll(now=now)
+        self.assertEqual(set(errors), {'TEST:missing'})
+        # the last sample before the window is included
+        self.assertEqual(counts['TEST:a'], 61)
+        times, values = follower.window('TEST:a')
+        np.testing.assert_array_equal(values, np.arange(119, 180))
+
+        n_requests = len(self.appliance.requests)
+        counts, errors = follower.poll(now=now + datetime.timedelta(minutes=1))
+        self.assertEqual(counts, {'TEST:a': 6, 'TEST:b': 1})
+        requests = {query['pv']: query for _, query in
+                    self.appliance.requests[n_requests:]}
+        # only the time since the last sample is requested
+        self.assertEqual(requests['TEST:a']['from'],
+                         '2018-01-01T00:29:50.000000Z')
+        times, values = follower.window('TEST:a')
+        np.testing.assert_array_equal(values, np.arange(125, 186))
+        end = self.start + datetime.timedelta(seconds=1850.25)
+        self.assertEqual(times[-1], int(end.timestamp()) * 10**9 + 250000000)
+
+        # nothing new
+        counts, _ = follower.poll(now=now + datetime.timedelta(minutes=1))
+        self.assertEqual(counts['TEST:a'], 0)
+        # more than the capacity
+        counts, _ = follower.poll(now=now + datetime.timedelta(minutes=60))
+        self.assertEqual(counts['TEST:a'], 354)
+        times, values = follower.data('TEST:a')
+        np.testing.assert_array_equal(values, np.arange(440, 540))
+        times, values = follower.window('TEST:b')
+        np.testing.assert_array_equal(values, np.arange(476, 540, 7))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import datetime
+import threading
+import time
+import unittest
+from urllib.error import HTTPError
+
+from bact_archiver.carchiver import Archiver
+from fake_appliance import FakeAppliance, read_test_data
+
+_utc = datetime.timezone.utc
+t0 = datetime.datetime(2017, 11, 1, tzinfo=_utc)
+t1 = datetime.datetime(2017, 11, 2, tzinfo=_utc)
+
+
+class GetDataManyTest(unittest.TestCase):
+    """Fetch several pvs in parallel
+    """
+
+    def setUp(self):
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+        def slow(fname):
+            data = read_test_data(fname)
+
+            def serve(pvname, t0, t1):
+                with self.lock:
+                    self.active += 1
+                    self.max_active = max(self.active, self.max_active)
+                time.sleep(0.05)
+                with self.lock:
+                    self.active -= 1
+                return data
+            return serve
+
+        data = {
+            'TOPUPCC:rdCur': slow('201710010200_rdCur.pb'),
+            'TOPUPCC:numShots': slow('20171101_numShots.pb'),
+            'TOPUPCC:selTrgSR': slow('20171101_selTrgSR.pb'),
+            'CUMZR:MBcurrent': slow('20171101_MBcurrent.pb'),
+        }
+        self.appliance = FakeAppliance(data=data)
+        self.appliance.__enter__()
+
+    def tearDown(self):
+        self.appliance.__exit__(None, None, None)
+
+    def test00_all_pvs(self):
+        archiver = Archiver(config=self.appliance.config(max_workers='2'))
+        pvnames = list(self.appliance.data.keys())
+        data, errors = archiver.getDataMany(pvnames, t0=t0, t1=t1)
+        archiver.close()
+
+        self.assertEqual(errors, {})
+        self.assertEqual(list(data.keys()), pvnames)
+        self.assertEqual(len(data['TOPUPCC:rdCur']), 56)
+        self.assertEqual(data['CUMZR:MBcurrent'].shape, (121, 400))
+        # limited by max_workers
+        self.assertLessEqual(self.max_active, 2)
+
+    def test01_failure_reported_per_pv(self):
+        archiver = Archiver(config=self.appliance.config())
+        data, errors = archiver.getDataMany(['TOPUPCC:numShots', 'unknown'],
+                                            t0=t0, t1=t1, return_type='raw')
+        archiver.close()
+
+        self.assertEqual(list(data.keys()), ['TOPUPCC:numShots'])
+        header, values, secs, nanos = data['TOPUPCC:numShots']
+        self.assertEqual(len(values), 29)
+        self.assertEqual(list(errors.keys()), ['unknown'])
+        self.assertIsInstance(errors['unknown'], HTTPError)
+
+
+if __name__ == "__main__":
+    unittest.main()
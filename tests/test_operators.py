@@ -0,0 +1,127 @@
+import asyncio
+import bisect
+import datetime
+import unittest
+
+import numpy as np
+
+from bact_archiver import epics_event_pb2 as proto
+from bact_archiver.asyncarchiver import AsyncArchiver
+from bact_archiver.carchiver import (Archiver, ApplianceOperators, dquote,
+                                     operator_name)
+from common import make_pb
+from fake_appliance import FakeAppliance, ScalarSeries, _request_fmt
+
+_utc = datetime.timezone.utc
+
+
+def parse(t):
+    return datetime.datetime.strptime(t, _request_fmt).replace(tzinfo=_utc)
+
+
+class OperatorTest(unittest.TestCase):
+    """Data reduced by the post processors of the appliance
+    """
+
+    def setUp(self):
+        # a sample every 10 minutes for 4 days
+        self.t0 = datetime.datetime(2018, 3, 1, tzinfo=_utc)
+        self.t1 = self.t0 + datetime.timedelta(days=4)
+        start = self.t0.timestamp()
+        times = [start + 600 * i + 0.5 for i in range(6 * 24 * 4)]
+        self.series = ScalarSeries('TEST:ramp', times, np.arange(len(times)))
+        self.appliance = FakeAppliance(
+            data={'TEST:ramp': self.series, 'ncount(TEST:ramp)': self.ncount,
+                  'mean_3600(TEST:ramp)': self.mean(3600),
+                  'mean_3456(TEST:ramp)': self.mean(3456)},
+            metadata={'TEST:ramp': {'elementCount': '1',
+                                    'DBRType': 'DBR_SCALAR_DOUBLE'}})
+        self.appliance.__enter__()
+        self.archiver = Archiver(config=self.appliance.config())
+
+    def tearDown(self):
+        self.archiver.close()
+        self.appliance.__exit__(None, None, None)
+
+    def ncount(self, pvname, t0, t1):
+        n = (bisect.bisect_right(self.series.times, parse(t1).timestamp())
+             - bisect.bisect_left(self.series.times, parse(t0).timestamp()))
+        header = proto.PayloadInfo(type=6, pvname=pvname, year=2018,
+                                   elementCount=1)
+        event = proto.ScalarDouble(secondsintoyear=0, nano=0, val=n)
+        return make_pb([(header, [event])])
+
+    def mean(self, seconds):
+        def compute(pvname, t0, t1):
+            times = np.array(self.series.times)
+            bins = (times - parse(t0).timestamp()) // seconds
+            starts, means = [], []
+            for b in np.unique(bins):
+                starts.append(parse(t0).timestamp() + b * seconds)
+                means.append(np.mean(np.array(self.series.values)[bins == b]))
+            return ScalarSeries(pvname, starts, means)(pvname, t0, t1)
+        return compute
+
+    def test00_operator_name(self):
+        self.assertEqual(operator_name('mean'), 'mean')
+        self.assertEqual(operator_name(ApplianceOperators.max, 60), 'max_60')
+        self.assertEqual(dquote('A:b', 'mean', 60), 'mean_60%28A%3Ab%29')
+        self.assertEqual(dquote('A:b', 'raw'), 'A%3Ab')
+        with self.assertRaises(ValueError):
+            operator_name('average', 60)
+        with self.assertRaises(ValueError):
+            operator_name('mean', 0)
+        with self.assertRaises(ValueError):
+            dquote('A:b', 'raw', 60)
+
+    def test01_bin_seconds(self):
+        df = self.archiver.getData('TEST:ramp', t0=self.t0, t1=self.t1,
+                                   operator='mean', bin_seconds=3600)
+        self.assertEqual(len(df), 96)
+        np.testing.assert_allclose(df.values[:3, 0], [2.5, 8.5, 14.5])
+        pvs = [query['pv'] for _, query in self.appliance.requests]
+        self.assertEqual(pvs, ['mean_3600(TEST:ramp)'])
+        # raw data is cached separately
+        df = self.archiver.getData('TEST:ramp', t0=self.t0, t1=self.t1)
+        self.assertEqual(len(df), len(self.series.times))
+        with self.assertRaises(ValueError):
+            self.archiver.getData('TEST:ramp', t0=self.t0, t1=self.t1,
+                                  bin_seconds=60)
+
+    def test02_auto(self):
+        df = self.archiver.getData('TEST:ramp', t0=self.t0, t1=self.t1,
+                                   operator='mean', bin_seconds='auto',
+                                   target_points=100)
+        self.assertEqual(len(df), 100)
+        pvs = [query['pv'] for path, query in self.appliance.requests
+               if path.endswith('getData.raw')]
+        self.assertEqual(pvs, ['ncount(TEST:ramp)', 'mean_3456(TEST:ramp)'])
+
+        # few samples: the raw data is returned
+        df = self.archiver.getData('TEST:ramp', t0=self.t0, t1=self.t1,
+                                   operator='mean', bin_seconds='auto')
+        self.assertEqual(len(df), len(self.series.times))
+        self.assertEqual(self.appliance.requests[-1][1]['pv'], 'TEST:ramp')
+
+    def test03_async(self):
+        async def run():
+            async with AsyncArchiver(config=self.appliance.config()) as archiver:
+                binned = await archiver.getData(
+                    'TEST:ramp', t0=self.t0, t1=self.t1, operator='mean',
+                    bin_seconds=3600)
+                auto = await archiver.getData(
+                    'TEST:ramp', t0=self.t0, t1=self.t1, operator='mean',
+                    bin_seconds='auto', target_points=100)
+            return binned, auto
+
+        binned, auto = asyncio.run(run())
+        np.testing.assert_allclose(binned.values[:3, 0], [2.5, 8.5, 14.5])
+        self.assertEqual(len(auto), 100)
+        pvs = [query['pv'] for path, query in self.appliance.requests
+               if path.endswith('getData.raw')]
+        self.assertEqual(pvs, ['mean_3600(TEST:ramp)', 'ncount(TEST:ramp)',
+                               'mean_3456(TEST:ramp)'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,163 @@
+import datetime
+import io
+import os
+import threading
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from bact_archiver import carchiver, epics_event_pb2 as proto
+from bact_archiver.carchiver import (get_data, get_data_from_archiver,
+                                     get_data_from_stream)
+from bact_archiver.carchiver import Archiver
+from common import make_pb, test_data_dir
+from fake_appliance import FakeAppliance
+
+
+class ParallelDecodeTest(unittest.TestCase):
+    """Chunks decoded on several threads into one preallocated array
+    """
+
+    def read(self, fname):
+        with open(os.path.join(test_data_dir, fname), 'rb') as f:
+            return f.read()
+
+    def setUp(self):
+        # decode small test data in parallel too
+        patcher = mock.patch.object(carchiver, 'parallel_decode_min_bytes', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def compare(self, data, threads):
+        ref_res, ref_times, ref_header = get_data_from_stream(io.BytesIO(data))
+        res, times, header = get_data_from_archiver(data, threads=threads)
+        self.assertEqual(len(res), len(ref_res))
+        np.testing.assert_array_equal(times, ref_times)
+        for chunk, ref_chunk in zip(res, ref_res):
+            for arr, ref in zip(chunk, ref_chunk):
+                np.testing.assert_array_equal(arr, ref)
+        return res
+
+    def test00_chunks(self):
+        for fname in ('201710010200_rdCur.pb', '20171101_sram_mean.pb',
+                      '20171101_stGun.pb'):
+            one = self.read(fname)
+            data = b'\n'.join([one] * 5)
+            for threads in (1, 3):
+                with self.subTest(fname=fname, threads=threads):
+                    res = self.compare(data, threads)
+                    self.assertEqual(len(res), 5)
+
+    def test01_no_concatenate(self):
+        one = self.read('20171101_MBcurrent.pb')
+        data = b'\n'.join([one] * 4)
+        res, times, header = get_data_from_archiver(data, threads=2)
+        base = res[0][0].base
+        self.assertIsNotNone(base)
+        for arrays in zip(*res):
+            joined = carchiver._join(list(arrays))
+            self.assertEqual(len(joined), 4 * len(res[0][0]))
+            self.assertIsNotNone(joined.base)
+        self.assertIs(carchiver._join([r[0] for r in res]).base, base)
+
+        header, values, secs, nanos = get_data(data, return_type='raw')
+        np.testing.assert_array_equal(values, base)
+
+    def test02_mixed_element_count(self):
+        # chunks of different shape are decoded one by one
+        data = b'\n'.join([self.read('20171101_MBcurrent.pb'),
+                           self.read('20171101_sram_mean.pb')])
+        self.compare(data, threads=2)
+
+
+    def test03_split_chunk(self):
+        data = self.read('20171101_sram_maxrms.pb')
+        with mock.patch.object(carchiver, 'parallel_decode_min_samples', 10), \
+                mock.patch.object(carchiver, 'fill_rows',
+                                  wraps=carchiver.fill_rows) as fill:
+            res = self.compare(data, threads=4)
+        self.assertEqual(len(res), 1)
+        # 121 samples in ranges of 31
+        self.assertEqual(fill.call_count, 4)
+        self.assertEqual([len(call.args[2]) for call in fill.call_args_list],
+                         [31, 31, 31, 28])
+
+    def test04_archiver(self):
+        data = {'CUMZR:MBcurrent': self.read('20171101_MBcurrent.pb')}
+        with FakeAppliance(data=data) as appliance:
+            archiver = Archiver(config=appliance.config(decode_threads='2'))
+            self.assertEqual(archiver.config.decode_threads, 2)
+            t0 = datetime.datetime(2017, 11, 1, tzinfo=datetime.timezone.utc)
+            t1 = datetime.datetime(2017, 11, 2, tzinfo=datetime.timezone.utc)
+            kw = dict(t0=t0, t1=t1, use_cache=False, return_type='raw')
+            with mock.patch.object(carchiver, 'get_data_from_stream',
+                                   wraps=carchiver.get_data_from_stream) as stream:
+                ref = archiver.getData('CUMZR:MBcurrent', decode_threads=None, **kw)
+                self.assertEqual(stream.call_count, 0)
+                archiver.config.decode_threads = None
+                streamed = archiver.getData('CUMZR:MBcurrent', **kw)
+                self.assertEqual(stream.call_count, 1)
+                threaded = archiver.getData('CUMZR:MBcurrent', decode_threads=3,
+                                            **kw)
+                self.assertEqual(stream.call_count, 1)
+            archiver.close()
+        for arr, ref_arr in zip(streamed[1:], ref[1:]):
+            np.testing.assert_array_equal(arr, ref_arr)
+        for arr, ref_arr in zip(threaded[1:], ref[1:]):
+            np.testing.assert_array_equal(arr, ref_arr)
+
+
+    def test06_concurrent_thread_counts(self):
+        # calls with different thread counts share the decode pool
+        one = self.read('20171101_sram_mean.pb')
+        data = b'\n'.join([one] * 6)
+        ref = get_data(data, return_type='raw')[1]
+        errors = []
+
+        def run(k):
+            try:
+                for i in range(25):
+                    threads = 1 + (i + k) % 12
+                    res, _, _ = get_data_from_archiver(data, threads=threads)
+                    values = carchiver._join([r[0] for r in res])
+                    np.testing.assert_array_equal(values, ref)
+            except Exception as exc:
+                errors.append(exc)
+
+        workers = [threading.Thread(target=run, args=(k,)) for k in range(8)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(errors, [])
+
+    def test05_sample_info(self):
+        chunks = []
+        for k in range(3):
+            header = proto.PayloadInfo(type=6, pvname='TEST:i', year=2017 + k,
+                                       elementCount=1)
+            events = [proto.ScalarDouble(secondsintoyear=i, nano=0, val=i,
+                                         severity=i % 4, status=i % 3)
+                      for i in range(100)]
+            for i in range(k, 100, 7):
+                events[i].fieldvalues.add(name='N', val=str(100 * k + i))
+            chunks.append((header, events))
+        data = make_pb(chunks)
+        ref = get_data_from_archiver(data, threads=1, with_info=True)
+        with mock.patch.object(carchiver, 'parallel_decode_min_samples', 10):
+            res, times, header, info = get_data_from_archiver(
+                data, threads=3, with_info=True)
+        for name in ('severity', 'status', 'repeatcount'):
+            np.testing.assert_array_equal(getattr(info, name),
+                                          getattr(ref[3], name))
+            self.assertEqual(len(getattr(info, name)), 300)
+        for arr, ref_arr in zip(info.fields, ref[3].fields):
+            np.testing.assert_array_equal(arr, ref_arr)
+        # index of the field values counts over all chunks
+        expected = [100 * k + i for k in range(3) for i in range(k, 100, 7)]
+        self.assertEqual(info.fields.index.tolist(), expected)
+        self.assertEqual(info.fields.value.tolist(), [str(i) for i in expected])
+
+if __name__ == "__main__":
+    unittest.main()
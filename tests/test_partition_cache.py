@@ -0,0 +1,144 @@
+import datetime
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from bact_archiver.carchiver import Archiver
+from bact_archiver.partition_cache import PartitionCache
+from fake_appliance import FakeAppliance, ScalarSeries
+
+_utc = datetime.timezone.utc
+
+
+class PartitionCacheTest(unittest.TestCase):
+    """Requests answered from daily partitions stored on disk
+    """
+
+    def setUp(self):
+        # a sample every 30 minutes over new year
+        start = datetime.datetime(2017, 12, 29, tzinfo=_utc).timestamp()
+        times = [start + 1800 * i + 0.25 for i in range(48 * 6)]
+        self.series = ScalarSeries('TEST:ramp', times, np.arange(len(times)))
+        self.appliance = FakeAppliance(data={'TEST:ramp': self.series})
+        self.appliance.__enter__()
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.appliance.__exit__(None, None, None)
+        self.tmpdir.cleanup()
+
+    def archiver(self, **kwargs):
+        config = self.appliance.config(cache_dir=self.tmpdir.name, **kwargs)
+        return Archiver(config=config)
+
+    def test00_partitions(self):
+        cache = PartitionCache(self.tmpdir.name)
+        t0 = datetime.datetime(2017, 12, 30, 5, tzinfo=_utc)
+        t1 = datetime.datetime(2018, 1, 1, tzinfo=_utc)
+        partitions = cache.partitions(t0, t1)
+        self.assertEqual([p[0].day for p in partitions], [30, 31])
+        self.assertEqual(partitions[-1][1], t1)
+
+    def test01_same_as_uncached(self):
+        archiver = self.archiver()
+        t0 = datetime.datetime(2017, 12, 30, 5, 10, tzinfo=_utc)
+        t1 = datetime.datetime(2018, 1, 2, 7, 10, tzinfo=_utc)
+        ref = archiver.getData('TEST:ramp', t0=t0, t1=t1, use_cache=False,
+                               return_type='raw')
+        for _ in range(2):
+            header, values, secs, nanos = archiver.getData(
+                'TEST:ramp', t0=t0, t1=t1, return_type='raw')
+            np.testing.assert_array_equal(values, ref[1])
+            np.testing.assert_array_equal(secs, ref[2])
+            np.testing.assert_array_equal(nanos, ref[3])
+        # one uncached request, 4 partitions, then answered from disk
+        self.assertEqual(len(self.appliance.requests), 1 + 4)
+
+    def test02_recent_partitions_not_cached(self):
+        now = datetime.datetime.now(_utc)
+        times = [now.timestamp() - 600 * i for i in range(6, 0, -1)]
+        self.appliance.data['TEST:now'] = ScalarSeries('TEST:now', times,
+                                                       range(6))
+        archiver = self.archiver()
+        t0 = now - datetime.timedelta(minutes=55)
+        for _ in range(2):
+            df = archiver.getData('TEST:now', t0=t0, t1=now)
+            self.assertEqual(len(df), 6)
+        self.assertEqual(len(self.appliance.requests), 2 * len(
+            archiver.partition_cache.partitions(t0, now)))
+        self.assertEqual(archiver.partition_cache.size(), 0)
+        # only the window is requested, not the whole partition
+        fmt = '%Y-%m-%dT%H:%M:%S.000000Z'
+        starts = sorted(query['from'] for _, query in self.appliance.requests)
+        self.assertEqual(starts[0], t0.strftime(fmt))
+
+    def test03_eviction(self):
+        archiver = self.archiver(cache_size=2500)
+        t0 = datetime.datetime(2017, 12, 29, tzinfo=_utc)
+        t1 = datetime.datetime(2018, 1, 3, tzinfo=_utc)
+        archiver.getData('TEST:ramp', t0=t0, t1=t1)
+        cache = archiver.partition_cache
+        self.assertLessEqual(cache.size(), 2500)
+        # least recently used removed first
+        fnames = sorted(os.listdir(os.path.join(self.tmpdir.name, 'TEST%3Aramp')))
+        self.assertEqual(fnames[-1], '20180102T000000.pb')
+        self.assertNotIn('20171229T000000.pb', fnames)
+
+    def test04_parallel_fill(self):
+        lock = threading.Lock()
+        active = [0, 0]
+
+        def slow(pvname, t0, t1):
+            with lock:
+                active[0] += 1
+                active[1] = max(active)
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+            return self.series(pvname, t0, t1)
+
+        self.appliance.data['TEST:slow'] = slow
+        archiver = self.archiver()
+        t0 = datetime.datetime(2017, 12, 29, tzinfo=_utc)
+        t1 = datetime.datetime(2018, 1, 3, tzinfo=_utc)
+        ref = archiver.getData('TEST:ramp', t0=t0, t1=t1, use_cache=False)
+        df = archiver.getData('TEST:slow', t0=t0, t1=t1)
+        np.testing.assert_array_equal(df.values, ref.values)
+        # the 5 partitions were requested at the same time
+        self.assertGreater(active[1], 1)
+
+        # within getDataMany: the partitions are requested one after
+        # another on the worker
+        archiver = self.archiver(max_workers=1)
+        data, errors = archiver.getDataMany(
+            ['TEST:slow', 'TEST:ramp'], t0=t0,
+            t1=t1 + datetime.timedelta(days=1))
+        self.assertEqual(errors, {})
+        self.assertEqual(len(data['TEST:slow']), len(data['TEST:ramp']))
+
+    def test05_running_total(self):
+        cache = PartitionCache(self.tmpdir.name, max_bytes=10000)
+        t0 = datetime.datetime(2018, 1, 1, tzinfo=_utc)
+        with mock.patch.object(cache, '_files', wraps=cache._files) as files:
+            for i in range(20):
+                cache.put('TEST:a', t0 + datetime.timedelta(days=i), b'x' * 100)
+            # replacing a partition
+            cache.put('TEST:a', t0, b'x' * 200)
+            # the directory is scanned once to start with
+            self.assertEqual(files.call_count, 1)
+            self.assertEqual(cache._total, 2100)
+            for i in range(100):
+                cache.put('TEST:b', t0 + datetime.timedelta(days=i), b'x' * 100)
+            # and then only when the limit is exceeded
+            self.assertLessEqual(files.call_count, 1 + 21)
+        self.assertLessEqual(cache.size(), 10000)
+        self.assertEqual(cache._total, cache.size())
+
+
+if __name__ == "__main__":
+    unittest.main()
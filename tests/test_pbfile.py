@@ -0,0 +1,159 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from bact_archiver import pbfile
+from bact_archiver.carchiver import get_data
+from bact_archiver.pbfile import PBFileReader
+from common import test_data_dir
+from fake_appliance import ScalarSeries
+
+_utc = datetime.timezone.utc
+_request_fmt = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+
+def series_data(series, t0, t1):
+    return series(series.pvname, t0.strftime(_request_fmt),
+                  t1.strftime(_request_fmt))
+
+
+class PBFileReaderTest(unittest.TestCase):
+    """Memory mapped PB files and partitions of the appliance storage
+    """
+
+    def setUp(self):
+        # a sample every 37 minutes over new year
+        start = datetime.datetime(2017, 12, 20, tzinfo=_utc).timestamp()
+        times = [start + 2220 * i + 0.5 for i in range(1500)]
+        self.series = ScalarSeries('TEST:ramp', times, np.arange(len(times)))
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def write(self, fname, data):
+        fname = os.path.join(self.tmpdir, fname)
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        with open(fname, 'wb') as f:
+            f.write(data)
+        return fname
+
+    def test00_saved_file(self):
+        for src in ('201710010200_rdCur.pb', '20171101_stGun.pb',
+                    '20171101_sram_mean.pb'):
+            with self.subTest(fname=src):
+                fname = os.path.join(test_data_dir, src)
+                with open(fname, 'rb') as f:
+                    ref = get_data(f.read(), return_type='raw')
+                with PBFileReader(fname) as reader:
+                    res = reader.getData(return_type='raw')
+                for arr, ref_arr in zip(res[1:], ref[1:]):
+                    np.testing.assert_array_equal(arr, ref_arr)
+
+    def test01_window(self):
+        t0 = datetime.datetime(2017, 12, 1, tzinfo=_utc)
+        t1 = datetime.datetime(2018, 2, 1, tzinfo=_utc)
+        fname = self.write('dump.pb', series_data(self.series, t0, t1))
+        times = np.array(self.series.times)
+        windows = [
+            (datetime.datetime(2017, 12, 25, 3, 7, tzinfo=_utc),
+             datetime.datetime(2018, 1, 2, 11, tzinfo=_utc)),
+            # exactly at a sample
+            (datetime.datetime.fromtimestamp(times[10], _utc),
+             datetime.datetime.fromtimestamp(times[20], _utc)),
+            (datetime.datetime(2017, 1, 1, tzinfo=_utc),
+             datetime.datetime(2017, 12, 20, 1, tzinfo=_utc)),
+            # naive: UTC
+            (datetime.datetime(2018, 1, 1), datetime.datetime(2018, 1, 1, 2)),
+        ]
+        with PBFileReader(fname) as reader:
+            for start, end in windows:
+                with self.subTest(start=start, end=end):
+                    with mock.patch.object(pbfile, 'read_chunk',
+                                           wraps=pbfile.read_chunk) as decode:
+                        df = reader.getData(t0=start, t1=end)
+                    begin = start.replace(tzinfo=_utc).timestamp()
+                    stop = end.replace(tzinfo=_utc).timestamp()
+                    # and the last sample before the window
+                    i0 = max(np.searchsorted(times, begin) - 1, 0)
+                    expected = times[i0:][times[i0:] <= stop]
+                    np.testing.assert_allclose(df.index.values, expected)
+                    # binary search on the times only: the window is
+                    # decoded once per chunk
+                    self.assertLessEqual(decode.call_count, 2)
+                    # release the recorded views of the mapped file
+                    decode.reset_mock()
+            # only the last sample before the window
+            df = reader.getData(t0=datetime.datetime(2019, 1, 1, tzinfo=_utc))
+            np.testing.assert_allclose(df.index.values, times[-1:])
+            self.assertIsNone(reader.getData(
+                t1=datetime.datetime(2017, 1, 1, tzinfo=_utc)))
+
+    def test02_partitions(self):
+        other = ScalarSeries('TEST:other', self.series.times[:10], range(10))
+        split = datetime.datetime(2018, 1, 1, tzinfo=_utc).timestamp()
+        n = int(np.searchsorted(self.series.times, split))
+        t0 = datetime.datetime(2017, 1, 1, tzinfo=_utc)
+        t1 = datetime.datetime(2019, 1, 1, tzinfo=_utc)
+        for year, rows in ((2017, slice(0, n)), (2018, slice(n, None))):
+            part = ScalarSeries('TEST:ramp', self.series.times[rows],
+                                self.series.values[rows])
+            # storage files: a single chunk without empty line
+            data = series_data(part, t0, t1)
+            self.write('lts/TEST/ramp:{}.pb'.format(year), data.rstrip(b'\n'))
+        self.write('lts/TEST/other:2017.pb', series_data(other, t0, t1))
+        self.write('lts/TEST/empty:2016.pb', b'')
+
+        with PBFileReader(os.path.join(self.tmpdir, 'lts')) as reader:
+            self.assertEqual(len(reader.files), 4)
+            self.assertEqual(reader.pvnames(), ['TEST:other', 'TEST:ramp'])
+            with self.assertRaises(ValueError):
+                reader.getData()
+            header, values, secs, nanos = reader.getData(
+                'TEST:ramp', return_type='raw')
+            np.testing.assert_array_equal(values, self.series.values)
+            self.assertEqual(header.year, 2018)
+            df = reader.getData('TEST:other')
+            self.assertEqual(len(df), 10)
+
+    def test03_same_as_get_data(self):
+        t0 = datetime.datetime(2017, 1, 1, tzinfo=_utc)
+        t1 = datetime.datetime(2019, 1, 1, tzinfo=_utc)
+        data = series_data(self.series, t0, t1)
+        fname = self.write('dump.pb', data)
+        # partition files split at new year
+        split = datetime.datetime(2018, 1, 1, tzinfo=_utc).timestamp()
+        n = int(np.searchsorted(self.series.times, split))
+        for year, rows in ((2017, slice(0, n)), (2018, slice(n, None))):
+            part = ScalarSeries('TEST:ramp', self.series.times[rows],
+                                self.series.values[rows])
+            self.write('lts/TEST/ramp:{}.pb'.format(year),
+                       series_data(part, t0, t1).rstrip(b'\n'))
+        times = np.array(self.series.times)
+        windows = [
+            (datetime.datetime(2017, 12, 25, 3, 7, tzinfo=_utc),
+             datetime.datetime(2018, 1, 2, 11, tzinfo=_utc)),
+            (datetime.datetime.fromtimestamp(times[10], _utc),
+             datetime.datetime.fromtimestamp(times[20], _utc)),
+            # starting just after the last sample of 2017
+            (datetime.datetime.fromtimestamp(split, _utc),
+             datetime.datetime(2018, 1, 3, tzinfo=_utc)),
+            (datetime.datetime(2018, 1, 4, tzinfo=_utc), None),
+        ]
+        for path in (fname, os.path.join(self.tmpdir, 'lts')):
+            with PBFileReader(path) as reader:
+                for start, end in windows:
+                    with self.subTest(path=path, start=start, end=end):
+                        ref = get_data(data, return_type='raw',
+                                       t_start=start, t_stop=end)
+                        res = reader.getData(t0=start, t1=end,
+                                             return_type='raw')
+                        for arr, ref_arr in zip(res[1:], ref[1:]):
+                            np.testing.assert_array_equal(arr, ref_arr)
+
+
+if __name__ == "__main__":
+    unittest.main()
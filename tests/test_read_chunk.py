@@ -0,0 +1,221 @@
+import os
+import pickle
+import subprocess
+import sys
+import unittest
+
+import numpy as np
+
+from bact_archiver import epics_event_pb2 as proto
+from bact_archiver.carchiver import get_data
+from bact_archiver.epics_event import Header, read_header
+from bact_archiver.protocol_buffer import decoder_dtypes, dtypes
+from bact_archiver.pyarchiver import get_data as py_get_data
+from common import escape, make_pb, test_data_dir
+
+
+class ReadChunkTest(unittest.TestCase):
+    """Values decoded by the kernels compared to the pure python decoder
+    """
+
+    def read(self, fname):
+        with open(os.path.join(test_data_dir, fname), 'rb') as f:
+            return f.read()
+
+    def compare(self, data):
+        header, values, secs, nanos = get_data(data, return_type='raw')
+        _, ref = py_get_data(data)
+        np.testing.assert_array_equal(values, ref['value'])
+        np.testing.assert_array_equal(secs, ref['sec'])
+        np.testing.assert_array_equal(nanos, ref['ns'])
+        return header, values
+
+    def test00_waveforms(self):
+        for fname in ('20171101_MBcurrent.pb', '20171101_sram_mean.pb',
+                      '20171101_sram_maxrms.pb'):
+            with self.subTest(fname=fname):
+                self.compare(self.read(fname))
+
+    def test01_scalar_double(self):
+        # full double precision
+        header = proto.PayloadInfo(type=6, pvname='TEST:val', year=2017,
+                                   elementCount=1)
+        events = [proto.ScalarDouble(secondsintoyear=i, nano=0, val=v)
+                  for i, v in enumerate([0.1, 1 / 3, 1e300])]
+        _, values = self.compare(make_pb([(header, events)]))
+        self.assertEqual(values.dtype, np.float64)
+        self.assertEqual(values[1], 1 / 3)
+
+    def test02_element_count_mismatch(self):
+        cases = [
+            (13, proto.VectorDouble, np.nan),
+            (9, proto.VectorFloat, np.nan),
+            (12, proto.VectorInt, 0),
+            (8, proto.VectorShort, 0),
+        ]
+        for epics_type, event_type, fill in cases:
+            with self.subTest(type=epics_type):
+                header = proto.PayloadInfo(type=epics_type, pvname='TEST:wf',
+                                           year=2017, elementCount=4)
+                events = [event_type(secondsintoyear=i, nano=0,
+                                     val=list(range(1, n + 1)))
+                          for i, n in enumerate([4, 2, 6])]
+                header, values, secs, nanos = get_data(
+                    make_pb([(header, events)]), return_type='raw')
+                self.assertEqual(values.shape, (3, 4))
+                np.testing.assert_array_equal(values[0], [1, 2, 3, 4])
+                np.testing.assert_array_equal(values[1], [1, 2, fill, fill])
+                np.testing.assert_array_equal(values[2], [1, 2, 3, 4])
+
+    def test03_vector_char(self):
+        header = proto.PayloadInfo(type=11, pvname='TEST:mask', year=2017,
+                                   elementCount=3)
+        events = [proto.VectorChar(secondsintoyear=0, nano=0, val=b'\x01\n\x1b'),
+                  proto.VectorChar(secondsintoyear=1, nano=0, val=b'\x7f')]
+        header, values, secs, nanos = get_data(make_pb([(header, events)]),
+                                               return_type='raw')
+        np.testing.assert_array_equal(values, [[1, 10, 27], [127, 0, 0]])
+
+
+    def test04_all_types(self):
+        cases = [
+            (1, proto.ScalarShort, [-3, 7]),
+            (2, proto.ScalarFloat, [0.5, -1.25]),
+            (3, proto.ScalarEnum, [0, 2]),
+            (5, proto.ScalarInt, [-100000, 100000]),
+            (6, proto.ScalarDouble, [0.1, 2.5]),
+        ]
+        for epics_type, event_type, vals in cases:
+            with self.subTest(type=epics_type):
+                header = proto.PayloadInfo(type=epics_type, pvname='TEST:s',
+                                           year=2017, elementCount=1)
+                events = [event_type(secondsintoyear=i, nano=0, val=v)
+                          for i, v in enumerate(vals)]
+                header, values = self.compare(make_pb([(header, events)]))
+                self.assertEqual(values.dtype,
+                                 np.dtype(decoder_dtypes[epics_type]))
+
+        # bytes are signed characters
+        header = proto.PayloadInfo(type=4, pvname='TEST:b', year=2017,
+                                   elementCount=1)
+        events = [proto.ScalarByte(secondsintoyear=i, nano=0, val=v)
+                  for i, v in enumerate([b'\x05', b'\xff'])]
+        header, values, secs, nanos = get_data(make_pb([(header, events)]),
+                                               return_type='raw')
+        self.assertEqual(values.dtype, np.dtype(decoder_dtypes[4]))
+        np.testing.assert_array_equal(values, [5, -1])
+
+        header = proto.PayloadInfo(type=10, pvname='TEST:e', year=2017,
+                                   elementCount=2)
+        events = [proto.VectorEnum(secondsintoyear=0, nano=0, val=[1, 3])]
+        header, values = self.compare(make_pb([(header, events)]))
+        self.assertEqual(values.dtype, np.int32)
+
+    def test05_strings(self):
+        header = proto.PayloadInfo(type=0, pvname='TEST:str', year=2017,
+                                   elementCount=1)
+        events = [proto.ScalarString(secondsintoyear=i, nano=0, val=v)
+                  for i, v in enumerate(['on', 'standby\n', ''])]
+        header, values, secs, nanos = get_data(make_pb([(header, events)]),
+                                               return_type='raw')
+        self.assertEqual(values.dtype, np.dtype('S8'))
+        self.assertEqual(list(values), [b'on', b'standby\n', b''])
+
+        info = proto.PayloadInfo(type=7, pvname='TEST:wstr', year=2017,
+                                 elementCount=2)
+        events = [proto.VectorString(secondsintoyear=0, nano=0, val=['a', 'bc']),
+                  proto.VectorString(secondsintoyear=1, nano=0, val=['def'])]
+        header, values, secs, nanos = get_data(make_pb([(info, events)]),
+                                               return_type='raw')
+        self.assertEqual(values.dtype, np.dtype('S3'))
+        self.assertEqual(values.tolist(), [[b'a', b'bc'], [b'def', b'']])
+        # the python decoder keeps the types of protocol_buffer.dtypes
+        _, ref = py_get_data(make_pb([(info, events[:1])]))
+        self.assertEqual(ref['value'].dtype, np.dtype(dtypes[7]))
+        self.assertEqual(ref['value'].tolist(), [['a', 'bc']])
+
+    def test06_v4_generic_bytes(self):
+        header = proto.PayloadInfo(type=14, pvname='TEST:v4', year=2017,
+                                   elementCount=1)
+        raw = [b'\x00\x01\n\x1b', b'']
+        events = [proto.V4GenericBytes(secondsintoyear=i, nano=0, val=v)
+                  for i, v in enumerate(raw)]
+        header, values, secs, nanos = get_data(make_pb([(header, events)]),
+                                               return_type='raw')
+        self.assertEqual(values.dtype, object)
+        self.assertEqual(list(values), raw)
+
+
+    def test07_header(self):
+        info = proto.PayloadInfo(type=13, pvname='TEST:wf\n', year=2017,
+                                 elementCount=3)
+        info.headers.add(name='EGU', val='mA')
+        info.headers.add(name='PREC', val='3')
+        line = escape(info.SerializeToString())
+        header = read_header(memoryview(line).cast('c'))
+        self.assertIsInstance(header, Header)
+        self.assertEqual((header.type, header.year, header.elementCount),
+                         (13, 2017, 3))
+        self.assertEqual(header.pvname, 'TEST:wf\n')
+        self.assertEqual(header.headers, {'EGU': 'mA', 'PREC': '3'})
+        self.assertEqual(pickle.loads(pickle.dumps(header)), header)
+        with self.assertRaises(AttributeError):
+            header.year = 2018
+
+    def test08_no_protobuf_import(self):
+        code = ('import sys, bact_archiver.carchiver; '
+                'assert "bact_archiver.epics_event_pb2" not in sys.modules')
+        subprocess.run([sys.executable, '-c', code], check=True)
+
+
+    def test09_sample_info(self):
+        cases = [
+            (6, proto.ScalarDouble, [1.5, 2.5, 3.5]),
+            (0, proto.ScalarString, ['a', 'b', 'c']),
+            (9, proto.VectorFloat, [[1], [2], [3]]),
+        ]
+        for epics_type, event_type, vals in cases:
+            with self.subTest(epics_type=epics_type):
+                header = proto.PayloadInfo(type=epics_type, pvname='TEST:i',
+                                           year=2017, elementCount=1)
+                events = [event_type(secondsintoyear=i, nano=0, val=v)
+                          for i, v in enumerate(vals)]
+                events[1].severity = 3904
+                events[1].status = 14
+                events[1].fieldvalues.add(name='cnxlostepsecs',
+                                          val='1510000000')
+                events[2].repeatcount = 7
+                events[2].fieldvalues.add(name='HIHI', val='2.0')
+                header, values, secs, nanos, info = get_data(
+                    make_pb([(header, events)]), return_type='raw',
+                    with_info=True)
+                np.testing.assert_array_equal(info.severity, [0, 3904, 0])
+                self.assertEqual(info.severity.dtype, np.uint16)
+                np.testing.assert_array_equal(info.status, [0, 14, 0])
+                np.testing.assert_array_equal(info.repeatcount, [0, 0, 7])
+                self.assertEqual(info.fields.index.tolist(), [1, 2])
+                self.assertEqual(info.fields.name.tolist(),
+                                 ['cnxlostepsecs', 'HIHI'])
+                self.assertEqual(info.fields.value.tolist(),
+                                 ['1510000000', '2.0'])
+
+    def test10_sample_info_pandas(self):
+        header = proto.PayloadInfo(type=6, pvname='TEST:i', year=2017,
+                                   elementCount=1)
+        events = [proto.ScalarDouble(secondsintoyear=i, nano=0, val=i,
+                                     severity=i % 2)
+                  for i in range(4)]
+        events[3].fieldvalues.add(name='cnxregainedepsecs', val='1')
+        data = make_pb([(header, events)])
+        df = get_data(data, with_info=True)
+        self.assertEqual(list(df.columns), [0, 'severity', 'status',
+                                            'repeatcount'])
+        self.assertEqual(df['severity'].tolist(), [0, 1, 0, 1])
+        self.assertEqual(df.meta.fields.index.tolist(), [df.index[3]])
+        self.assertEqual(df.meta.fields['name'].tolist(), ['cnxregainedepsecs'])
+        # not requested: as before
+        self.assertEqual(len(get_data(data, return_type='raw')), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import datetime
+import os
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from bact_archiver.carchiver import Archiver
+from bact_archiver.result_cache import ResultCache
+from fake_appliance import FakeAppliance, read_test_data
+
+_utc = datetime.timezone.utc
+
+
+class ResultCacheTest(unittest.TestCase):
+    """Cache bounded by the size of the results
+    """
+
+    def test00_bounded_by_bytes(self):
+        cache = ResultCache(max_bytes=3000)
+        for i in range(4):
+            key = ('arch', 'pv{}'.format(i), 'raw', 't0', 't1')
+            cache.put(key, (np.zeros(100), b'x' * 100))
+        stats = cache.stats()
+        self.assertEqual(stats.entries, 3)
+        self.assertEqual(stats.evictions, 1)
+        self.assertEqual(stats.nbytes, 3 * 900)
+        self.assertIsNone(cache.get(('arch', 'pv0', 'raw', 't0', 't1')))
+        value = cache.get(('arch', 'pv3', 'raw', 't0', 't1'))
+        # copies: changes do not reach the cache
+        value[0][:] = 1
+        value = cache.get(('arch', 'pv3', 'raw', 't0', 't1'))
+        np.testing.assert_array_equal(value[0], 0)
+        stats = cache.stats()
+        self.assertEqual((stats.hits, stats.misses), (2, 1))
+
+    def test01_invalidate(self):
+        cache = ResultCache()
+        cache.put(('arch', 'a', 'raw', '2017-01-01', '2017-01-02'), b'1')
+        cache.put(('arch', 'a', 'raw', '2017-01-02', '2017-01-03'), b'2')
+        cache.put(('arch', 'b', 'raw', '2017-01-02', '2017-01-03'), b'3')
+        self.assertEqual(cache.invalidate('a', since='2017-01-02T12'), 1)
+        self.assertEqual(cache.invalidate('b'), 1)
+        self.assertEqual(cache.stats().entries, 1)
+
+    def test02_live(self):
+        cache = ResultCache(horizon=datetime.timedelta(minutes=10))
+        now = datetime.datetime.now(_utc)
+        self.assertTrue(cache.is_live(now - datetime.timedelta(minutes=5)))
+        self.assertFalse(cache.is_live(now - datetime.timedelta(minutes=15)))
+
+    def test03_archiver(self):
+        data = {'TOPUPCC:rdCur': read_test_data('201710010200_rdCur.pb')}
+        t0 = datetime.datetime(2017, 10, 1, 2, tzinfo=_utc)
+        t1 = datetime.datetime(2017, 10, 1, 3, tzinfo=_utc)
+        with FakeAppliance(data=data) as appliance:
+            archiver = Archiver(config=appliance.config())
+            first = archiver.getData('TOPUPCC:rdCur', t0=t0, t1=t1)
+            second = archiver.getData('TOPUPCC:rdCur', t0=t0, t1=t1)
+            archiver.requestData('TOPUPCC:rdCur', t0=t0, t1=t1)
+            archiver.requestData('TOPUPCC:rdCur', t0=t0, t1=t1)
+            archiver.getData('TOPUPCC:rdCur', t0=t0, t1=t1, use_cache=False)
+            archiver.close()
+
+            self.assertEqual(len(appliance.requests), 3)
+        np.testing.assert_array_equal(first.values, second.values)
+        stats = archiver.result_cache.stats()
+        self.assertEqual((stats.hits, stats.misses, stats.entries), (2, 2, 2))
+
+    def test04_writeable_results(self):
+        data = {'TOPUPCC:rdCur': read_test_data('201710010200_rdCur.pb')}
+        t0 = datetime.datetime(2017, 10, 1, 2, tzinfo=_utc)
+        t1 = datetime.datetime(2017, 10, 1, 3, tzinfo=_utc)
+        with FakeAppliance(data=data) as appliance:
+            archiver = Archiver(config=appliance.config())
+            results = [archiver.getData('TOPUPCC:rdCur', t0=t0, t1=t1,
+                                        return_type='raw') for _ in range(3)]
+            archiver.close()
+            self.assertEqual(len(appliance.requests), 1)
+        first, hit, second_hit = results
+        ref = first[1].copy()
+        # first call (cache miss) and cache hit can be modified ...
+        for header, values, secs, nanos in (first, hit):
+            values *= 2
+            secs[:] = 0
+        # ... without changing the cached result
+        np.testing.assert_array_equal(second_hit[1], ref)
+
+    def test05_disabled(self):
+        with FakeAppliance() as appliance:
+            archiver = Archiver(config=appliance.config(result_cache_size='0'))
+        self.assertIsNone(archiver.result_cache)
+
+    def test06_naive_local_time(self):
+        # a host five hours behind UTC: naive times are local time
+        env = mock.patch.dict(os.environ, {'TZ': 'Etc/GMT+5'})
+        env.start()
+        self.addCleanup(time.tzset)
+        self.addCleanup(env.stop)
+        time.tzset()
+        cache = ResultCache(horizon=datetime.timedelta(minutes=10))
+        self.assertTrue(cache.is_live(datetime.datetime.now()))
+        self.assertFalse(cache.is_live(
+            datetime.datetime.now() - datetime.timedelta(minutes=15)))
+
+        now = datetime.datetime.now()
+        t0 = now - datetime.timedelta(hours=1)
+        data = {'TOPUPCC:rdCur': read_test_data('201710010200_rdCur.pb')}
+        with FakeAppliance(data=data) as appliance:
+            archiver = Archiver(config=appliance.config())
+            archiver.getData('TOPUPCC:rdCur', t0=t0, t1=now)
+            # requested as UTC: ending 5 hours ago
+            archiver.requestData('TOPUPCC:rdCur', t0=t0, t1=now)
+            archiver.close()
+        self.assertEqual(archiver.result_cache.stats().entries, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import bisect
+import datetime
+import unittest
+
+import numpy as np
+
+from bact_archiver import epics_event_pb2 as proto
+from bact_archiver.carchiver import Archiver, _split_window
+from common import make_pb
+from fake_appliance import FakeAppliance, ScalarSeries, _request_fmt
+
+_utc = datetime.timezone.utc
+
+
+class SplitWindowTest(unittest.TestCase):
+    """Long windows fetched in parallel sub windows
+    """
+
+    def setUp(self):
+        # a sample every 10 minutes over new year
+        start = datetime.datetime(2017, 12, 30, tzinfo=_utc).timestamp()
+        times = [start + 600 * i + 0.5 for i in range(6 * 24 * 4)]
+        self.series = ScalarSeries('TEST:ramp', times, np.arange(len(times)))
+        self.failures = 0
+        self.appliance = FakeAppliance(
+            data={'TEST:ramp': self.flaky, 'ncount(TEST:ramp)': self.ncount},
+            metadata={'TEST:ramp': {'elementCount': '1',
+                                    'DBRType': 'DBR_SCALAR_DOUBLE'}})
+        self.appliance.__enter__()
+
+    def tearDown(self):
+        self.appliance.__exit__(None, None, None)
+
+    def flaky(self, pvname, t0, t1):
+        # first request of the second sub window fails
+        if t0.startswith('2017-12-31T18') and self.failures == 0:
+            self.failures += 1
+            raise RuntimeError('temporary failure')
+        return self.series(pvname, t0, t1)
+
+    def ncount(self, pvname, t0, t1):
+        t0 = datetime.datetime.strptime(t0, _request_fmt).replace(tzinfo=_utc)
+        t1 = datetime.datetime.strptime(t1, _request_fmt).replace(tzinfo=_utc)
+        n = (bisect.bisect_right(self.series.times, t1.timestamp())
+             - bisect.bisect_left(self.series.times, t0.timestamp()))
+        header = proto.PayloadInfo(type=6, pvname=pvname, year=t0.year,
+                                   elementCount=1)
+        event = proto.ScalarDouble(secondsintoyear=0, nano=0, val=n)
+        return make_pb([(header, [event])])
+
+    def test00_split_window(self):
+        t0 = datetime.datetime(2017, 1, 1, 0, 0, 0, 300000, tzinfo=_utc)
+        t1 = datetime.datetime(2017, 1, 1, 0, 0, 10, tzinfo=_utc)
+        windows = _split_window(t0, t1, 3)
+        self.assertEqual(len(windows), 3)
+        self.assertEqual(windows[0][0], t0)
+        self.assertEqual(windows[-1][1], t1)
+        for (_, end), (start, _) in zip(windows[:-1], windows[1:]):
+            self.assertEqual(end, start)
+            self.assertEqual(start.microsecond, 0)
+
+    def test01_same_as_single_request(self):
+        archiver = Archiver(config=self.appliance.config())
+        t0 = datetime.datetime(2017, 12, 30, 5, 5, tzinfo=_utc)
+        t1 = datetime.datetime(2018, 1, 2, 7, 5, tzinfo=_utc)
+        ref = archiver.getData('TEST:ramp', t0=t0, t1=t1, use_cache=False,
+                               return_type='raw')
+        nrequests = len(self.appliance.requests)
+        # about 440 samples of 16 bytes: 4 sub windows
+        header, values, secs, nanos = archiver.getData(
+            'TEST:ramp', t0=t0, t1=t1, use_cache=False, return_type='raw',
+            max_bytes=2000)
+        archiver.close()
+
+        np.testing.assert_array_equal(values, ref[1])
+        np.testing.assert_array_equal(secs, ref[2])
+        np.testing.assert_array_equal(nanos, ref[3])
+        data_requests = [
+            query for path, query in self.appliance.requests[nrequests:]
+            if path.endswith('getData.raw') and query['pv'] == 'TEST:ramp'
+        ]
+        # one retry
+        self.assertEqual(self.failures, 1)
+        self.assertEqual(len(data_requests), 4 + 1)
+
+    def test02_small_not_split(self):
+        archiver = Archiver(config=self.appliance.config())
+        t0 = datetime.datetime(2018, 1, 1, 12, tzinfo=_utc)
+        t1 = datetime.datetime(2018, 1, 1, 13, tzinfo=_utc)
+        df = archiver.getData('TEST:ramp', t0=t0, t1=t1, max_bytes=1 << 20)
+        self.assertEqual(len(df), 7)
+
+    def test03_sample_at_t1(self):
+        # samples at whole seconds: one exactly at t1
+        start = datetime.datetime(2017, 12, 30, tzinfo=_utc).timestamp()
+        times = [start + 600 * i for i in range(6 * 24 * 4)]
+        self.series = ScalarSeries('TEST:ramp', times, np.arange(len(times)))
+        archiver = Archiver(config=self.appliance.config())
+        t0 = datetime.datetime(2017, 12, 30, 5, 5, tzinfo=_utc)
+        t1 = datetime.datetime(2018, 1, 2, 7, 0, tzinfo=_utc)
+        ref = archiver.getData('TEST:ramp', t0=t0, t1=t1, use_cache=False,
+                               return_type='raw')
+        header, values, secs, nanos = archiver.getData(
+            'TEST:ramp', t0=t0, t1=t1, use_cache=False, return_type='raw',
+            max_bytes=2000)
+        archiver.close()
+        self.assertEqual(ref[1][-1], (t1.timestamp() - start) // 600)
+        np.testing.assert_array_equal(values, ref[1])
+        np.testing.assert_array_equal(secs, ref[2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import datetime
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from bact_archiver import epics_event_pb2 as proto
+from bact_archiver.carchiver import Archiver
+from bact_archiver.stats import StatsAccumulator
+from common import make_pb
+from fake_appliance import FakeAppliance, ScalarSeries
+
+_utc = datetime.timezone.utc
+
+
+class StatsTest(unittest.TestCase):
+    """Statistics merged while the response is decoded
+    """
+
+    def setUp(self):
+        # a sample every 10 minutes over new year
+        self.t0 = datetime.datetime(2017, 12, 30, tzinfo=_utc)
+        self.t1 = datetime.datetime(2018, 1, 2, tzinfo=_utc)
+        start = self.t0.timestamp()
+        times = [start + 600 * i + 0.5 for i in range(6 * 24 * 3)]
+        rng = np.random.default_rng(7)
+        self.series = ScalarSeries('TEST:noise', times,
+                                   1e6 + rng.normal(size=len(times)))
+        self.appliance = FakeAppliance(data={'TEST:noise': self.series})
+        self.appliance.__enter__()
+        self.archiver = Archiver(config=self.appliance.config())
+
+    def tearDown(self):
+        self.archiver.close()
+        self.appliance.__exit__(None, None, None)
+
+    def reference(self, interval):
+        times = np.array(self.series.times)
+        df = pd.DataFrame({'val': self.series.values},
+                          index=(times - self.t0.timestamp()) // interval)
+        return df.groupby(level=0)['val'].agg(
+            ['count', 'mean', 'std', 'min', 'max'])
+
+    def test00_scalar(self):
+        # pieces of 50 samples: intervals are merged across pieces
+        stats = self.archiver.getStats('TEST:noise', t0=self.t0, t1=self.t1,
+                                       interval=datetime.timedelta(hours=7),
+                                       max_samples=50)
+        self.assertEqual(list(stats.columns),
+                         ['count', 'mean', 'std', 'min', 'max'])
+        # the window has 72 hours, the last interval holds the end
+        self.assertEqual(len(stats), 11)
+        self.assertEqual(stats.index[1] - stats.index[0], 7 * 3600)
+        ref = self.reference(7 * 3600)
+        np.testing.assert_array_equal(stats['count'], ref['count'])
+        for name in ('mean', 'std', 'min', 'max'):
+            np.testing.assert_allclose(stats[name], ref[name], rtol=1e-9)
+
+        stats = self.archiver.getStats('TEST:noise', t0=self.t0, t1=self.t1,
+                                       time_format='datetime')
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(stats['count'].iloc[0], len(self.series.times))
+        self.assertEqual(stats.index[0], self.t0)
+
+    def test01_waveform(self):
+        header = proto.PayloadInfo(type=13, pvname='TEST:wf', year=2017,
+                                   elementCount=3)
+        vals = [[1, 2, 3], [3, 4], [5, 6, 7], [7, 8, 9]]
+        events = [proto.VectorDouble(secondsintoyear=i, nano=0, val=v)
+                  for i, v in enumerate(vals)]
+        self.appliance.data['TEST:wf'] = make_pb([(header, events)])
+        t0 = datetime.datetime(2017, 1, 1, tzinfo=_utc)
+        stats = self.archiver.getStats('TEST:wf', t0=t0,
+                                       t1=t0 + datetime.timedelta(seconds=3),
+                                       interval=2)
+        self.assertEqual(stats.columns.names, ['stat', 'element'])
+        np.testing.assert_array_equal(stats['count'], [[2, 2, 1], [2, 2, 2]])
+        np.testing.assert_array_equal(stats['mean'], [[2, 3, 3], [6, 7, 8]])
+        np.testing.assert_array_equal(stats['min'], [[1, 2, 3], [5, 6, 7]])
+        # missing elements are NaN and not counted
+        self.assertTrue(np.isnan(stats['std'][2].iloc[0]))
+
+    def test02_empty_intervals(self):
+        acc = StatsAccumulator(0, 99, interval=1e-8)
+        acc.add(np.array([1, 2], dtype=np.int16), np.array([-5, 45]))
+        stats = acc.result()
+        self.assertEqual(len(stats), 10)
+        np.testing.assert_array_equal(stats['count'],
+                                      [0, 0, 0, 0, 1, 0, 0, 0, 0, 0])
+        self.assertEqual(stats['mean'].iloc[4], 2)
+        self.assertTrue(np.isnan(stats['std'].iloc[4]))
+        self.assertTrue(np.isnan(stats['max'].iloc[0]))
+        with self.assertRaises(ValueError):
+            acc.add(np.array([b'a']), np.array([1]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+import datetime
+import io
+import os
+import unittest
+
+import numpy as np
+
+from bact_archiver.carchiver import (Archiver, get_data_from_archiver,
+                                     get_data_from_stream, iter_data_from_stream)
+from bact_archiver.epics_event import decode
+from common import escape, test_data_dir
+from fake_appliance import FakeAppliance, ScalarSeries
+
+_utc = datetime.timezone.utc
+
+# the two broken input files are decoded as far as possible
+test_files = [
+    '201710010200_rdCur.pb',
+    '20171101_MBcurrent.pb',
+    '20171101_numShots.pb',
+    '20171101_selTrgSR.pb',
+    '20171101_sram_maxrms.pb',
+    '20171101_sram_mean.pb',
+    '20171101_stGun.pb',
+]
+
+
+class StreamDecoderTest(unittest.TestCase):
+    """Decoding block by block gives the same result as decoding at once
+    """
+
+    def read(self, fname):
+        with open(os.path.join(test_data_dir, fname), 'rb') as f:
+            return f.read()
+
+    def compare(self, data, block_size):
+        ref_res, ref_years, ref_header = get_data_from_archiver(data)
+        res, years, header = get_data_from_stream(io.BytesIO(data),
+                                                  block_size=block_size)
+        self.assertEqual(header, ref_header)
+        self.assertEqual(len(res), len(ref_res))
+        np.testing.assert_array_equal(years, ref_years)
+        for chunk, ref_chunk in zip(res, ref_res):
+            for arr, ref in zip(chunk, ref_chunk):
+                np.testing.assert_array_equal(arr, ref)
+
+    def test00_block_sizes(self):
+        for fname in test_files:
+            data = self.read(fname)
+            for block_size in (13, 997, 65536, len(data) + 1):
+                with self.subTest(fname=fname, block_size=block_size):
+                    self.compare(data, block_size)
+
+    def test01_several_chunks(self):
+        # chunk boundaries falling on block edges
+        one = self.read('201710010200_rdCur.pb')
+        data = one + b'\n' + one + b'\n' + one
+        res, years, header = get_data_from_archiver(data)
+        self.assertEqual([len(r[0]) for r in res], [56, 56, 56])
+        for block_size in (1, 2, 3, len(one), len(one) + 1):
+            with self.subTest(block_size=block_size):
+                self.compare(data, block_size)
+
+    def test02_no_trailing_newline(self):
+        data = self.read('20171101_numShots.pb')
+        res, years, header = get_data_from_stream(io.BytesIO(data[:-1]),
+                                                  block_size=100)
+        self.assertEqual(len(res[0][0]), 29)
+
+    def test03_pieces(self):
+        data = self.read('20171101_sram_mean.pb')
+        pieces = list(iter_data_from_stream(io.BytesIO(data), block_size=4096,
+                                            max_samples=50))
+        self.assertGreater(len(pieces), 1)
+        for header, values, secs, nanos in pieces:
+            self.assertEqual(values.shape[1], 400)
+            self.assertEqual(len(values), len(secs))
+        res, years, header = get_data_from_archiver(data)
+        np.testing.assert_array_equal(np.concatenate([p[1] for p in pieces]),
+                                      res[0][0])
+
+    def test04_times(self):
+        # samples over new year in two chunks
+        start = datetime.datetime(2017, 12, 31, 23, tzinfo=_utc).timestamp()
+        times = [start + 600 * i + 0.25 for i in range(12)]
+        series = ScalarSeries('TEST:ramp', times, range(12))
+        data = series('TEST:ramp', '2017-12-31T23:00:00.000000Z',
+                      '2018-01-01T01:00:00.000000Z')
+        res, t, header = get_data_from_archiver(data)
+        self.assertEqual(len(res), 2)
+        self.assertEqual(t.dtype, np.int64)
+        expected = [int(start + 600 * i) * 10**9 + 250000000 for i in range(12)]
+        np.testing.assert_array_equal(t, expected)
+
+        chunks = list(iter_data_from_stream(io.BytesIO(data), block_size=50,
+                                            with_times=True))
+        header, values, secs, nanos, t = chunks[-1]
+        self.assertEqual(header.year, 2018)
+        year_start = datetime.datetime(2018, 1, 1, tzinfo=_utc).timestamp()
+        np.testing.assert_array_equal(
+            t, (int(year_start) + secs.astype(np.int64)) * 10**9 + nanos)
+
+    def test05_iter_data(self):
+        one = self.read('201710010200_rdCur.pb')
+        data = {'TOPUPCC:rdCur': one + b'\n' + one}
+        t0 = datetime.datetime(2017, 10, 1, 2, tzinfo=_utc)
+        t1 = datetime.datetime(2017, 10, 1, 3, tzinfo=_utc)
+        with FakeAppliance(data=data) as appliance:
+            archiver = Archiver(config=appliance.config())
+            chunks = list(archiver.iterData('TOPUPCC:rdCur', t0=t0, t1=t1))
+            archiver.close()
+        self.assertEqual(len(chunks), 2)
+        header, values, secs, nanos = chunks[0]
+        self.assertEqual(header.pvname, 'TOPUPCC:rdCur')
+        self.assertEqual(len(values), 56)
+
+
+    def test06_unescape(self):
+        rng = np.random.default_rng(42)
+        samples = [b'', b'plain', b'\x1b\n\r', b'a\x1b\x1b\nb\r',
+                   rng.integers(0, 256, 10000, dtype=np.uint8).tobytes()]
+        for raw in samples:
+            with self.subTest(raw=raw[:10]):
+                line = memoryview(escape(raw)).cast('c')
+                self.assertEqual(decode(line), raw)
+
+
+if __name__ == "__main__":
+    unittest.main()
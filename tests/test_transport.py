@@ -0,0 +1,91 @@
+import datetime
+import os
+import tempfile
+import unittest
+from unittest import mock
+from urllib.error import HTTPError
+
+from bact_archiver.carchiver import Archiver
+from bact_archiver.transport import (HTTPTransport, UrllibTransport,
+                                     create_transport)
+from fake_appliance import FakeAppliance, read_test_data
+
+_utc = datetime.timezone.utc
+
+
+class TransportTest(unittest.TestCase):
+    """Requests are routed through the transport of the archiver
+    """
+
+    def setUp(self):
+        # no proxies of the environment running the tests
+        env = mock.patch.dict(os.environ, {'no_proxy': '*'})
+        env.start()
+        self.addCleanup(env.stop)
+        self.appliance = FakeAppliance(
+            data={'TOPUPCC:rdCur': read_test_data('201710010200_rdCur.pb')})
+        self.appliance.__enter__()
+
+    def tearDown(self):
+        self.appliance.__exit__(None, None, None)
+
+    def test00_default_is_pooled(self):
+        archiver = Archiver(config=self.appliance.config(pool_size='2',
+                                                        timeout='5'))
+        self.assertIsInstance(archiver.transport, HTTPTransport)
+        self.assertEqual(archiver.transport.pool_size, 2)
+        self.assertEqual(archiver.transport.timeout, 5.0)
+
+    def test01_connection_reused(self):
+        archiver = Archiver(config=self.appliance.config())
+        t0 = datetime.datetime(2017, 10, 1, 2, tzinfo=_utc)
+        t1 = datetime.datetime(2017, 10, 1, 3, tzinfo=_utc)
+        for _ in range(5):
+            df = archiver.getData('TOPUPCC:rdCur', t0=t0, t1=t1,
+                                  use_cache=False)
+            self.assertEqual(len(df), 56)
+        archiver.getMatchingPVs()
+        archiver.close()
+
+        self.assertEqual(len(self.appliance.requests), 6)
+        self.assertEqual(len(self.appliance.connections), 1)
+
+    def test02_urllib_transport(self):
+        archiver = Archiver(config=self.appliance.config(transport='urllib'))
+        self.assertIsInstance(archiver.transport, UrllibTransport)
+        self.assertEqual(archiver.getMatchingPVs(), ['TOPUPCC:rdCur'])
+
+    def test03_http_error(self):
+        archiver = Archiver(config=self.appliance.config())
+        with self.assertRaises(HTTPError):
+            archiver.requestData('unknown', t0=datetime.datetime(2017, 1, 1),
+                                 t1=datetime.datetime(2017, 1, 2))
+        # connection still usable after the error
+        self.assertEqual(archiver.getMatchingPVs(), ['TOPUPCC:rdCur'])
+        self.assertEqual(len(self.appliance.connections), 1)
+
+    def test04_save_raw(self):
+        archiver = Archiver(config=self.appliance.config())
+        with tempfile.TemporaryDirectory() as dirname:
+            fname = os.path.join(dirname, 'test.pb')
+            archiver.saveBPRaw('TOPUPCC:rdCur', t0='a', t1='b', fname=fname)
+            with open(fname, 'rb') as f:
+                data = f.read()
+        self.assertEqual(data, read_test_data('201710010200_rdCur.pb'))
+
+    def test05_proxy(self):
+        config = self.appliance.config()
+        proxy = {'http_proxy': 'http://proxy.example:3128', 'no_proxy': ''}
+        with mock.patch.dict(os.environ, proxy):
+            self.assertIsInstance(create_transport(config), UrllibTransport)
+        proxy['no_proxy'] = '127.0.0.1'
+        with mock.patch.dict(os.environ, proxy):
+            self.assertIsInstance(create_transport(config), HTTPTransport)
+        proxy = {'https_proxy': 'http://proxy.example:3128', 'no_proxy': ''}
+        with mock.patch.dict(os.environ, proxy):
+            # only for https
+            self.assertIsInstance(create_transport(config), HTTPTransport)
+
+
+if __name__ == "__main__":
+    unittest.main()
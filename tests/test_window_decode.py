@@ -0,0 +1,95 @@
+import datetime
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from bact_archiver import carchiver, epics_event_pb2 as proto
+from bact_archiver.carchiver import _split_payload, get_data
+from bact_archiver.epics_event import (line_ends, read_chunk, sample_time,
+                                       window_lines)
+from common import make_pb
+from fake_appliance import ScalarSeries
+
+_utc = datetime.timezone.utc
+_request_fmt = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+
+class WindowDecodeTest(unittest.TestCase):
+    """Only the samples of the requested window are decoded
+    """
+
+    def setUp(self):
+        # a sample every 37 minutes over new year
+        start = datetime.datetime(2017, 12, 20, tzinfo=_utc).timestamp()
+        self.times = np.array([start + 2220 * i + 0.5 for i in range(1500)])
+        series = ScalarSeries('TEST:ramp', self.times, range(len(self.times)))
+        t0 = datetime.datetime(2017, 12, 1, tzinfo=_utc)
+        t1 = datetime.datetime(2018, 2, 1, tzinfo=_utc)
+        self.data = series('TEST:ramp', t0.strftime(_request_fmt),
+                           t1.strftime(_request_fmt))
+
+    def test00_sample_time(self):
+        # waveform: the time fields are read without the values
+        header = proto.PayloadInfo(type=13, pvname='TEST:wf', year=2017,
+                                   elementCount=3)
+        events = [proto.VectorDouble(secondsintoyear=10 * i, nano=i * 2**20,
+                                     val=[0.5, float(i), 2.0])
+                  for i in range(40)]
+        (header, seq), = _split_payload(make_pb([(header, events)]))
+        ends = line_ends(seq)
+        times = read_chunk(seq, header, with_times=True)[3]
+        for i in range(len(ends)):
+            start = ends[i - 1] + 1 if i else 0
+            self.assertEqual(sample_time(seq[start:ends[i]], header), times[i])
+        self.assertEqual(window_lines(seq, header, ends, times[5], times[9]),
+                         (4, 10))
+        self.assertEqual(window_lines(seq, header, ends, times[5] + 1, None),
+                         (5, 40))
+        self.assertEqual(window_lines(seq, header, ends, None, times[0] - 1),
+                         (0, 0))
+        with self.assertRaises(ValueError):
+            sample_time(seq[:3], header)
+
+    def test01_get_data_window(self):
+        t0 = datetime.datetime(2017, 12, 30, 7, tzinfo=_utc)
+        t1 = datetime.datetime(2018, 1, 3, 2, 10, tzinfo=_utc)
+        with mock.patch.object(carchiver, 'fill_rows',
+                               wraps=carchiver.fill_rows) as fill:
+            df = get_data(self.data, t_start=t0, t_stop=t1)
+        decoded = sum(len(call.args[2]) for call in fill.call_args_list)
+        # the window and the sample before it
+        i0 = np.searchsorted(self.times, t0.timestamp()) - 1
+        i1 = np.searchsorted(self.times, t1.timestamp(), side='right')
+        np.testing.assert_allclose(df.index.values, self.times[i0:i1])
+        np.testing.assert_array_equal(df[0].values, np.arange(i0, i1))
+        self.assertEqual(decoded, i1 - i0)
+        self.assertLess(decoded, len(self.times) // 10)
+
+    def test02_padding(self):
+        t0 = datetime.datetime(2017, 12, 30, 7, tzinfo=_utc)
+        t1 = datetime.datetime(2018, 1, 3, 2, 10, tzinfo=_utc)
+        df = get_data(self.data, time_format='datetime', padding=True,
+                      t_start=t0, t_stop=t1)
+        self.assertEqual(df.index[0], t0)
+        self.assertEqual(df.index[-1], t1)
+        self.assertEqual(df['val'].iloc[-1], df['val'].iloc[-2])
+        i0 = np.searchsorted(self.times, t0.timestamp()) - 1
+        self.assertEqual(df['val'].iloc[0], i0)
+
+    def test03_window_in_later_chunk(self):
+        # the chunk of 2017 lies completely before the window: only the
+        # last sample before t0 is kept
+        for t0 in (datetime.datetime(2018, 1, 4, tzinfo=_utc),
+                   datetime.datetime.fromtimestamp(self.times[700], _utc)):
+            with self.subTest(t0=t0):
+                df = get_data(self.data, t_start=t0)
+                i0 = np.searchsorted(self.times, t0.timestamp()) - 1
+                np.testing.assert_allclose(df.index.values, self.times[i0:])
+        df = get_data(self.data,
+                      t_start=datetime.datetime(2019, 1, 1, tzinfo=_utc))
+        np.testing.assert_allclose(df.index.values, self.times[-1:])
+
+
+if __name__ == "__main__":
+    unittest.main()